@@ -0,0 +1,290 @@
+"""
+Replay a corpus of utterances through Listen and the guild player with every
+external service swapped for a local stand-in, and report throughput,
+latency per stage and CPU/RSS.
+
+    python -m bench.replay --save-baseline bench/baseline.json
+    python -m bench.replay --compare bench/baseline.json
+
+The corpus is a directory of 16kHz mono WAV files, with an optional `.txt`
+transcript next to each one for the stand-in ASR. Without `--corpus` the
+tool picker prompts in fine_tune_data/ are replayed as text.
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import sys
+import time
+import wave
+
+import numpy as np
+
+from bench.stubs import (BenchGuildPlayer, FakeBot, FakeVoiceClient, Latency,
+                         StubASR, StubGiphy, StubResponseAuthor,
+                         StubToolPicker, StubTTS, StubWolfram,
+                         StubYouTubeClient, load_tool_picker_answers,
+                         stand_in_audio)
+from src.tts.backends import TTS_BACKENDS
+from src.utils.blocking import BlockingCallRunner
+from src.utils.tracing import TracedAudio, tracer
+from src.voice.asr import create_asr_backend
+from src.voice.listen import Listen
+
+# Spans compared against the baseline
+COMPARED_SPANS = ("voice_to_audio", "asr", "tool_pick", "tts")
+
+
+class Utterance():
+    def __init__(self, name, audio: bytes, transcript=None):
+        self.name = name
+        self.audio = audio
+        self.transcript = transcript
+
+    @property
+    def seconds(self):
+        return len(self.audio) / 2 / 16000
+
+
+def load_wav_corpus(corpus_dir) -> list:
+    utterances = []
+    for name in sorted(os.listdir(corpus_dir)):
+        if not name.endswith(".wav"):
+            continue
+
+        path = os.path.join(corpus_dir, name)
+        with wave.open(path, "rb") as wf:
+            if wf.getframerate() != 16000 or wf.getnchannels() != 1 or wf.getsampwidth() != 2:
+                print(f"Skipping {name}, expected 16kHz mono 16-bit audio")
+                continue
+            audio = wf.readframes(wf.getnframes())
+
+        transcript = None
+        transcript_path = path[:-4] + ".txt"
+        if os.path.exists(transcript_path):
+            with open(transcript_path) as f:
+                transcript = f.read().strip()
+
+        utterances.append(Utterance(name, audio, transcript))
+
+    return utterances
+
+
+def load_text_corpus(answers: dict, limit=None) -> list:
+    utterances = []
+    for i, text in enumerate(answers):
+        if limit is not None and i >= limit:
+            break
+        line = f"hey billy {text}"
+        utterances.append(Utterance(f"prompt-{i}", stand_in_audio(line), line))
+
+    return utterances
+
+
+def parse_latencies(pairs) -> dict:
+    latencies = {}
+    for pair in pairs or []:
+        name, seconds = pair.split("=")
+        latencies[name] = float(seconds)
+
+    return latencies
+
+
+def percentile(values, q):
+    if not values:
+        return None
+
+    return round(float(np.percentile(values, q)) * 1000, 1)
+
+
+class ReplayRun():
+    def __init__(self, args):
+        self.args = args
+        self.latency = Latency(parse_latencies(
+            args.latency), jitter=args.jitter, seed=args.seed)
+        self.durations = {}
+        tracer.listeners.append(self._on_span)
+
+    def _on_span(self, name, duration, trace_id):
+        self.durations.setdefault(name, []).append(duration)
+
+    def _corpus(self) -> list:
+        answers = load_tool_picker_answers()
+        if self.args.corpus:
+            return load_wav_corpus(self.args.corpus), answers
+
+        return load_text_corpus(answers, self.args.limit), answers
+
+    def _asr_backend(self, utterances):
+        if self.args.asr == "stub":
+            transcripts = [u.transcript or "" for u in utterances]
+            return StubASR(self.latency, transcripts)
+
+        return create_asr_backend(self.args.asr, model=self.args.asr_model)
+
+    async def _idle(self, listener, player):
+        return (listener.data_queue.empty()
+                and not listener.command_tasks
+                and listener.action_queue.empty()
+                and player.queue.empty()
+                and player.scheduler.audible_queue.empty()
+                and player.scheduler.post_queue.empty()
+                # music keeps playing, but nothing waits on it
+                and player.mixer.speech is None
+                and not player.mixer.effects)
+
+    async def _drain(self, listener, player, timeout=120):
+        deadline = time.monotonic() + timeout
+        quiet_checks = 0
+        # a few idle checks in a row, work hops between queues
+        while quiet_checks < 5 and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+            quiet_checks = quiet_checks + 1 if await self._idle(listener, player) else 0
+
+    async def run(self) -> dict:
+        utterances, answers = self._corpus()
+        if not utterances:
+            raise SystemExit("The corpus is empty.")
+
+        loop = asyncio.get_running_loop()
+        runner = BlockingCallRunner(max_workers=8)
+
+        StubTTS.latency = self.latency
+        TTS_BACKENDS["stub"] = StubTTS
+
+        bot = FakeBot(loop, runner, self.latency)
+        player = BenchGuildPlayer(bot, self.latency)
+        player.vc = FakeVoiceClient(self.args.speed)
+        player.start()
+
+        asr_backend = self._asr_backend(utterances)
+        asr_backend.load()
+
+        listener = Listen(
+            StubToolPicker(self.latency, answers),
+            StubResponseAuthor(self.latency),
+            StubWolfram(self.latency),
+            StubYouTubeClient(self.latency),
+            StubGiphy(self.latency),
+            asr_backend, runner,
+            stream_responses=self.args.stream_responses)
+        listener.action_queue = player.queue
+
+        cpu_before = resource.getrusage(resource.RUSAGE_SELF)
+        started_at = time.perf_counter()
+        processor = asyncio.create_task(listener.process_audio_queue(3))
+
+        for utterance in utterances:
+            audio = TracedAudio(utterance.audio)
+            audio.trace_id = tracer.start_trace()
+            listener.data_queue.put_nowait(audio)
+            if self.args.speed:
+                # the next utterance can't arrive before this one is spoken
+                await asyncio.sleep(utterance.seconds / self.args.speed)
+
+        await self._drain(listener, player)
+        elapsed = time.perf_counter() - started_at
+        cpu_after = resource.getrusage(resource.RUSAGE_SELF)
+
+        listener.stop()
+        processor.cancel()
+        player.mixer.stop()
+        runner.shutdown()
+
+        cpu_seconds = (cpu_after.ru_utime - cpu_before.ru_utime) + \
+            (cpu_after.ru_stime - cpu_before.ru_stime)
+        audio_seconds = sum(u.seconds for u in utterances)
+
+        return {
+            "utterances": len(utterances),
+            "audio_seconds": round(audio_seconds, 1),
+            "wall_seconds": round(elapsed, 2),
+            "throughput_per_second": round(len(utterances) / elapsed, 3),
+            "cpu_seconds": round(cpu_seconds, 2),
+            "cpu_percent": round(100 * cpu_seconds / elapsed, 1),
+            # kilobytes on Linux, bytes on macOS
+            "max_rss": cpu_after.ru_maxrss,
+            "spans": {
+                name: {
+                    "count": len(values),
+                    "p50_ms": percentile(values, 50),
+                    "p90_ms": percentile(values, 90),
+                    "p99_ms": percentile(values, 99),
+                }
+                for name, values in sorted(self.durations.items())
+            },
+        }
+
+
+def compare(report, baseline, tolerance) -> list:
+    """
+    :return: Descriptions of every metric that regressed by more than
+        `tolerance` (a fraction) against the baseline.
+    """
+    regressions = []
+
+    old, new = baseline["throughput_per_second"], report["throughput_per_second"]
+    if new < old * (1 - tolerance):
+        regressions.append(f"throughput {old} -> {new} per second")
+
+    for name in COMPARED_SPANS:
+        old_span = baseline["spans"].get(name)
+        new_span = report["spans"].get(name)
+        if old_span is None or new_span is None:
+            continue
+
+        for key in ("p50_ms", "p99_ms"):
+            old, new = old_span[key], new_span[key]
+            if old and new > old * (1 + tolerance):
+                regressions.append(f"{name} {key} {old} -> {new}")
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--corpus", help="Directory of 16kHz mono WAV files")
+    parser.add_argument("--limit", type=int, default=40,
+                        help="Prompts to replay without a corpus")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="1 is real time, 4 is four times faster, 0 is as fast as possible")
+    parser.add_argument("--asr", default="stub",
+                        help="stub, whisper or faster_whisper")
+    parser.add_argument("--asr-model", default="tiny")
+    parser.add_argument("--latency", action="append", metavar="NAME=SECONDS",
+                        help="Override a stand-in's latency, e.g. tool_picker=0.2")
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--stream-responses", action="store_true")
+    parser.add_argument("--save-baseline", metavar="PATH")
+    parser.add_argument("--compare", metavar="PATH",
+                        help="Fail if this run is slower than a saved baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Allowed slowdown against the baseline, as a fraction")
+    args = parser.parse_args()
+
+    report = asyncio.run(ReplayRun(args).run())
+    print(json.dumps(report, indent=2))
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved baseline to {args.save_baseline}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print("Regressions against the baseline:")
+            for regression in regressions:
+                print(f"- {regression}")
+            sys.exit(1)
+
+        print("No regressions against the baseline.")
+
+
+if __name__ == "__main__":
+    main()
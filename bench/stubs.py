@@ -0,0 +1,311 @@
+import asyncio
+import collections
+import io
+import json
+import random
+import threading
+import time
+
+import discord
+import numpy as np
+
+from src.actions.youtube.client import YouTubeClient
+from src.ai.response_author import SENTENCE_END, ResponseAuthor
+from src.ai.tool_picker import ToolPicker
+from src.bot.guild_player import GuildPlayer
+from src.tts.base import DISCORD_CHANNELS, DISCORD_SAMPLE_RATE, SpeechAudio, TTSBackend
+from src.utils.tracing import tracer
+from src.voice.asr import ASRBackend
+from src.voice.wake_words import normalize_utterance
+
+# Seconds each stand-in takes by default, roughly what the real services do
+DEFAULT_LATENCIES = {
+    "tool_picker": 0.5,
+    "response_author": 0.7,
+    "wolfram": 0.8,
+    "youtube": 0.3,
+    "giphy": 0.3,
+    "tts": 0.4,
+    "yt_dlp": 1.0,
+    "discord_post": 0.1,
+    # seconds of decoding per second of audio
+    "asr_rtf": 0.1,
+}
+
+# Seconds of speech per word, for stand-in audio
+SECONDS_PER_WORD = 0.3
+
+
+class Latency():
+    """
+    Sleeps for a configurable, slightly jittered time. Seeded so runs are
+    comparable.
+    """
+
+    def __init__(self, latencies=None, jitter=0.2, seed=0):
+        self.latencies = dict(DEFAULT_LATENCIES, **(latencies or {}))
+        self.jitter = jitter
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def seconds(self, name, scale=1.0):
+        with self.lock:
+            factor = self.random.uniform(1 - self.jitter, 1 + self.jitter)
+
+        return self.latencies[name] * scale * factor
+
+    def wait(self, name, scale=1.0):
+        time.sleep(self.seconds(name, scale))
+
+
+def silence_pcm(seconds) -> bytes:
+    """
+    Discord-format (48kHz stereo int16) silence.
+    """
+    return bytes(int(seconds * DISCORD_SAMPLE_RATE) * DISCORD_CHANNELS * 2)
+
+
+def load_tool_picker_answers(path="fine_tune_data/tool_picker.openai.jsonl") -> dict:
+    """
+    :return: {normalized utterance: the fine-tuned tool picker's JSON answer}
+    """
+    answers = {}
+    with open(path) as f:
+        for line in f:
+            messages = json.loads(line)["messages"]
+            user = next(m["content"] for m in messages if m["role"] == "user")
+            assistant = next(m["content"]
+                             for m in messages if m["role"] == "assistant")
+            answers[normalize_utterance(user)] = assistant
+
+    return answers
+
+
+class StubToolPicker(ToolPicker):
+    """
+    Answers from the fine-tuning data instead of calling OpenAI.
+    """
+
+    def __init__(self, latency: Latency, answers: dict):
+        super().__init__(None, "stub")
+        self.latency = latency
+        self.answers = answers
+
+    def _answer(self, query):
+        return self.answers.get(normalize_utterance(query), '{"tool": "no_tool"}')
+
+    def determine_tools_and_query(self, query):
+        self.latency.wait("tool_picker")
+        return self._parse(self._answer(query))
+
+    def determine_tools_and_reply(self, query, model_id=None):
+        self.latency.wait("tool_picker", 1.5)
+        data = self._parse(self._answer(query))
+        data["reply"] = "That's a great question. I have no idea."
+        return data, 200
+
+
+class StubResponseAuthor(ResponseAuthor):
+    REPLY = "Sure thing. Coming right up, gamer."
+
+    def __init__(self, latency: Latency):
+        super().__init__(None, "stub")
+        self.latency = latency
+
+    def write_response_with_usage(self, message, added_info=None):
+        self.latency.wait("response_author")
+        return self.REPLY, 150
+
+    def stream_response(self, message, added_info=None):
+        sentences = SENTENCE_END.split(self.REPLY)
+        for sentence in sentences:
+            # the first sentence pays most of the round trip
+            self.latency.wait("response_author", 1 / len(sentences))
+            yield sentence
+
+
+class StubYouTubeClient(YouTubeClient):
+    def __init__(self, latency: Latency):
+        self.cache = None
+        self.latency = latency
+
+    def search_video_ids(self, query) -> list:
+        self.latency.wait("youtube")
+        return [f"stub{i:07d}" for i in range(10)]
+
+
+class StubWolfram():
+    def __init__(self, latency: Latency):
+        self.latency = latency
+
+    def process(self, query):
+        self.latency.wait("wolfram")
+        return "42"
+
+
+class StubGiphy():
+    def __init__(self, latency: Latency):
+        self.latency = latency
+
+    def search(self, query):
+        self.latency.wait("giphy")
+        return "https://media.giphy.com/media/stub/giphy.gif"
+
+
+class StubTTS(TTSBackend):
+    """
+    Returns silence as long as the text would take to say.
+    """
+    latency = None
+
+    def synthesize(self, text) -> SpeechAudio:
+        self.latency.wait("tts")
+        seconds = len(text.split()) * SECONDS_PER_WORD
+        return SpeechAudio(pcm=silence_pcm(seconds))
+
+
+class StubASR(ASRBackend):
+    """
+    Hands back the corpus transcripts in order, taking `asr_rtf` seconds per
+    second of audio. Only valid when every queued chunk reaches ASR, i.e.
+    without a wake spotter.
+    """
+
+    def __init__(self, latency: Latency, transcripts):
+        super().__init__()
+        self.latency = latency
+        self.transcripts = collections.deque(transcripts)
+
+    def load(self):
+        pass
+
+    def transcribe(self, audio_np, initial_prompt=None) -> dict:
+        self.latency.wait("asr_rtf", len(audio_np) / 16000)
+        text = self.transcripts.popleft() if self.transcripts else ""
+        return {"text": text, "segments": []}
+
+
+class FakeVoiceClient():
+    """
+    Plays sources the way discord.py's AudioPlayer does, 20ms frames on a
+    thread, minus Opus and the network.
+    """
+
+    def __init__(self, speed=1.0):
+        self.speed = speed
+        self.source = None
+        self.thread = None
+        self.resumed = threading.Event()
+        self.ended = threading.Event()
+        self.frames = 0
+
+    def is_connected(self):
+        return True
+
+    def is_playing(self):
+        return self.thread is not None and self.resumed.is_set() and not self.ended.is_set()
+
+    def is_paused(self):
+        return self.thread is not None and not self.resumed.is_set() and not self.ended.is_set()
+
+    def play(self, source, after=None):
+        self.source = source
+        self.resumed.set()
+        self.ended.clear()
+        self.thread = threading.Thread(
+            target=self._run, args=(after,), daemon=True)
+        self.thread.start()
+
+    def _run(self, after):
+        frame_time = 0.02 / self.speed if self.speed else 0
+        next_at = time.perf_counter()
+        while not self.ended.is_set():
+            if not self.resumed.is_set():
+                self.resumed.wait(0.1)
+                next_at = time.perf_counter()
+                continue
+
+            if not self.source.read():
+                break
+
+            self.frames += 1
+            next_at += frame_time
+            time.sleep(max(0, next_at - time.perf_counter()))
+
+        self.ended.set()
+        if after is not None:
+            after(None)
+
+    def pause(self):
+        self.resumed.clear()
+
+    def resume(self):
+        self.resumed.set()
+
+    def stop(self):
+        self.ended.set()
+
+    async def disconnect(self):
+        self.stop()
+
+
+class FakeChannel():
+    def __init__(self, latency: Latency):
+        self.latency = latency
+        self.messages = 0
+
+    async def send(self, message, files=None):
+        await asyncio.sleep(self.latency.seconds("discord_post"))
+        self.messages += 1
+
+
+class FakeBot():
+    """
+    Just enough of BillyBot for a GuildPlayer.
+    """
+
+    def __init__(self, loop, runner, latency: Latency):
+        self.loop = loop
+        self.runner = runner
+        self.tts_backend = "stub"
+        self.tts_cache = None
+        self.tts_options = {}
+        self.youtube_cache = None
+        self.sfx_library = None
+        self.channel = FakeChannel(latency)
+
+    def get_channel(self, channel_id):
+        return self.channel
+
+
+class BenchGuildPlayer(GuildPlayer):
+    """
+    A GuildPlayer whose YouTube and sound effect sources are silence after a
+    yt-dlp sized delay, instead of real yt-dlp and ffmpeg processes.
+    """
+
+    def __init__(self, bot, latency: Latency, **kwargs):
+        super().__init__(bot, guild_id=0, text_channel_id=0, **kwargs)
+        self.latency = latency
+
+    async def prepare_audible(self, item):
+        if item["type"] not in ("youtube", "sound_effect"):
+            return await super().prepare_audible(item)
+
+        with tracer.span("yt_dlp", item.get("trace_id")):
+            await asyncio.sleep(self.latency.seconds("yt_dlp"))
+
+        seconds = 5 if item["type"] == "sound_effect" else 30
+        return discord.PCMVolumeTransformer(
+            discord.PCMAudio(io.BytesIO(silence_pcm(seconds))), volume=0.5)
+
+
+def stand_in_audio(text, sample_rate=16000) -> bytes:
+    """
+    Low level noise as long as `text` would take to say, for text-only
+    corpora.
+    """
+    seconds = max(1.0, len(text.split()) * SECONDS_PER_WORD)
+    rng = np.random.default_rng(len(text))
+    samples = rng.normal(0, 300, int(seconds * sample_rate))
+    return samples.astype(np.int16).tobytes()
@@ -6,35 +6,136 @@ from dotenv import load_dotenv
 from openai import OpenAI
 
 from src.actions.images.giphy import Giphy
+from src.actions.wolfram.cache import WolframCache, parse_ttls
 from src.actions.wolfram.simple_answer import WolframAnswer
+from src.actions.youtube.cache import YouTubeCache
 from src.actions.youtube.client import YouTubeClient
+from src.ai.intent_router import IntentRouter
 from src.ai.response_author import ResponseAuthor
+from src.ai.response_speculation import ResponseSpeculator
 from src.ai.tool_picker import ToolPicker
+from src.ai.utterance_cache import UtteranceCache
+from src.bot.audio_source import YTDLSource
 from src.bot.discord import BillyBot
+from src.bot.sfx_library import DEFAULT_OPUS_LIBRARY, SoundEffectLibrary
+from src.tts.cache import TTSCache
+from src.utils.blocking import BlockingCallRunner
+from src.utils.http import configure_shared_transport
+from src.utils.startup import startup
+from src.utils.tracing import tracer
+from src.voice.asr import VOCABULARY_PROMPT, create_asr_backend
+from src.voice.asr_batcher import ASRBatcher
+from src.voice.discord_receive import DiscordVoiceReceiver
+from src.voice.guild_listeners import GuildListeners
 from src.voice.listen import Listen
+from src.voice.speculation import SpeculativePrefetcher
+from src.voice.wake_spotter import create_wake_spotter
+from src.voice.wake_words import WAKE_WORDS, WakeMatcher, parse_guild_wake_words
 
 load_dotenv()
 
 DISCORD_BOT_TOKEN = os.getenv("DISCORD_BOT_TOKEN")
 DISCORD_CHANNEL_ID = int(os.getenv("DISCORD_CHANNEL_ID"))
+DISCORD_GUILD_ID = int(os.getenv("DISCORD_GUILD_ID", "0")) or None
+DISCORD_SHARD_COUNT = int(os.getenv("DISCORD_SHARD_COUNT", "0")) or None
+DISCORD_SHARD_IDS = [int(shard_id) for shard_id in os.getenv(
+    "DISCORD_SHARD_IDS", "").split(",") if shard_id.strip()] or None
 TOOL_PICKER_MODEL_ID = os.getenv("TOOL_PICKER_MODEL_ID")
 RESPONSE_AUTHOR_MODEL_ID = os.getenv("RESPONSE_AUTHOR_MODEL_ID")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 WOLFRAM_APP_ID = os.getenv("WOLFRAM_APP_ID")
 GIPHY_API_KEY = os.getenv("GIPHY_API_KEY")
+CACHE_DIR = os.getenv("CACHE_DIR", "cache")
+WAKE_SPOTTER = os.getenv("WAKE_SPOTTER", "off")
+WAKE_WORD_SAMPLES_DIR = os.getenv("WAKE_WORD_SAMPLES_DIR")
+WAKE_WORD_MODEL_PATH = os.getenv("WAKE_WORD_MODEL_PATH")
+WAKE_SPOTTER_THRESHOLD = os.getenv("WAKE_SPOTTER_THRESHOLD")
+WAKE_PHRASES = [phrase.strip() for phrase in os.getenv(
+    "WAKE_PHRASES", ",".join(WAKE_WORDS)).split(",") if phrase.strip()]
+GUILD_WAKE_PHRASES = parse_guild_wake_words(os.getenv("GUILD_WAKE_PHRASES"))
+WAKE_WORD_TOLERANCE = int(os.getenv("WAKE_WORD_TOLERANCE", "1"))
+STREAMING_ASR = os.getenv("STREAMING_ASR", "0") == "1"
+ASR_ENGINE = os.getenv("ASR_ENGINE", "whisper")
+ASR_MODEL = os.getenv("ASR_MODEL", "medium")
+ASR_LANGUAGE = os.getenv("ASR_LANGUAGE", "en")
+ASR_BEAM_SIZE = int(os.getenv("ASR_BEAM_SIZE", "0"))
+ASR_QUANTIZATION = os.getenv("ASR_QUANTIZATION")
+ASR_THREADS = int(os.getenv("ASR_THREADS", "0"))
+ASR_INITIAL_PROMPT = os.getenv("ASR_INITIAL_PROMPT")
+if ASR_INITIAL_PROMPT == "vocabulary":
+    ASR_INITIAL_PROMPT = VOCABULARY_PROMPT
+BLOCKING_IO_WORKERS = int(os.getenv("BLOCKING_IO_WORKERS", "8"))
+INTENT_ROUTER = os.getenv("INTENT_ROUTER", "1") == "1"
+INTENT_ROUTER_THRESHOLD = float(os.getenv("INTENT_ROUTER_THRESHOLD", "0.8"))
+UTTERANCE_CACHE_TOOLS = os.getenv(
+    "UTTERANCE_CACHE_TOOLS", "youtube,sound_effect,discord_post.youtube,volume,wolfram_alpha")
+UTTERANCE_CACHE_RESPONSE_TOOLS = os.getenv("UTTERANCE_CACHE_RESPONSE_TOOLS", "")
+UTTERANCE_CACHE_SIZE = int(os.getenv("UTTERANCE_CACHE_SIZE", "512"))
+UTTERANCE_CACHE_TTL = int(os.getenv("UTTERANCE_CACHE_TTL", "3600"))
+STREAM_RESPONSES = os.getenv("STREAM_RESPONSES", "1") == "1"
+RESPONSE_MODE = os.getenv("RESPONSE_MODE", "serial")
+COMBINED_MODEL_ID = os.getenv("COMBINED_MODEL_ID")
+TTS_CACHE_MAX_MB = int(os.getenv("TTS_CACHE_MAX_MB", "200"))
+TTS_BACKEND = os.getenv("TTS_BACKEND", "streamlabs")
+PIPER_VOICES_DIR = os.getenv("PIPER_VOICES_DIR", "voices")
+SPECULATIVE_PREFETCH = os.getenv("SPECULATIVE_PREFETCH", "1") == "1"
+SPECULATIVE_PREFETCH_MAX_WASTED = int(
+    os.getenv("SPECULATIVE_PREFETCH_MAX_WASTED", "5"))
+ACTION_PREPARE_CONCURRENCY = int(
+    os.getenv("ACTION_PREPARE_CONCURRENCY", "3"))
+AUDIO_INPUT = os.getenv("AUDIO_INPUT", "microphone")
+RECEIVE_SILENCE_TIMEOUT = float(os.getenv("RECEIVE_SILENCE_TIMEOUT", "0.8"))
+RECEIVE_MAX_SECONDS = float(os.getenv("RECEIVE_MAX_SECONDS", "15"))
+ASR_BATCH_SIZE = int(os.getenv("ASR_BATCH_SIZE", "1"))
+ASR_BATCH_MAX_WAIT = float(os.getenv("ASR_BATCH_MAX_WAIT", "0.05"))
+TRACE_LOG = os.getenv("TRACE_LOG")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+MICROPHONE = os.getenv("MICROPHONE") or None
+MIC_CALIBRATION_SECONDS = float(os.getenv("MIC_CALIBRATION_SECONDS", "1"))
+ASR_MODEL_DIR = os.getenv("ASR_MODEL_DIR") or None
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "32"))
+HTTP_MAX_PER_HOST = int(os.getenv("HTTP_MAX_PER_HOST", "8"))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "10"))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "2"))
+HTTP2 = os.getenv("HTTP2", "1") == "1"
+WOLFRAM_CACHE = os.getenv("WOLFRAM_CACHE", "1") == "1"
+WOLFRAM_CACHE_TTLS = parse_ttls(os.getenv("WOLFRAM_CACHE_TTLS"))
+GIPHY_POOL_MAX_URLS = int(os.getenv("GIPHY_POOL_MAX_URLS", "5000"))
+GIPHY_POOL_TTL = int(os.getenv("GIPHY_POOL_TTL", str(6 * 3600)))
+SFX_LIBRARY = os.getenv("SFX_LIBRARY", "1") == "1"
+SFX_LIBRARY_DIR = os.getenv("SFX_LIBRARY_DIR", os.path.join(CACHE_DIR, "sfx"))
+SFX_LIBRARY_LEARN = os.getenv("SFX_LIBRARY_LEARN", "1") == "1"
+SFX_MATCH_THRESHOLD = float(os.getenv("SFX_MATCH_THRESHOLD", "0.5"))
+SFX_CLIPS_PER_QUERY = int(os.getenv("SFX_CLIPS_PER_QUERY", "3"))
+OPUS_LIBRARY = os.getenv("OPUS_LIBRARY") or DEFAULT_OPUS_LIBRARY
+GIPHY_WARM_QUERIES = [query.strip() for query in os.getenv(
+    "GIPHY_WARM_QUERIES", "").split(",") if query.strip()]
 
-openai_client = OpenAI(api_key=OPENAI_API_KEY)
-youtube = YouTubeClient(GOOGLE_API_KEY)
-wolfram = WolframAnswer(WOLFRAM_APP_ID)
-giphy = Giphy(GIPHY_API_KEY)
+# one connection pool for every external service
+http = configure_shared_transport(
+    max_connections=HTTP_MAX_CONNECTIONS,
+    max_per_host=HTTP_MAX_PER_HOST,
+    timeout=HTTP_TIMEOUT,
+    retries=HTTP_RETRIES,
+    http2=HTTP2)
+
+# the SDK has its own retries and timeouts, it only shares the pool
+openai_client = OpenAI(api_key=OPENAI_API_KEY, http_client=http.client)
+youtube_cache = YouTubeCache(CACHE_DIR)
+youtube = YouTubeClient(GOOGLE_API_KEY, youtube_cache, http=http)
+wolfram_cache = WolframCache(
+    CACHE_DIR, ttls=WOLFRAM_CACHE_TTLS) if WOLFRAM_CACHE else None
+wolfram = WolframAnswer(WOLFRAM_APP_ID, http=http, cache=wolfram_cache)
+giphy = Giphy(GIPHY_API_KEY, http=http,
+              pool_ttl=GIPHY_POOL_TTL, max_urls=GIPHY_POOL_MAX_URLS)
 
 
 async def discord_bot_task(bot: BillyBot):
     await bot.start(DISCORD_BOT_TOKEN)
 
 
-async def create_listener_task(listener: Listen, queue):
+async def create_listener_task(listener, queue):
     await listener.start(queue)
 
 
@@ -42,14 +143,106 @@ async def main():
     # a queue of dicts that contain actions to be performed (e.g. tts, youtube, etc.)
     action_queue = asyncio.Queue()
 
-    billy_bot = BillyBot(action_queue, DISCORD_CHANNEL_ID)
+    tracer.configure(TRACE_LOG)
+
+    # shared pool for the blocking network clients
+    runner = BlockingCallRunner(max_workers=BLOCKING_IO_WORKERS)
+
+    tts_cache = TTSCache(CACHE_DIR, max_bytes=TTS_CACHE_MAX_MB * 1024 * 1024)
+    tts_options = {}
+    if TTS_BACKEND == "piper":
+        tts_options["voices_dir"] = PIPER_VOICES_DIR
+
+    sfx_library = None
+    if SFX_LIBRARY:
+        sfx_library = SoundEffectLibrary(
+            SFX_LIBRARY_DIR, match_threshold=SFX_MATCH_THRESHOLD,
+            learn_misses=SFX_LIBRARY_LEARN, clips_per_query=SFX_CLIPS_PER_QUERY)
+
+    billy_bot = BillyBot(action_queue, DISCORD_CHANNEL_ID,
+                         runner, tts_cache, youtube_cache,
+                         tts_backend=TTS_BACKEND, tts_options=tts_options,
+                         max_prepare=ACTION_PREPARE_CONCURRENCY,
+                         shard_count=DISCORD_SHARD_COUNT, shard_ids=DISCORD_SHARD_IDS,
+                         home_guild_id=DISCORD_GUILD_ID, sfx_library=sfx_library)
     tool_picker = ToolPicker(openai_client, TOOL_PICKER_MODEL_ID)
     response_author = ResponseAuthor(openai_client, RESPONSE_AUTHOR_MODEL_ID)
-    listener = Listen(tool_picker, response_author, wolfram, youtube, giphy)
+    with startup.phase("wake_spotter"):
+        wake_spotter = create_wake_spotter(
+            WAKE_SPOTTER,
+            samples_dir=WAKE_WORD_SAMPLES_DIR,
+            model_path=WAKE_WORD_MODEL_PATH,
+            threshold=float(WAKE_SPOTTER_THRESHOLD) if WAKE_SPOTTER_THRESHOLD else None)
+    asr_backend = create_asr_backend(
+        ASR_ENGINE,
+        model=ASR_MODEL,
+        language=ASR_LANGUAGE or None,
+        beam_size=ASR_BEAM_SIZE or None,
+        quantization=ASR_QUANTIZATION or None,
+        threads=ASR_THREADS,
+        initial_prompt=ASR_INITIAL_PROMPT or None,
+        model_dir=ASR_MODEL_DIR)
+    intent_router = None
+    if INTENT_ROUTER:
+        with startup.phase("intent_router"):
+            intent_router = IntentRouter(threshold=INTENT_ROUTER_THRESHOLD)
+
+    utterance_cache = UtteranceCache(
+        tool_names=[t for t in UTTERANCE_CACHE_TOOLS.split(",") if t],
+        response_tool_names=[
+            t for t in UTTERANCE_CACHE_RESPONSE_TOOLS.split(",") if t],
+        max_size=UTTERANCE_CACHE_SIZE,
+        ttl=UTTERANCE_CACHE_TTL)
+
+    prefetcher = None
+    if SPECULATIVE_PREFETCH:
+        prefetcher = SpeculativePrefetcher(
+            runner, youtube,
+            lambda url: YTDLSource.extract_info(url, True, youtube_cache),
+            max_wasted=SPECULATIVE_PREFETCH_MAX_WASTED)
 
-    # if you're not on mac, you'll need to change this
+    responder = None
+    if RESPONSE_MODE != "serial":
+        responder = ResponseSpeculator(
+            runner, tool_picker, response_author, RESPONSE_MODE,
+            combined_model_id=COMBINED_MODEL_ID)
+
+    asr_batcher = None
+    if ASR_BATCH_SIZE > 1:
+        asr_batcher = ASRBatcher(
+            asr_backend, max_batch=ASR_BATCH_SIZE, max_wait=ASR_BATCH_MAX_WAIT)
+
+    def wake_matcher_for(guild_id):
+        return WakeMatcher(
+            GUILD_WAKE_PHRASES.get(guild_id, WAKE_PHRASES),
+            tolerance=WAKE_WORD_TOLERANCE)
+
+    listener = Listen(tool_picker, response_author,
+                      wolfram, youtube, giphy, asr_backend, runner,
+                      wake_spotter=wake_spotter, streaming=STREAMING_ASR, intent_router=intent_router,
+                      utterance_cache=utterance_cache, prefetcher=prefetcher,
+                      stream_responses=STREAM_RESPONSES, responder=responder,
+                      guild_id=DISCORD_GUILD_ID,
+                      asr_batcher=asr_batcher, wake_matcher=wake_matcher_for(DISCORD_GUILD_ID),
+                      microphone=MICROPHONE, mic_calibration=MIC_CALIBRATION_SECONDS,
+                      sfx_library=sfx_library)
+    # the model loads and GIF pools fill while the bot logs in
+    listener.start_loading()
+    giphy.warm(GIPHY_WARM_QUERIES)
+
+    # if you're not on an Apple silicon mac, set OPUS_LIBRARY
     if not discord.opus.is_loaded():
-        discord.opus.load_opus("/opt/homebrew/lib/libopus.dylib")
+        discord.opus.load_opus(OPUS_LIBRARY)
+
+    if AUDIO_INPUT == "discord":
+        # a listener and receiver for each guild Billy joins a voice channel in
+        listener = GuildListeners(
+            billy_bot, listener,
+            lambda guild_id: DiscordVoiceReceiver(
+                billy_bot, guild_id,
+                silence_timeout=RECEIVE_SILENCE_TIMEOUT,
+                max_seconds=RECEIVE_MAX_SECONDS),
+            wake_matcher_for=wake_matcher_for)
 
     bot_task = asyncio.create_task(discord_bot_task(billy_bot))
     listener_task = asyncio.create_task(
@@ -57,7 +250,11 @@ async def main():
     queue_processor_task = asyncio.create_task(
         billy_bot.start_processor_task())
 
-    await asyncio.gather(bot_task, listener_task, queue_processor_task)
+    tasks = [bot_task, listener_task, queue_processor_task]
+    if METRICS_PORT:
+        tasks.append(asyncio.create_task(tracer.serve(METRICS_PORT)))
+
+    await asyncio.gather(*tasks)
 
 
 if __name__ == "__main__":
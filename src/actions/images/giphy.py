@@ -1,18 +1,249 @@
 import random
-import giphy_client
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from src.utils.blocking import DEFAULT_TIMEOUTS
+from src.utils.http import shared_transport
+
+SEARCH_URL = "https://api.giphy.com/v1/gifs/search"
+
+# Giphy won't page past this offset
+MAX_OFFSET = 4999
+
+
+class GifPool():
+    """
+    GIF URLs for one query. Every URL is handed out once, in random order,
+    before any repeats.
+    """
+
+    def __init__(self):
+        self.urls = []
+        self.unserved = []
+        self.last_served = None
+        self.next_offset = 0
+        self.total_count = None
+        self.filled_at = 0.0
+        self.refreshing = False
+
+    def add(self, urls, next_offset, total_count):
+        known = set(self.urls)
+        new_urls = [url for url in urls if url not in known]
+        self.urls.extend(new_urls)
+        self.unserved.extend(new_urls)
+        random.shuffle(self.unserved)
+        self.next_offset = next_offset
+        self.total_count = total_count
+        self.filled_at = time.monotonic()
+
+    def has_more_pages(self):
+        return self.total_count is None or \
+            self.next_offset < min(self.total_count, MAX_OFFSET)
+
+    def pick(self):
+        if not self.unserved:
+            # everything has been posted, start over but not with the same GIF
+            self.unserved = [url for url in self.urls if url != self.last_served] \
+                or list(self.urls)
+            random.shuffle(self.unserved)
+
+        if not self.unserved:
+            return None
+
+        self.last_served = self.unserved.pop()
+        return self.last_served
 
 
 class Giphy():
-    def __init__(self, api_key):
+    """
+    Searches Giphy through per-query pools of GIF URLs. A pool is filled a
+    page at a time and picks are served from memory, so repeat queries don't
+    wait on Giphy. Pools are topped up with the next page, or refreshed once
+    they're older than `pool_ttl`, in the background. The least recently
+    used pools are dropped once more than `max_urls` URLs are held.
+
+    An empty pool is filled once. Searches that arrive while it's being
+    filled, by `warm` or another search, wait for that fill.
+    """
+
+    def __init__(self, api_key, http=None, page_size=50, refill_below=10, pool_ttl=6 * 3600,
+                 max_urls=5000, report_every=20, wait_timeout=DEFAULT_TIMEOUTS["giphy"]):
+        """
+        :param wait_timeout: Seconds a search waits for another's fill of
+            the same empty pool.
+        """
         self.api_key = api_key
+        self.http = http or shared_transport()
+        self.page_size = page_size
+        self.refill_below = refill_below
+        self.pool_ttl = pool_ttl
+        self.max_urls = max_urls
+        self.report_every = report_every
+        self.wait_timeout = wait_timeout
 
-    def search(self, query):
-        api_instance = giphy_client.DefaultApi()
+        self.pools = OrderedDict()
+        # key -> Future of the pool, done when its first fill finishes
+        self.filling = {}
+        self.lock = threading.Lock()
+        self.refresher = ThreadPoolExecutor(
+            max_workers=2, thread_name_prefix="billy-giphy")
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.refreshes = 0
+        self.evictions = 0
+
+    def _key(self, query):
+        return " ".join(query.lower().split())
+
+    def _fetch_page(self, query, offset):
+        """
+        :return: (GIF URLs, offset of the next page, total results)
+        """
+        res = self.http.get(SEARCH_URL, params={
+            "api_key": self.api_key,
+            "q": query,
+            "limit": self.page_size,
+            "offset": offset,
+        })
+        res.raise_for_status()
+        body = res.json()
+
+        urls = [gif["images"]["original"]["url"] for gif in body["data"]]
+        pagination = body.get("pagination", {})
+        next_offset = pagination.get("offset", offset) + \
+            pagination.get("count", len(urls))
+        return urls, next_offset, pagination.get("total_count", next_offset)
+
+    def _evict(self):
+        # with self.lock held
+        total = sum(len(pool.urls) for pool in self.pools.values())
+        while total > self.max_urls and len(self.pools) > 1:
+            _, pool = self.pools.popitem(last=False)
+            total -= len(pool.urls)
+            self.evictions += 1
 
+    def _fill(self, key, pool, replace=False, filled=None):
+        """
+        Add the next page of results to `pool`, or start over from the first
+        page when `replace` is set.
+
+        :param filled: The future of a first fill, resolved when it's done.
+        """
+        offset = 0 if replace else pool.next_offset
         try:
-            api_response = api_instance.gifs_search_get(
-                self.api_key, query, limit=10)
-            return random.choice(api_response.data).images.original.url
+            urls, next_offset, total_count = self._fetch_page(key, offset)
         except Exception as e:
-            print("Exception when calling DefaultApi->gifs_search_get: %s\n" % e)
-            return None
+            print(f"Error filling the Giphy pool for \"{key}\": {e}")
+            urls = None
+
+        with self.lock:
+            if urls is not None:
+                if replace:
+                    pool.urls = []
+                    pool.unserved = []
+                pool.add(urls, next_offset, total_count)
+            pool.refreshing = False
+
+            if filled is not None:
+                if self.filling.get(key) is filled:
+                    del self.filling[key]
+                # a failed first fill leaves nothing worth keeping
+                if not pool.urls and self.pools.get(key) is pool:
+                    del self.pools[key]
+            self._evict()
+
+        if filled is not None:
+            filled.set_result(pool)
+
+    def _start_first_fill(self, key, pool):
+        # with self.lock held
+        pool.refreshing = True
+        self.pools[key] = pool
+        self.pools.move_to_end(key)
+        filled = Future()
+        self.filling[key] = filled
+        return filled
+
+    def _refresh_in_background(self, key, pool):
+        # with self.lock held
+        if pool.refreshing:
+            return
+
+        expired = time.monotonic() - pool.filled_at > self.pool_ttl
+        running_low = len(pool.unserved) < self.refill_below and pool.has_more_pages()
+        if expired or running_low:
+            pool.refreshing = True
+            self.refreshes += 1
+            self.refresher.submit(self._fill, key, pool, expired)
+
+    def search(self, query):
+        key = self._key(query)
+
+        filled = None
+        owned = None
+        with self.lock:
+            pool = self.pools.get(key)
+            if pool is not None:
+                self.pools.move_to_end(key)
+
+            if pool is not None and pool.urls:
+                self.hits += 1
+            elif key in self.filling:
+                # warm() or another search is already filling it
+                self.coalesced += 1
+                filled = self.filling[key]
+            else:
+                self.misses += 1
+                pool = pool or GifPool()
+                owned = self._start_first_fill(key, pool)
+
+        if filled is not None:
+            try:
+                pool = filled.result(timeout=self.wait_timeout)
+            except FutureTimeoutError:
+                print(f"Timed out waiting for the Giphy pool for \"{key}\"")
+                return None
+        elif owned is not None:
+            self._fill(key, pool, filled=owned)
+
+        with self.lock:
+            url = pool.pick()
+            if key in self.pools:
+                self._refresh_in_background(key, pool)
+
+            if (self.hits + self.misses + self.coalesced) % self.report_every == 0:
+                print("Giphy pool stats:", self.stats())
+
+        return url
+
+    def warm(self, queries):
+        """
+        Fill pools for `queries` in the background, e.g. at startup.
+        """
+        for query in queries:
+            key = self._key(query)
+            with self.lock:
+                if key in self.pools:
+                    continue
+                pool = GifPool()
+                filled = self._start_first_fill(key, pool)
+
+            self.refresher.submit(self._fill, key, pool, False, filled)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "pools": len(self.pools),
+            "urls": sum(len(pool.urls) for pool in self.pools.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "refreshes": self.refreshes,
+            "evictions": self.evictions,
+        }
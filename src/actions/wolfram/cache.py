@@ -0,0 +1,176 @@
+import os
+import re
+import threading
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from src.utils.blocking import DEFAULT_TIMEOUTS
+from src.utils.disk_store import DiskStore
+
+DAY = 24 * 3600
+
+# Seconds an answer stays fresh, by query class
+DEFAULT_TTLS = {
+    "time": 20,
+    "prices": 5 * 60,
+    "sports": 2 * 60,
+    "weather": 10 * 60,
+    "general": DAY,
+    "conversion": 30 * DAY,
+    "math": 30 * DAY,
+}
+
+UNITS = (
+    r"mm|cm|m|km|meters?|metres?|kilometers?|inch(es)?|in|feet|foot|ft|yards?|miles?|"
+    r"mg|g|kg|grams?|kilograms?|pounds?|lbs?|ounces?|oz|tons?|stones?|"
+    r"ml|l|liters?|litres?|gallons?|quarts?|pints?|cups?|tablespoons?|teaspoons?|"
+    r"celsius|fahrenheit|kelvin|degrees|mph|kph|km/h|knots|"
+    r"seconds?|minutes?|hours?|days?|weeks?|years?|"
+    r"bytes?|kb|mb|gb|tb|calories|joules?|watts?|acres?|hectares?"
+)
+
+# Checked in order, the first match wins. Anything that changes over time
+# comes before the long lived classes, "100 usd to eur" is a price, not a
+# conversion. Answers counted from today ("how many days until christmas",
+# "how old is X", "when is easter") change daily, so they're time too.
+QUERY_CLASSES = [
+    ("time", re.compile(
+        r"\b(time|date|today|tonight|tomorrow|yesterday|now|what day|sunrise|sunset|moon phase|"
+        r"until|till|since|ago|from now|how old|age of|birthday|anniversary|countdown|when is|"
+        r"(this|next|last) (week|weekend|month|year))\b")),
+    ("prices", re.compile(
+        r"\b(price|prices|cost|stocks?|shares?|market|exchange rate|worth|bitcoin|btc|ethereum|eth|"
+        r"crypto|gold|silver|oil|usd|eur|gbp|jpy|cad|dollars?|euros?|pounds sterling|yen)\b")),
+    ("sports", re.compile(
+        r"\b(score|scores|game|match|won|win|standings|playoffs?|season|nba|nfl|mlb|nhl|mls|"
+        r"fifa|premier league|super bowl|world cup)\b")),
+    ("weather", re.compile(
+        r"\b(weather|forecast|temperature|rain|raining|snow|snowing|humidity|wind|sunny|cloudy)\b")),
+    ("conversion", re.compile(
+        rf"\b(\d+(\.\d+)?|a|one|an)\s*({UNITS})\b.*\b(in|to|into)\b.*\b({UNITS})\b")),
+    ("math", re.compile(
+        r"(\d\s*[-+*/^x]\s*\d|\b(plus|minus|times|divided by|squared|cubed|square root|sqrt|"
+        r"factorial|derivative|integral|integrate|solve|equation|percent of|log|sin|cos|tan)\b)")),
+]
+
+
+def classify_query(query) -> str:
+    normalized = query.lower()
+    for name, pattern in QUERY_CLASSES:
+        if pattern.search(normalized):
+            return name
+
+    return "general"
+
+
+def parse_ttls(value) -> dict:
+    """
+    Parse "prices=300,weather=600" into {class: seconds}.
+    """
+    ttls = {}
+    for pair in (value or "").split(","):
+        if "=" not in pair:
+            continue
+        name, seconds = pair.split("=", 1)
+        ttls[name.strip()] = float(seconds)
+
+    return ttls
+
+
+class WolframCache():
+    """
+    Persistent cache of Wolfram|Alpha answers. How long an answer is kept
+    depends on what was asked (see `QUERY_CLASSES`), so "10 miles in km" is
+    kept for a month and "price of gold" for minutes.
+
+    Identical queries that arrive while one is already being answered wait
+    for that answer instead of making their own call. Lookups run on the
+    BlockingCallRunner's threads, so waiting blocks a worker, not the loop.
+    """
+
+    def __init__(self, cache_dir, ttls=None, report_every=20, wait_timeout=DEFAULT_TIMEOUTS["wolfram"]):
+        """
+        :param wait_timeout: Seconds a coalesced lookup waits for the one
+            it's sharing before giving up, so it doesn't hold a worker
+            after the BlockingCallRunner stopped waiting for it.
+        """
+        path = os.path.join(cache_dir, "wolfram.sqlite3")
+        self.answers = DiskStore(path, table="answers")
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.report_every = report_every
+        self.wait_timeout = wait_timeout
+
+        self.lock = threading.Lock()
+        self.in_flight = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+        self.answers.purge_expired()
+
+    def _key(self, query):
+        return " ".join(query.lower().strip(" ?!.").split())
+
+    def _count(self, attr):
+        with self.lock:
+            setattr(self, attr, getattr(self, attr) + 1)
+            lookups = self.hits + self.misses + self.coalesced
+
+        if lookups % self.report_every == 0:
+            print("Wolfram cache stats:", self.stats())
+
+    def get_or_fetch(self, query, fetch):
+        """
+        :param fetch: Blocking callable taking the query and returning the
+            answer, or None if there isn't one. None is never cached.
+        """
+        key = self._key(query)
+        answer = self.answers.get(key)
+        if answer is not None:
+            self._count("hits")
+            return answer
+
+        with self.lock:
+            future = self.in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self.in_flight[key] = future
+
+        if not owner:
+            self._count("coalesced")
+            try:
+                return future.result(timeout=self.wait_timeout)
+            except FutureTimeoutError:
+                print(f"Timed out waiting for the Wolfram answer to \"{query}\"")
+                return None
+
+        self._count("misses")
+        try:
+            answer = fetch(query)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                self.in_flight.pop(key, None)
+
+        future.set_result(answer)
+
+        if answer is not None:
+            query_class = classify_query(query)
+            ttl = self.ttls.get(query_class, self.ttls["general"])
+            if ttl > 0:
+                self.answers.set(key, answer, ttl=ttl)
+
+        return answer
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": round((self.hits + self.coalesced) / lookups, 3) if lookups else 0.0,
+        }
@@ -1,14 +1,36 @@
-import wolframalpha
+from src.utils.http import shared_transport
+
+QUERY_URL = "https://api.wolframalpha.com/v2/query"
 
 
 class WolframAnswer():
-    def __init__(self, app_id):
-        self.client = wolframalpha.Client(app_id)
+    def __init__(self, app_id, http=None, cache=None):
+        self.app_id = app_id
+        self.http = http or shared_transport()
+        self.cache = cache
+
+    def _results(self, data):
+        # the same pods wolframalpha.Client's `results` picks
+        for pod in data["queryresult"].get("pods", []):
+            if pod.get("primary") or pod.get("title") == "Result":
+                yield pod["subpods"][0]["plaintext"]
 
     def process(self, query):
+        if self.cache is not None:
+            return self.cache.get_or_fetch(query, self._query)
+
+        return self._query(query)
+
+    def _query(self, query):
         try:
-            res = self.client.query(query)
-            return next(res.results).text
+            res = self.http.get(QUERY_URL, params={
+                "appid": self.app_id,
+                "input": query,
+                "format": "plaintext",
+                "output": "json",
+            })
+            res.raise_for_status()
+            return next(self._results(res.json()))
         except Exception as e:
             print(f"Error getting WolframAlpha result: {e}, {query}")
             return None
@@ -0,0 +1,71 @@
+import os
+import re
+import time
+
+from src.utils.disk_store import DiskStore
+
+# googlevideo stream URLs carry their expiry as `expire=<unix time>` (or
+# `/expire/<unix time>/` in the path form)
+EXPIRE_PATTERN = re.compile(r"[?&/]expire[=/](\d+)")
+VIDEO_ID_PATTERN = re.compile(
+    r"(?:youtube\.com/watch\?(?:.*&)?v=|youtu\.be/|youtube\.com/shorts/)([\w-]{11})")
+
+# The bits of a yt-dlp info dict that YTDLSource actually uses
+INFO_KEYS = ("id", "title", "url", "duration", "webpage_url", "http_headers")
+
+
+def video_id_from_url(url):
+    match = VIDEO_ID_PATTERN.search(url)
+    return match.group(1) if match else None
+
+
+class YouTubeCache():
+    """
+    Two-level persistent cache for YouTube lookups.
+
+    - search query -> candidate video IDs, so repeats and shuffles don't hit
+      the Data API quota
+    - video ID (or URL) -> the yt-dlp info needed to stream, which lives only
+      as long as the signed stream URL inside it
+    """
+
+    def __init__(self, cache_dir, search_ttl=24 * 3600, info_ttl=3600, expiry_margin=300):
+        path = os.path.join(cache_dir, "youtube.sqlite3")
+        self.searches = DiskStore(path, table="searches")
+        self.infos = DiskStore(path, table="infos")
+        self.search_ttl = search_ttl
+        self.info_ttl = info_ttl
+        self.expiry_margin = expiry_margin
+
+        self.searches.purge_expired()
+        self.infos.purge_expired()
+
+    def _search_key(self, query):
+        return " ".join(query.lower().split())
+
+    def _info_key(self, url):
+        return video_id_from_url(url) or url
+
+    def get_search(self, query):
+        return self.searches.get(self._search_key(query))
+
+    def set_search(self, query, video_ids):
+        self.searches.set(self._search_key(query),
+                          video_ids, ttl=self.search_ttl)
+
+    def get_info(self, url):
+        return self.infos.get(self._info_key(url))
+
+    def set_info(self, url, data):
+        info = {key: data[key] for key in INFO_KEYS if key in data}
+
+        match = EXPIRE_PATTERN.search(info.get("url", ""))
+        if match:
+            expires_at = int(match.group(1)) - self.expiry_margin
+        else:
+            expires_at = time.time() + self.info_ttl
+
+        if expires_at > time.time():
+            self.infos.set(self._info_key(url), info, expires_at=expires_at)
+
+        return info
@@ -1,20 +1,52 @@
 import random
-from pyyoutube import Client
+
+from src.utils.http import shared_transport
+
+SEARCH_URL = "https://www.googleapis.com/youtube/v3/search"
 
 
 class YouTubeClient():
-    def __init__(self, api_key):
-        self.client = Client(api_key=api_key)
+    def __init__(self, api_key, cache=None, http=None):
+        self.api_key = api_key
+        self.cache = cache
+        self.http = http or shared_transport()
+
+    def search_video_ids(self, query) -> list:
+        if self.cache is not None:
+            video_ids = self.cache.get_search(query)
+            if video_ids:
+                return video_ids
+
+        res = self.http.get(SEARCH_URL, params={
+            "key": self.api_key,
+            "q": query,
+            "part": "snippet",
+            "type": "video",
+            "maxResults": 10,
+            "order": "relevance",
+            "safeSearch": "none",
+        })
+        res.raise_for_status()
+        video_ids = [item["id"]["videoId"] for item in res.json()["items"]]
+
+        if self.cache is not None and video_ids:
+            self.cache.set_search(query, video_ids)
+
+        return video_ids
+
+    def search(self, query, shuffle=False) -> str:
+        """
+        Search for a video and return its ID.
 
-    def search(self, query, shuffle=False) -> dict:
-        res = self.client.search.list(q=query, parts=["snippet"], type=[
-            "video"], maxResults=10, order="relevance", safeSearch="none")
+        :param shuffle: Pick a random result instead of the most relevant one.
+        """
+        video_ids = self.search_video_ids(query)
 
         if shuffle:
-            choice = self._pick_random_video(res.items)
+            choice = self._pick_random_video(video_ids)
             return choice
 
-        return res.items[0]
+        return video_ids[0]
 
     def _pick_random_video(self, videos):
         return random.choice(videos)
@@ -0,0 +1,283 @@
+import json
+import math
+import os
+import re
+import sys
+import time
+from collections import Counter, defaultdict
+
+from src.ai.tool_picker import TOOLS_BY_NAME
+from src.voice.wake_words import DEFAULT_WAKE_MATCHER
+
+DEFAULT_TRAINING_DATA = os.path.join(
+    os.path.dirname(__file__), "..", "..", "fine_tune_data", "tool_picker.openai.jsonl")
+
+NUMBER_WORDS = {
+    "zero": 0, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5,
+    "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10,
+}
+NUMBER = r"(\d+|" + "|".join(NUMBER_WORDS) + r")"
+
+# (pattern, slots, confidence). Patterns are matched against the whole
+# normalized command, so anything with extra words goes to the LLM.
+MEDIA_RULES = [
+    (r"(stop|stop it|stop playing|stop the music|turn it off|turn off the music)",
+     {"stop": 1}, 0.97),
+    (r"pause( it| this| music| the music| the song)?", {"pause": 1}, 0.97),
+    (r"(resume|unpause)( it| this| music| the music| again| that song again)?",
+     {"play": 1}, 0.95),
+    # "play music" may mean "find me some", the tool picker decides
+    (r"play( it| this| again| that song again)?", {"play": 1}, 0.95),
+]
+
+VOLUME_CONTEXT = r"(volume|sound|music|it|this|song)"
+VOLUME_LEVELS = [
+    (r"mute( the)? (volume|sound|music|song)", 0),
+    (r".*(all the way up|full volume|full blast|crank it( up)?|super high|to max).*", 10),
+    (r".*super low.*", 1),
+    (r".*really low.*", 2),
+    (r".*\bto low\b.*", 3),
+    (r".*\bto medium\b.*", 6),
+    (r".*\bto high\b.*", 8),
+]
+
+
+def normalize_command(line, matcher=DEFAULT_WAKE_MATCHER):
+    line = line.lower().strip()
+    line = matcher.strip(line)
+    line = re.sub(r"[^a-z0-9' -]", " ", line)
+    return re.sub(r"\s+", " ", line).strip()
+
+
+def _to_number(word):
+    if word.isdigit():
+        return int(word)
+    return NUMBER_WORDS[word]
+
+
+class NaiveBayesToolClassifier():
+    """
+    Multinomial naive Bayes over word unigrams and bigrams, predicting the
+    tool name. Small enough to train at startup from the fine-tuning data.
+    """
+
+    def __init__(self):
+        self.class_counts = Counter()
+        self.feature_counts = defaultdict(Counter)
+        self.vocabulary = set()
+
+    def _features(self, text):
+        words = text.split()
+        return words + [f"{a}_{b}" for a, b in zip(words, words[1:])]
+
+    def fit(self, examples):
+        for text, tool_name in examples:
+            self.class_counts[tool_name] += 1
+            for feature in self._features(normalize_command(text)):
+                self.feature_counts[tool_name][feature] += 1
+                self.vocabulary.add(feature)
+
+        return self
+
+    def predict_proba(self, text) -> dict:
+        features = self._features(normalize_command(text))
+        total = sum(self.class_counts.values())
+        vocab_size = len(self.vocabulary) + 1
+
+        log_probs = {}
+        for tool_name, count in self.class_counts.items():
+            feature_total = sum(self.feature_counts[tool_name].values())
+            log_prob = math.log(count / total)
+            for feature in features:
+                log_prob += math.log(
+                    (self.feature_counts[tool_name][feature] + 1) / (feature_total + vocab_size))
+            log_probs[tool_name] = log_prob
+
+        top = max(log_probs.values())
+        exp = {k: math.exp(v - top) for k, v in log_probs.items()}
+        norm = sum(exp.values())
+        return {k: v / norm for k, v in exp.items()}
+
+
+def load_examples(path):
+    examples = []
+    with open(path) as f:
+        for line in f:
+            messages = json.loads(line)["messages"]
+            user = next(m["content"] for m in messages if m["role"] == "user")
+            answer = next(m["content"]
+                          for m in messages if m["role"] == "assistant")
+            examples.append((user, json.loads(answer)))
+
+    return examples
+
+
+class IntentRouter():
+    """
+    On-box fast path in front of ToolPicker. Media controls and volume
+    commands are matched with rules, and a small classifier trained from the
+    tool picker fine-tuning data checks the result. Only matches at or above
+    `threshold` confidence are returned. Everything else goes to the LLM.
+    """
+
+    def __init__(self, threshold=0.8, training_data=DEFAULT_TRAINING_DATA, examples=None):
+        self.threshold = threshold
+        self.classifier = None
+
+        if examples is None and training_data and os.path.exists(training_data):
+            examples = load_examples(training_data)
+
+        if examples:
+            self.classifier = NaiveBayesToolClassifier().fit(
+                (text, answer["tool"]) for text, answer in examples)
+
+        self.routed = 0
+        self.fallbacks = 0
+
+    def _match_rules(self, command):
+        for pattern, slots, confidence in MEDIA_RULES:
+            if re.fullmatch(pattern, command):
+                return dict(tool="youtube", **slots), confidence
+
+        volume = self._match_volume(command)
+        if volume is not None:
+            return volume
+
+        return self._match_play(command)
+
+    def _match_volume(self, command):
+        if not re.search(r"\b(volume|sound|music|turn|crank|mute|blast)\b", command):
+            return None
+
+        for pattern, value in VOLUME_LEVELS:
+            if re.fullmatch(pattern, command):
+                return {"tool": "volume", "value": value}, 0.9
+
+        # "volume 7", "set the volume to six", "turn the sound to seven"
+        match = re.fullmatch(
+            r"(?:(?:set|turn|put) )?(?:the )?(?:music )?" + VOLUME_CONTEXT +
+            r" (?:volume )?(?:to |at )?" + NUMBER, command)
+        if match:
+            value = max(0, min(10, _to_number(match.group(2))))
+            return {"tool": "volume", "value": value}, 0.95
+
+        # "turn it up", "turn the volume down one", "volume up"
+        match = re.fullmatch(
+            r"(?:turn (?:down |up )?(?:the )?(?:music )?" + VOLUME_CONTEXT +
+            r"(?: (up|down))?|volume (up|down))(?: one| a bit| a little)?", command)
+        if match:
+            direction = match.group(2) or match.group(3)
+            if direction is None:
+                direction = "down" if command.startswith(
+                    "turn down") else "up" if command.startswith("turn up") else None
+            if direction:
+                return {"tool": "volume", "value": direction}, 0.9
+
+        return None
+
+    def _match_play(self, command):
+        match = re.fullmatch(
+            r"(?:can you )?(?:play|stream|shuffle) (?:some )?(.+)", command)
+        if not match:
+            return None
+
+        query = match.group(1)
+        if re.search(r"\bsound\b|\bsfx\b", query):
+            return None
+
+        if " by " in query:
+            return {"tool": "youtube", "query": query}, 0.85
+
+        if query.endswith(" music"):
+            query = query.replace("lo-fi", "lofi")
+            return {"tool": "youtube", "query": query, "shuffle": 1}, 0.85
+
+        # a bare artist name, the LLM is much better at spelling these
+        return {"tool": "youtube", "query": query + " music", "shuffle": 1}, 0.6
+
+    def route(self, line, matcher=DEFAULT_WAKE_MATCHER):
+        """
+        :param matcher: The `WakeMatcher` the line was heard with.
+        :return: A ToolPicker style dict (with a `Tool` in "tool") or None if
+            the LLM should decide.
+        """
+        command = normalize_command(line, matcher)
+        match = self._match_rules(command)
+        if match is None:
+            self.fallbacks += 1
+            return None
+
+        data, confidence = match
+        if self.classifier is not None:
+            probabilities = self.classifier.predict_proba(command)
+            if max(probabilities, key=probabilities.get) != data["tool"]:
+                confidence *= 0.5
+
+        if confidence < self.threshold:
+            self.fallbacks += 1
+            return None
+
+        self.routed += 1
+        data["tool"] = TOOLS_BY_NAME[data["tool"]]
+        return data
+
+
+def _slots_match(expected, actual):
+    keys = ("stop", "play", "pause", "value", "shuffle")
+    for key in keys:
+        if expected.get(key, 0) != actual.get(key, 0):
+            return False
+
+    expected_query = expected.get("query")
+    actual_query = actual.get("query")
+    if expected_query is None or actual_query is None:
+        return expected_query == actual_query
+
+    return normalize_command(expected_query) == normalize_command(actual_query)
+
+
+def evaluate(path, threshold=0.8, folds=5):
+    """
+    K-fold evaluation against the tool picker fine-tuning data. The classifier
+    is trained on the other folds, so the numbers aren't inflated by seeing
+    the test utterance.
+    """
+    examples = load_examples(path)
+    routed = tool_correct = slots_correct = 0
+    latencies = []
+
+    for fold in range(folds):
+        train = [e for i, e in enumerate(examples) if i % folds != fold]
+        test = [e for i, e in enumerate(examples) if i % folds == fold]
+        router = IntentRouter(threshold=threshold, examples=train)
+
+        for text, expected in test:
+            started_at = time.perf_counter()
+            data = router.route(text)
+            latencies.append(time.perf_counter() - started_at)
+
+            if data is None:
+                continue
+
+            routed += 1
+            if data["tool"] == TOOLS_BY_NAME[expected["tool"]]:
+                tool_correct += 1
+                if _slots_match(expected, data):
+                    slots_correct += 1
+            else:
+                print(f"  wrong tool: {text!r} -> {data}, expected {expected}")
+
+    latencies.sort()
+    total = len(examples)
+    print(f"Utterances:          {total}")
+    print(f"Routed locally:      {routed} ({routed / total:.1%})")
+    if routed:
+        print(f"Tool accuracy:       {tool_correct / routed:.1%}")
+        print(f"Tool + slots exact:  {slots_correct / routed:.1%}")
+    print(f"Latency p50:         {latencies[len(latencies) // 2] * 1000:.3f} ms")
+    print(f"Latency p99:         {latencies[int(len(latencies) * 0.99)] * 1000:.3f} ms")
+
+
+if __name__ == "__main__":
+    # python -m src.ai.intent_router [path/to/tool_picker.openai.jsonl]
+    evaluate(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_TRAINING_DATA)
@@ -1,3 +1,5 @@
+import re
+
 from openai import OpenAI
 
 SYSTEM_PROMPT = """
@@ -13,20 +15,23 @@ response.
 Your goal is to write as a human would speak because it will be fed into TTS.
 """
 
+# Split after sentence punctuation that is followed by whitespace
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
 
 class ResponseAuthor():
     def __init__(self, openapi_client: OpenAI, ft_model_id: str):
         self.openapi_client = openapi_client
         self.ft_model_id = ft_model_id
 
-    def write_response(self, message, added_info=None):
+    def _messages(self, message, added_info=None):
         user_content = f"Query: {message}"
         if added_info is not None:
             user_content += f"\nAdded Info:\n{added_info}"
             print("Added Info:")
             print(added_info)
 
-        res = self.openapi_client.chat.completions.create(messages=[
+        return [
             {
                 "role": "system",
                 "content": SYSTEM_PROMPT,
@@ -35,6 +40,39 @@ class ResponseAuthor():
                 "role": "user",
                 "content": user_content,
             }
-        ], model=self.ft_model_id)
+        ]
+
+    def write_response(self, message, added_info=None):
+        return self.write_response_with_usage(message, added_info)[0]
+
+    def write_response_with_usage(self, message, added_info=None):
+        """
+        :return: (response text, total tokens used)
+        """
+        res = self.openapi_client.chat.completions.create(
+            messages=self._messages(message, added_info), model=self.ft_model_id)
+
+        tokens = res.usage.total_tokens if res.usage else 0
+        return res.choices[0].message.content, tokens
+
+    def stream_response(self, message, added_info=None):
+        """
+        Stream the response, yielding it one sentence at a time as soon as
+        each sentence is complete.
+        """
+        stream = self.openapi_client.chat.completions.create(
+            messages=self._messages(message, added_info), model=self.ft_model_id, stream=True)
+
+        buffer = ""
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+
+            buffer += chunk.choices[0].delta.content or ""
+            *sentences, buffer = SENTENCE_END.split(buffer)
+            for sentence in sentences:
+                if sentence.strip():
+                    yield sentence.strip()
 
-        return res.choices[0].message.content
+        if buffer.strip():
+            yield buffer.strip()
@@ -0,0 +1,142 @@
+import asyncio
+import time
+
+from src.ai.tool_picker import Tool
+
+# serial: pick a tool, then write the reply (two round trips for no_tool)
+# speculative: write the reply while the tool is being picked
+# combined: one structured call returns the tool and the reply
+RESPONSE_MODES = ("serial", "speculative", "combined")
+
+
+class AuthorSpeculation():
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.finished_at = None
+        self.task = None
+        self.resolved = False
+
+
+class ResponseSpeculator():
+    """
+    Takes the ResponseAuthor round trip off the critical path for `no_tool`
+    utterances, either by running it concurrently with the tool picker or by
+    asking for the reply in the tool picker call itself.
+
+    Tracks how many tokens this costs and roughly how much latency it saves,
+    so the mode can be chosen per deployment. The serial path isn't run for
+    comparison, so the savings are not measured differences:
+
+    - `overlapped_seconds` (speculative) is measured, the part of each used
+      reply that was written while the tool picker ran, which the serial
+      path would have spent after it.
+    - `estimated_saved_seconds` (combined) assumes a response author round
+      trip takes as long as the combined call.
+    """
+
+    def __init__(self, runner, tool_picker, response_author, mode="speculative", combined_model_id=None):
+        if mode not in RESPONSE_MODES:
+            raise ValueError(f"Unknown response mode: {mode}")
+
+        self.runner = runner
+        self.tool_picker = tool_picker
+        self.response_author = response_author
+        self.mode = mode
+        self.combined_model_id = combined_model_id
+
+        self.started = 0
+        self.used = 0
+        self.wasted = 0
+        self.used_tokens = 0
+        self.wasted_tokens = 0
+        self.overlapped_seconds = 0.0
+        self.estimated_saved_seconds = 0.0
+
+    async def _write(self, speculation, line):
+        try:
+            return await self.runner.run(
+                "response_author", self.response_author.write_response_with_usage, line)
+        finally:
+            speculation.finished_at = time.monotonic()
+
+    def start(self, line):
+        if self.mode != "speculative":
+            return None
+
+        self.started += 1
+        speculation = AuthorSpeculation()
+        speculation.task = asyncio.create_task(self._write(speculation, line))
+        return speculation
+
+    async def claim(self, speculation):
+        """
+        Use the speculative reply for a `no_tool` utterance.
+
+        :return: The reply text, or None if the caller should write one itself.
+        """
+        if speculation is None or speculation.resolved:
+            return None
+
+        picked_at = time.monotonic()
+        speculation.resolved = True
+        try:
+            text, tokens = await speculation.task
+        except Exception as e:
+            print("Speculative response failed: ", e)
+            return None
+
+        self.used += 1
+        self.used_tokens += tokens
+        self.overlapped_seconds += min(picked_at,
+                                       speculation.finished_at) - speculation.started_at
+        return text
+
+    def discard(self, speculation):
+        """
+        Drop a speculative reply because another tool was picked. A reply
+        written without the tool's result (e.g. Wolfram's answer) is stale.
+        """
+        if speculation is None or speculation.resolved:
+            return
+
+        speculation.resolved = True
+        self.wasted += 1
+
+        def count_tokens(task):
+            # the request has usually been sent already, so the tokens are
+            # spent either way
+            if not task.cancelled() and task.exception() is None:
+                self.wasted_tokens += task.result()[1]
+
+        speculation.task.add_done_callback(count_tokens)
+
+    async def pick_tool_and_reply(self, line) -> dict:
+        picked_at = time.monotonic()
+        data, tokens = await self.runner.run(
+            "tool_picker", self.tool_picker.determine_tools_and_reply,
+            line, self.combined_model_id)
+
+        if data.get('tool') == Tool.NoTool and data.get('reply'):
+            self.used += 1
+            self.used_tokens += tokens
+            # assumes the skipped response author round trip would have
+            # taken as long as this call
+            self.estimated_saved_seconds += time.monotonic() - picked_at
+        else:
+            # a reply we didn't need is (mostly) wasted output
+            self.wasted += 1 if data.get('reply') else 0
+            data.pop('reply', None)
+
+        return data
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "started": self.started,
+            "used": self.used,
+            "wasted": self.wasted,
+            "used_tokens": self.used_tokens,
+            "wasted_tokens": self.wasted_tokens,
+            "overlapped_seconds": round(self.overlapped_seconds, 2),
+            "estimated_saved_seconds": round(self.estimated_saved_seconds, 2),
+        }
@@ -14,6 +14,17 @@ class Tool(Enum):
     Volume = 6
 
 
+TOOLS_BY_NAME = {
+    'no_tool': Tool.NoTool,
+    'wolfram_alpha': Tool.WolframAlpha,
+    'youtube': Tool.YouTube,
+    'sound_effect': Tool.SoundEffect,
+    'discord_post': Tool.DiscordPost,
+    'discord_post.youtube': Tool.DiscordPostYouTube,
+    'volume': Tool.Volume,
+}
+
+
 SYSTEM_PROMPT = """Your job is to decide which tool is
 most appropriate to respond to this user. If the user asks to play music, use
 youtube, if they need a currency conversion, use wolfram_alpha, if they ask
@@ -48,6 +59,18 @@ Example output:
 {"tool": "no_tool"}"""
 
 
+COMBINED_REPLY_PROMPT = """
+
+If you choose no_tool, also include a "reply" key with what you would say back
+to the user. Reply as a slightly disturbing AI that wants to freak people out
+and make them laugh in the Discord server. Keep it short, witty, and written
+the way a human would speak, because it will be fed into TTS. Never say your
+own name.
+
+Example output:
+{"tool": "no_tool", "reply": "Ask me again when I've had my coffee."}"""
+
+
 class ToolPicker():
     def __init__(self, openai_client: OpenAI, ft_model_id: str):
         self.openai_client = openai_client
@@ -68,27 +91,21 @@ class ToolPicker():
             ai_response = ai_response.lower().strip()
             json_resp = json.loads(ai_response)
 
-            if json_resp['tool'] == 'no_tool':
-                return Tool.NoTool
-            elif json_resp['tool'] == 'wolfram_alpha':
-                return Tool.WolframAlpha
-            elif json_resp['tool'] == 'youtube':
-                return Tool.YouTube
-            elif json_resp['tool'] == 'sound_effect':
-                return Tool.SoundEffect
-            elif json_resp['tool'] == 'discord_post':
-                return Tool.DiscordPost
-            elif json_resp['tool'] == 'discord_post.youtube':
-                return Tool.DiscordPostYouTube
-            elif json_resp['tool'] == 'volume':
-                return Tool.Volume
-            else:
-                return Tool.NoTool
+            return TOOLS_BY_NAME.get(json_resp['tool'], Tool.NoTool)
         except Exception as e:
             print("Error parsing tool picker response: ", e)
             print("Response: ", ai_response)
             return Tool.NoTool
 
+    def _parse(self, content: str) -> dict:
+        tool = self._get_tool_from_response(content)
+        data = self._response_to_json(content)
+
+        req_params = data
+        req_params['tool'] = tool
+
+        return req_params
+
     def determine_tools_and_query(self, query):
         res = self.openai_client.chat.completions.create(
             messages=[
@@ -103,10 +120,30 @@ class ToolPicker():
             ], model=self.ft_model_id,
         )
 
-        tool = self._get_tool_from_response(res.choices[0].message.content)
-        data = self._response_to_json(res.choices[0].message.content)
+        return self._parse(res.choices[0].message.content)
 
-        req_params = data
-        req_params['tool'] = tool
+    def determine_tools_and_reply(self, query, model_id=None):
+        """
+        Pick a tool and, for no_tool, write the spoken reply in the same call.
 
-        return req_params
+        The fine-tuned tool picker wasn't trained for this, so a general model
+        that supports JSON mode can be passed as `model_id`.
+
+        :return: (tool picker dict with an optional "reply", total tokens used)
+        """
+        res = self.openai_client.chat.completions.create(
+            messages=[
+                {
+                    "role": "system",
+                    "content": SYSTEM_PROMPT + COMBINED_REPLY_PROMPT,
+                },
+                {
+                    "role": "user",
+                    "content": query,
+                }
+            ], model=model_id or self.ft_model_id,
+            response_format={"type": "json_object"},
+        )
+
+        tokens = res.usage.total_tokens if res.usage else 0
+        return self._parse(res.choices[0].message.content), tokens
@@ -0,0 +1,45 @@
+from src.ai.tool_picker import TOOLS_BY_NAME
+from src.utils.cache import TTLCache
+from src.voice.wake_words import DEFAULT_WAKE_MATCHER, normalize_utterance
+
+
+class UtteranceCache():
+    """
+    Caches ToolPicker decisions and ResponseAuthor replies keyed on the
+    normalized (lowercase, wake-word-stripped) transcript. Callers pass the
+    `WakeMatcher` the line was heard with, guilds can have their own wake
+    phrases.
+
+    Caching is opt-in per tool. `no_tool` banter and random discord posts
+    (jokes, coin flips) usually want a fresh answer every time.
+    """
+
+    def __init__(self, tool_names=(), response_tool_names=(), max_size=512, ttl=3600):
+        self.tools = {TOOLS_BY_NAME[name] for name in tool_names}
+        self.response_tools = {TOOLS_BY_NAME[name]
+                               for name in response_tool_names}
+
+        self.tool_cache = TTLCache(max_size, ttl, name="tool_picker")
+        self.response_cache = TTLCache(max_size, ttl, name="response_author")
+
+    async def pick_tool(self, line, compute, matcher=DEFAULT_WAKE_MATCHER) -> dict:
+        data = await self.tool_cache.get_or_compute(
+            normalize_utterance(line, matcher),
+            compute,
+            should_cache=lambda data: data.get('tool') in self.tools)
+
+        # callers shouldn't be able to mutate the cached entry
+        return dict(data)
+
+    def caches_response(self, tool):
+        return tool in self.response_tools
+
+    async def write_response(self, line, tool, compute, added_info=None, matcher=DEFAULT_WAKE_MATCHER):
+        if not self.caches_response(tool):
+            return await compute()
+
+        return await self.response_cache.get_or_compute(
+            (normalize_utterance(line, matcher), added_info), compute)
+
+    def stats(self) -> list:
+        return [self.tool_cache.stats(), self.response_cache.stats()]
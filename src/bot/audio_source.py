@@ -0,0 +1,93 @@
+import asyncio
+import os
+from urllib.parse import urlparse
+
+import discord
+import yt_dlp as youtube_dl
+
+from src.utils.tracing import tracer
+
+# Suppress noise about console usage from errors
+youtube_dl.utils.bug_reports_message = lambda: ''
+
+
+ytdl_format_options = {
+    'format': 'bestaudio/best',
+    'outtmpl': '%(extractor)s-%(id)s-%(title)s.%(ext)s',
+    'restrictfilenames': True,
+    'noplaylist': True,
+    'nocheckcertificate': True,
+    'ignoreerrors': False,
+    'logtostderr': False,
+    'quiet': True,
+    'no_warnings': True,
+    'default_search': 'auto',
+    # bind to ipv4 since ipv6 addresses cause issues sometimes
+    'source_address': '0.0.0.0',
+}
+
+ffmpeg_options = {
+    'before_options':
+        '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5 -probesize 200M',
+    'options': '-vn',
+}
+
+# local files don't support the HTTP reconnect options
+ffmpeg_file_options = {
+    'options': '-vn',
+}
+
+# URLs that already point at an audio file don't need yt-dlp
+DIRECT_AUDIO_EXTENSIONS = (".mp3", ".wav", ".ogg", ".opus", ".m4a", ".flac", ".aac")
+
+ytdl = youtube_dl.YoutubeDL(ytdl_format_options)
+
+
+def is_direct_audio_url(url):
+    return urlparse(url).path.lower().endswith(DIRECT_AUDIO_EXTENSIONS)
+
+
+class YTDLSource(discord.PCMVolumeTransformer):
+    def __init__(self, source, *, data, volume=0.5):
+        super().__init__(source, volume)
+
+        self.data = data
+
+        self.title = data.get('title')
+        self.url = data.get('url')
+
+    @staticmethod
+    def extract_info(url, stream=False, cache=None):
+        if stream and cache is not None:
+            data = cache.get_info(url)
+            if data is not None:
+                return data
+
+        data = ytdl.extract_info(url, download=not stream)
+
+        if 'entries' in data:
+            # take first item from a playlist
+            data = data['entries'][0]
+
+        if stream and cache is not None:
+            data = cache.set_info(url, data)
+
+        return data
+
+    @classmethod
+    def from_file(cls, path):
+        data = {'title': os.path.basename(path), 'url': path}
+        return cls(discord.FFmpegPCMAudio(path, **ffmpeg_file_options), data=data)
+
+    @classmethod
+    async def from_url(cls, url, *, loop=None, stream=False, cache=None):
+        if is_direct_audio_url(url):
+            data = {'title': os.path.basename(urlparse(url).path), 'url': url}
+            return cls(discord.FFmpegPCMAudio(url, **ffmpeg_options), data=data)
+
+        loop = loop or asyncio.get_event_loop()
+        with tracer.span("yt_dlp"):
+            data = await loop.run_in_executor(None, lambda: cls.extract_info(url, stream, cache))
+
+        filename = data['url'] if stream else ytdl.prepare_filename(data)
+        return cls(discord.FFmpegPCMAudio(filename, **ffmpeg_options), data=data)
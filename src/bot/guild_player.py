@@ -0,0 +1,306 @@
+import asyncio
+import io
+
+import discord
+
+from src.bot.audio_source import YTDLSource
+from src.bot.mixer import MixerSource
+from src.bot.scheduler import ActionScheduler
+from src.tts.backends import create_tts
+from src.tts.streamlabs import StreamlabsVoice
+from src.utils.tracing import current_trace_id
+
+
+class GuildPlayer():
+    """
+    Voice connection, playback state and action queue for one guild. Every
+    guild has its own scheduler, so a slow yt-dlp lookup or ffmpeg startup in
+    one guild never holds up another.
+    """
+
+    def __init__(self, bot, guild_id: int, text_channel_id: int = None, max_prepare=3):
+        self.bot = bot
+        self.guild_id = guild_id
+        self.text_channel_id = text_channel_id
+        self.queue = asyncio.Queue()
+        self.scheduler = ActionScheduler(
+            self.queue, self, max_prepare=max_prepare, name=f"guild {guild_id}")
+        self.task = None
+
+        self.vc = None
+        self.voice = StreamlabsVoice.Justin
+        self.youtube_url = None
+        self.user_float_volume = 0.8
+        # the one source the voice client plays, everything is mixed into it
+        self.mixer = MixerSource(on_idle=self._on_mixer_idle,
+                                 on_active=self._on_mixer_active)
+        self.mixer.music_volume = self.user_float_volume
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self.scheduler.run())
+
+    def _on_mixer_idle(self):
+        # the player sends silence and waits while paused
+        if self.vc is not None and self.vc.is_playing():
+            self.vc.pause()
+
+    def _on_mixer_active(self):
+        if self.vc is None or not self.vc.is_connected():
+            return
+
+        if self.vc.is_paused():
+            self.vc.resume()
+        elif not self.vc.is_playing():
+            self.vc.play(self.mixer, after=lambda e: print(
+                f'Player error: {e}') if e else None)
+
+    def disconnect(self):
+        self.mixer.stop()
+        self.vc = None
+        self.youtube_url = None
+
+    def handle_control(self, item):
+        if item["type"] == "volume":
+            self._handle_volume_item(item)
+            return
+
+        stop = item.get("stop", 0)
+        play = item.get("play", 0)
+        pause = item.get("pause", 0)
+
+        if stop:
+            self.safely_stop()
+        elif pause:
+            self.safely_pause()
+        elif play:
+            self.safely_resume()
+
+    async def handle_post(self, item):
+        if item["type"] == "discord_post":
+            await self._handle_discord_post_item(item)
+        elif item["type"] == "discord_post.youtube":
+            await self._handle_discord_post_youtube_item(item)
+
+    async def _handle_discord_post_item(self, item):
+        text = item.get("text", None)
+        image = item.get("image", None)
+        msg = ""
+
+        if text is not None:
+            msg += text
+
+        if image is not None:
+            if msg != "":
+                msg += "\n"
+
+            msg += image
+
+        await self.send_channel_message(msg)
+
+    async def _handle_discord_post_youtube_item(self, item):
+        text = item.get("text", None)
+        if text is not None:
+            await self.send_channel_message(text)
+
+    async def _synthesize_speech(self, text):
+        tts = create_tts(self.bot.tts_backend, self.voice,
+                         self.bot.tts_cache, **self.bot.tts_options)
+        try:
+            speech = await self.bot.runner.run("tts", tts.synthesize, text)
+        except asyncio.TimeoutError:
+            print("Timed out waiting for TTS: ", text)
+            return None
+
+        if speech is None:
+            return None
+
+        if speech.pcm is not None:
+            # local engines hand us Discord-ready PCM, no ffmpeg needed
+            return discord.PCMVolumeTransformer(
+                discord.PCMAudio(io.BytesIO(speech.pcm)), volume=0.5)
+
+        # this spawns ffmpeg now rather than when the source is played
+        return YTDLSource.from_file(speech.path)
+
+    async def prepare_audible(self, item):
+        """
+        Do the slow part of an audible item (yt-dlp, synthesis, ffmpeg
+        startup) ahead of its turn.
+
+        :return: An audio source, or None if there is nothing to play.
+        """
+        if self.vc is None:
+            print("Not in a voice channel.")
+            return None
+
+        # this runs in its own task, so the trace only applies here
+        current_trace_id.set(item.get("trace_id"))
+
+        if item["type"] == "youtube":
+            return await YTDLSource.from_url(
+                f"https://www.youtube.com/watch?v={item['video_id']}",
+                loop=self.bot.loop, stream=True, cache=self.bot.youtube_cache)
+        elif item["type"] == "sound_effect":
+            return await self._prepare_sound_effect(item)
+        elif item["type"] == "tts":
+            return await self._synthesize_speech(item["text"])
+
+        print(f"Unknown item: {item}")
+        return None
+
+    async def _prepare_sound_effect(self, item):
+        library = self.bot.sfx_library
+        if item.get("clip_id") is not None and library is not None:
+            source = await asyncio.to_thread(library.load, item["clip_id"])
+            if source is not None:
+                return source
+
+        if item.get("video_id") is not None:
+            url = f"https://www.youtube.com/watch?v={item['video_id']}"
+        elif item.get("query"):
+            # the library clip was unreadable, search for the sound instead
+            url = f"ytsearch1:{item['query']}"
+        else:
+            return None
+
+        source = await self.create_yt_audio_source(url)
+
+        if source is not None and library is not None and item.get("query"):
+            # next time this plays from the library
+            library.learn(source.url, item["query"], title=source.title,
+                          source=item.get("video_id") or source.data.get("id"),
+                          headers=source.data.get("http_headers"),
+                          candidates=item.get("candidates", ()))
+
+        return source
+
+    async def play_audible(self, item, source, more_speech_queued=False):
+        if source is None or self.vc is None:
+            return
+
+        trace_id = item.get("trace_id")
+        if item["type"] == "youtube":
+            self._start_youtube(
+                source, f"https://www.youtube.com/watch?v={item['video_id']}", trace_id)
+        elif item["type"] == "sound_effect":
+            self.mixer.play_effect(source, max_duration=5, trace_id=trace_id)
+        elif item["type"] == "tts":
+            await self._play_speech(source, keep_ducked=more_speech_queued, trace_id=trace_id)
+
+    async def _play_speech(self, tts_source, keep_ducked=False, trace_id=None):
+        """
+        Play speech over the (ducked) music and wait for it to finish. The
+        music stays ducked while `keep_ducked` is set so it doesn't swell
+        between consecutive sentences.
+        """
+        finished = asyncio.Event()
+
+        def after_speech(error):
+            if error:
+                print(f'Player error: {error}')
+            self.bot.loop.call_soon_threadsafe(finished.set)
+
+        self.mixer.keep_ducked = keep_ducked
+        self.mixer.play_speech(tts_source, after=after_speech, trace_id=trace_id)
+        await finished.wait()
+
+    def _handle_volume_item(self, item):
+        value = item["value"]
+        if value == "up":
+            mult_volume = self.user_float_volume * 10
+            value = mult_volume + 2
+        elif value == "down":
+            mult_volume = self.user_float_volume * 10
+            value = mult_volume - 2
+
+        self.safely_set_volume(value)
+
+    async def send_channel_message(self, message, files=None):
+        try:
+            channel = self.bot.get_channel(self.text_channel_id)
+            await channel.send(message, files=files)
+        except Exception as e:
+            print("Error sending Discord message: ", e)
+
+    def safely_set_volume(self, value) -> int:
+        if self.vc is None:
+            print("Not in a voice channel.")
+            return
+
+        float_volume = int(value) / 10
+        float_volume = max(0, min(1, float_volume))
+
+        self.mixer.music_volume = float_volume
+        self.user_float_volume = float_volume
+
+        return int(float_volume * 10)
+
+    def safely_stop(self):
+        if self.vc is None:
+            print("Not in a voice channel.")
+            return
+
+        self.mixer.stop()
+
+    def safely_pause(self):
+        if self.vc is None:
+            print("Not in a voice channel.")
+            return
+
+        self.mixer.pause_music()
+
+    def safely_resume(self):
+        if self.vc is None:
+            print("Not in a voice channel.")
+            return
+
+        self.mixer.resume_music()
+
+    async def play_youtube(self, id_or_url, prefix=True):
+        """
+        Play a YouTube video.
+
+        :param id_or_url: The YouTube video ID or URL.
+        :param prefix: Whether or not to prefix the ID with "https://www.youtube.com/watch?v=".
+        """
+        try:
+            if self.vc is None:
+                print("Not in a voice channel.")
+                return
+
+            url = id_or_url
+            if prefix:
+                url = f"https://www.youtube.com/watch?v={id_or_url}"
+
+            source = await YTDLSource.from_url(
+                url, loop=self.bot.loop, stream=True, cache=self.bot.youtube_cache)
+            self._start_youtube(source, url)
+        except Exception as e:
+            print("Error playing YouTube video: ", e)
+
+    def _start_youtube(self, source, url, trace_id=None):
+        def after_youtube_callback(error):
+            if error:
+                print(f'Player error: {error}')
+            else:
+                self.youtube_url = None
+
+        self.mixer.play_music(source, after=after_youtube_callback, trace_id=trace_id)
+        self.youtube_url = url
+
+    async def create_yt_audio_source(self, url):
+        if self.vc is None:
+            print("Not in a voice channel.")
+            return
+
+        source = await YTDLSource.from_url(
+            url, loop=self.bot.loop, stream=True, cache=self.bot.youtube_cache)
+        return source
+
+    def play(self, source):
+        if self.vc is None:
+            print("Not in a voice channel.")
+            return
+
+        self.mixer.play_effect(source)
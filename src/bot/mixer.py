@@ -0,0 +1,257 @@
+import ctypes
+import threading
+import time
+
+import discord
+import numpy as np
+
+from src.utils.tracing import tracer
+
+# 20ms of 16-bit 48kHz stereo PCM, what Discord's player reads per frame
+FRAME_SAMPLES = discord.opus.Encoder.SAMPLES_PER_FRAME * \
+    discord.opus.Encoder.CHANNELS
+FRAME_BYTES = discord.opus.Encoder.FRAME_SIZE
+FRAMES_PER_SECOND = 50
+
+
+class MixerLayer():
+    """
+    One source playing through the mixer. `PCMVolumeTransformer`s are
+    unwrapped so their volume is applied in the mixer's vectorized pass
+    instead of sample by sample in Python.
+    """
+
+    def __init__(self, source: discord.AudioSource, volume=None, after=None, max_frames=0, trace_id=None):
+        if isinstance(source, discord.PCMVolumeTransformer):
+            if volume is None:
+                volume = source.volume
+            source = source.original
+
+        self.source = source
+        self.volume = 1.0 if volume is None else volume
+        self.after = after
+        self.max_frames = max_frames
+        self.frames = 0
+        self.trace_id = trace_id
+        self.added_at = time.perf_counter()
+
+    def first_frame(self):
+        if isinstance(self.source, discord.FFmpegAudio):
+            tracer.record("ffmpeg_first_frame",
+                          time.perf_counter() - self.added_at, self.trace_id)
+        if self.trace_id is not None:
+            # the first sound Billy makes in response to an utterance
+            tracer.finish_trace(self.trace_id)
+
+    def finish(self, error=None):
+        try:
+            self.source.cleanup()
+        except Exception as e:
+            print("Error cleaning up audio source: ", e)
+
+        if self.after is not None:
+            self.after(error)
+
+
+class MixerSource(discord.AudioSource):
+    """
+    A persistent audio source that sums a music layer, a speech layer and any
+    number of overlapping sound effects into one stream, so the voice client
+    plays (and encodes) a single source for its whole lifetime.
+
+    The music is ducked while Billy is speaking rather than paused, so the
+    stream keeps its position and sound effects no longer interrupt it.
+
+    Every buffer is allocated once. `read` runs on the voice client's player
+    thread, so layer changes are made under `lock`.
+    """
+
+    def __init__(self, duck_volume=0.25, duck_attack=0.1, duck_release=0.6, on_idle=None, on_active=None):
+        """
+        :param duck_volume: Music gain while speech is playing.
+        :param duck_attack: Seconds to fade the music down.
+        :param duck_release: Seconds to fade the music back up.
+        :param on_idle: Called (under `lock`) when nothing is left to play.
+        :param on_active: Called (under `lock`) when a layer is added to an
+            idle mixer.
+        """
+        self.lock = threading.Lock()
+        self.music = None
+        self.music_volume = 1.0
+        self.music_paused = False
+        self.speech = None
+        self.effects = []
+        # hold the duck between sentences that are queued back to back
+        self.keep_ducked = False
+
+        self.duck_volume = duck_volume
+        self.duck_step = (1 - duck_volume) / max(1, duck_attack * FRAMES_PER_SECOND)
+        self.release_step = (1 - duck_volume) / max(1, duck_release * FRAMES_PER_SECOND)
+        self.music_gain = 1.0
+
+        self.on_idle = on_idle
+        self.on_active = on_active
+        self.idle = True
+
+        self._frame = (ctypes.c_char * FRAME_BYTES)()
+        self._out = np.frombuffer(self._frame, dtype=np.int16)
+        self._mix = np.zeros(FRAME_SAMPLES, dtype=np.float32)
+        self._layer = np.zeros(FRAME_SAMPLES, dtype=np.float32)
+        # each layer's PCM is copied in here rather than wrapped in a new
+        # array every frame
+        self._pcm = bytearray(FRAME_BYTES)
+        self._samples = np.frombuffer(self._pcm, dtype=np.int16)
+        self._gain = np.zeros(FRAME_SAMPLES, dtype=np.float32)
+        self._ramp = np.linspace(0, 1, FRAME_SAMPLES, dtype=np.float32)
+
+    def _layers(self):
+        layers = []
+        if self.music is not None and not self.music_paused:
+            layers.append(self.music)
+        if self.speech is not None:
+            layers.append(self.speech)
+
+        return layers + self.effects
+
+    def _activate(self):
+        if self.idle and self._layers():
+            self.idle = False
+            if self.on_active is not None:
+                self.on_active()
+
+    def _replace(self, attr, layer):
+        with self.lock:
+            old = getattr(self, attr)
+            setattr(self, attr, layer)
+            self._activate()
+
+        if old is not None:
+            old.finish()
+
+    def play_music(self, source, after=None, trace_id=None):
+        self._replace("music", MixerLayer(
+            source, 1.0, after, trace_id=trace_id))
+
+    def play_speech(self, source, after=None, trace_id=None):
+        self._replace("speech", MixerLayer(
+            source, after=after, trace_id=trace_id))
+
+    def play_effect(self, source, after=None, max_duration=0, trace_id=None):
+        layer = MixerLayer(source, after=after,
+                           max_frames=int(max_duration * FRAMES_PER_SECOND),
+                           trace_id=trace_id)
+        with self.lock:
+            self.effects.append(layer)
+            self._activate()
+
+    def pause_music(self):
+        with self.lock:
+            self.music_paused = True
+
+    def resume_music(self):
+        with self.lock:
+            self.music_paused = False
+            self._activate()
+
+    def stop(self):
+        """
+        Drop every layer, running their `after` callbacks.
+        """
+        with self.lock:
+            layers = [self.music, self.speech] + self.effects
+            self.music = None
+            self.speech = None
+            self.effects = []
+            self.music_paused = False
+            # a stop between sentences shouldn't leave the next song ducked
+            self.keep_ducked = False
+            if not self.idle:
+                self.idle = True
+                if self.on_idle is not None:
+                    self.on_idle()
+
+        for layer in layers:
+            if layer is not None:
+                layer.finish()
+
+    def _update_music_gain(self):
+        start = self.music_gain
+        if self.speech is not None or self.keep_ducked:
+            self.music_gain = max(self.duck_volume, start - self.duck_step)
+        else:
+            self.music_gain = min(1.0, start + self.release_step)
+
+        # ramp across the frame so the gain change doesn't click
+        np.multiply(self._ramp, self.music_gain - start, out=self._gain)
+        np.add(self._gain, start, out=self._gain)
+        np.multiply(self._gain, self.music_volume, out=self._gain)
+
+    def _mix_layer(self, layer, gain=None) -> bool:
+        """
+        Add one frame of `layer` to the mix.
+
+        :return: False once the layer has finished.
+        """
+        if layer.max_frames and layer.frames >= layer.max_frames:
+            return False
+
+        data = layer.source.read()
+        if not data:
+            return False
+
+        if layer.frames == 0:
+            layer.first_frame()
+        layer.frames += 1
+        size = min(len(data), FRAME_BYTES) & ~1
+        self._pcm[:size] = memoryview(data)[:size]
+        n = size // 2
+
+        np.copyto(self._layer[:n], self._samples[:n])
+        if gain is None:
+            np.multiply(self._layer[:n], layer.volume, out=self._layer[:n])
+        else:
+            np.multiply(self._layer[:n], gain[:n], out=self._layer[:n])
+        np.add(self._mix[:n], self._layer[:n], out=self._mix[:n])
+
+        return n >= FRAME_SAMPLES
+
+    def read(self) -> bytes:
+        finished = []
+        with self.lock:
+            self._mix.fill(0)
+
+            if self.music is not None and not self.music_paused:
+                self._update_music_gain()
+                if not self._mix_layer(self.music, self._gain):
+                    finished.append(self.music)
+                    self.music = None
+
+            if self.speech is not None:
+                if not self._mix_layer(self.speech):
+                    finished.append(self.speech)
+                    self.speech = None
+
+            for effect in self.effects:
+                if not self._mix_layer(effect):
+                    finished.append(effect)
+
+            if finished:
+                self.effects = [
+                    effect for effect in self.effects if effect not in finished]
+
+            if not self.idle and not self._layers():
+                self.idle = True
+                if self.on_idle is not None:
+                    self.on_idle()
+
+            np.clip(self._mix, -32768, 32767, out=self._mix)
+            np.copyto(self._out, self._mix, casting="unsafe")
+
+        for layer in finished:
+            layer.finish()
+
+        # the encoder reads straight from this buffer
+        return self._frame
+
+    def cleanup(self):
+        self.stop()
@@ -0,0 +1,206 @@
+import asyncio
+import time
+
+CONTROL_LANE = "control"
+POST_LANE = "post"
+AUDIBLE_LANE = "audible"
+
+
+def lane_for(item):
+    item_type = item["type"]
+    if item_type == "volume":
+        return CONTROL_LANE
+    elif item_type == "youtube" and "video_id" not in item:
+        # stop / pause / resume
+        return CONTROL_LANE
+    elif item_type in ("discord_post", "discord_post.youtube"):
+        return POST_LANE
+
+    return AUDIBLE_LANE
+
+
+class LaneStats():
+    def __init__(self):
+        self.depth = 0
+        self.handled = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record_wait(self, wait):
+        self.handled += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
+    def as_dict(self):
+        return {
+            "depth": self.depth,
+            "handled": self.handled,
+            "avg_wait": round(self.total_wait / self.handled, 3) if self.handled else 0.0,
+            "max_wait": round(self.max_wait, 3),
+        }
+
+
+class ActionScheduler():
+    """
+    Dispatches action queue items into priority lanes:
+
+    - control (stop/pause/resume/volume) runs the moment it is dequeued
+    - post (Discord messages) runs in order, independent of audio
+    - audible (YouTube, sound effects, TTS) is prepared concurrently (yt-dlp,
+      synthesis, ffmpeg startup), but played strictly in the order it was
+      queued. At most `max_prepare` items are being prepared or waiting to
+      play at a time, a prepared item holds its slot until playback starts
+      or it's discarded, so the lookahead can't pile up ffmpeg processes.
+    """
+
+    def __init__(self, queue: asyncio.Queue, handler, max_prepare=3, report_every=20, name=None):
+        """
+        :param handler: Provides `handle_control(item)`,
+            `handle_post(item)`, `prepare_audible(item)` and
+            `play_audible(item, prepared, more_speech_queued)`.
+        """
+        self.queue = queue
+        self.handler = handler
+        self.prepare_slots = asyncio.Semaphore(max_prepare)
+        self.report_every = report_every
+        self.name = name
+
+        self.post_queue = asyncio.Queue()
+        self.audible_queue = asyncio.Queue()
+        # speech items waiting in the audible lane, lets playback hold music
+        # between consecutive sentences
+        self.queued_speech = 0
+        self.lanes = {
+            CONTROL_LANE: LaneStats(),
+            POST_LANE: LaneStats(),
+            AUDIBLE_LANE: LaneStats(),
+        }
+        self.dispatched = 0
+        self.current_preparation = None
+        self.flushes = 0
+
+    async def _prepare(self, item):
+        await self.prepare_slots.acquire()
+        try:
+            return await self.handler.prepare_audible(item)
+        except BaseException:
+            self.prepare_slots.release()
+            raise
+
+    def _record_start(self, lane, queued_at):
+        stats = self.lanes[lane]
+        stats.depth -= 1
+        stats.record_wait(time.monotonic() - queued_at)
+
+    async def _run_posts(self):
+        while True:
+            item, queued_at = await self.post_queue.get()
+            self._record_start(POST_LANE, queued_at)
+            try:
+                await self.handler.handle_post(item)
+            except Exception as e:
+                print(f"Error handling {item['type']} item: ", e)
+
+    async def _run_audible(self):
+        while True:
+            item, preparation, queued_at = await self.audible_queue.get()
+            if item["type"] == "tts":
+                self.queued_speech -= 1
+
+            self.current_preparation = preparation
+            flushes = self.flushes
+            # wait() doesn't raise if a stop cancels the preparation
+            await asyncio.wait([preparation])
+            self.current_preparation = None
+            self._record_start(AUDIBLE_LANE, queued_at)
+
+            if preparation.cancelled():
+                continue
+            elif flushes != self.flushes:
+                # stopped after it was prepared but before it played
+                self._cleanup_prepared(preparation)
+                continue
+            elif preparation.exception() is not None:
+                print(f"Error preparing {item['type']} item: ",
+                      preparation.exception())
+                continue
+
+            prepared = preparation.result()
+            self.prepare_slots.release()
+            try:
+                await self.handler.play_audible(item, prepared, self.queued_speech > 0)
+            except Exception as e:
+                print(f"Error playing {item['type']} item: ", e)
+
+    def _flush_audible(self):
+        """
+        Drop audible items that haven't started yet, "stop" shouldn't be
+        followed by a song that was still being resolved.
+        """
+        self.flushes += 1
+        if self.current_preparation is not None:
+            self.current_preparation.cancel()
+
+        while not self.audible_queue.empty():
+            item, preparation, _ = self.audible_queue.get_nowait()
+            preparation.cancel()
+            preparation.add_done_callback(self._cleanup_prepared)
+            self.lanes[AUDIBLE_LANE].depth -= 1
+            if item["type"] == "tts":
+                self.queued_speech -= 1
+
+    def _cleanup_prepared(self, preparation):
+        # kill the ffmpeg process of a source that will never be played,
+        # failed and cancelled preparations already gave their slot back
+        if preparation.cancelled() or preparation.exception() is not None:
+            return
+
+        self.prepare_slots.release()
+        prepared = preparation.result()
+        if hasattr(prepared, "cleanup"):
+            prepared.cleanup()
+
+    def _dispatch(self, item):
+        lane = lane_for(item)
+        queued_at = time.monotonic()
+        self.lanes[lane].depth += 1
+
+        if lane == CONTROL_LANE:
+            self._record_start(CONTROL_LANE, queued_at)
+            if item.get("stop"):
+                self._flush_audible()
+            try:
+                self.handler.handle_control(item)
+            except Exception as e:
+                print(f"Error handling {item['type']} item: ", e)
+        elif lane == POST_LANE:
+            self.post_queue.put_nowait((item, queued_at))
+        else:
+            if item["type"] == "tts":
+                self.queued_speech += 1
+            preparation = asyncio.create_task(self._prepare(item))
+            self.audible_queue.put_nowait((item, preparation, queued_at))
+
+    async def run(self):
+        workers = [
+            asyncio.create_task(self._run_posts()),
+            asyncio.create_task(self._run_audible()),
+        ]
+        try:
+            while True:
+                item = await self.queue.get()
+                if item is None:
+                    continue
+
+                self._dispatch(item)
+
+                self.dispatched += 1
+                if self.dispatched % self.report_every == 0:
+                    label = f" ({self.name})" if self.name else ""
+                    print(f"Action scheduler stats{label}:", self.stats())
+        finally:
+            for worker in workers:
+                worker.cancel()
+
+    def stats(self) -> dict:
+        return {lane: stats.as_dict() for lane, stats in self.lanes.items()}
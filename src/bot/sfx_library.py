@@ -0,0 +1,416 @@
+import json
+import math
+import os
+import random
+import re
+import struct
+import subprocess
+import sys
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import discord
+import numpy as np
+
+from src.bot.mixer import FRAME_BYTES
+
+SAMPLES_PER_FRAME = discord.opus.Encoder.SAMPLES_PER_FRAME
+CLIP_MAGIC = b"BSFX1"
+
+# libopus from Homebrew on Apple silicon, OPUS_LIBRARY points elsewhere
+DEFAULT_OPUS_LIBRARY = "/opt/homebrew/lib/libopus.dylib"
+
+# Words that say nothing about which sound is wanted
+STOPWORDS = {
+    "a", "an", "the", "of", "and", "with", "some", "me", "please", "play",
+    "sound", "sounds", "effect", "effects", "sfx", "noise", "noises",
+}
+
+# Samples quieter than -45 dBFS are trimmed from both ends of a clip
+SILENCE_LEVEL = 32768 * 10 ** (-45 / 20)
+# Clips are normalized to this loudness, without peaks over PEAK_LEVEL
+TARGET_RMS_DB = -20
+PEAK_LEVEL = 0.9 * 32767
+
+
+def stem(word):
+    for suffix in ("ing", "ed", "s"):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            word = word[:-len(suffix)]
+            break
+
+    # "horse" and "horses" both end up as "hors"
+    if word.endswith("e") and len(word) > 3:
+        word = word[:-1]
+
+    return word
+
+
+def tags_for(text) -> set:
+    return {stem(word) for word in re.findall(r"[a-z0-9]+", text.lower())
+            if word not in STOPWORDS}
+
+
+def prepare_pcm(pcm: bytes, max_seconds) -> np.ndarray:
+    """
+    Trim silence from both ends of 48kHz stereo int16 PCM, cut it to
+    `max_seconds` and normalize its loudness.
+
+    :return: Interleaved int16 samples, empty if the clip is silent.
+    """
+    samples = np.frombuffer(pcm[:len(pcm) - len(pcm) % 4], dtype=np.int16)
+    frames = samples.reshape(-1, 2).astype(np.float32)
+
+    loud = np.flatnonzero(np.abs(frames).max(axis=1) > SILENCE_LEVEL)
+    if len(loud) == 0:
+        return np.zeros(0, dtype=np.int16)
+
+    frames = frames[loud[0]:loud[-1] + 1][:int(max_seconds * 48000)]
+
+    rms = np.sqrt(np.mean(frames ** 2))
+    gain = 32768 * 10 ** (TARGET_RMS_DB / 20) / max(rms, 1.0)
+    gain = min(gain, PEAK_LEVEL / max(np.abs(frames).max(), 1.0))
+    frames *= gain
+
+    # fade out the last 10ms so a cut clip doesn't end with a click
+    fade = min(len(frames), 480)
+    frames[-fade:] *= np.linspace(1, 0, fade, dtype=np.float32)[:, None]
+
+    return frames.astype(np.int16).reshape(-1)
+
+
+def decode_with_ffmpeg(url, max_seconds, headers=None, timeout=60) -> bytes:
+    """
+    :return: The first `max_seconds` of `url` as 48kHz stereo int16 PCM.
+    """
+    args = ["ffmpeg", "-loglevel", "error"]
+    if headers:
+        args += ["-headers",
+                 "".join(f"{key}: {value}\r\n" for key, value in headers.items())]
+    args += ["-i", url, "-t", str(max_seconds), "-vn",
+             "-f", "s16le", "-ar", "48000", "-ac", "2", "-"]
+
+    result = subprocess.run(args, capture_output=True,
+                            timeout=timeout, check=True)
+    return result.stdout
+
+
+class OpusClipSource(discord.AudioSource):
+    """
+    Plays a stored clip by decoding its Opus frames in place, no ffmpeg
+    process or network involved.
+    """
+
+    def __init__(self, frames):
+        self.frames = frames
+        self.index = 0
+        self.decoder = discord.opus.Decoder()
+
+    def read(self) -> bytes:
+        if self.index >= len(self.frames):
+            return b""
+
+        # fec would decode the previous frame's redundancy, not this frame
+        pcm = self.decoder.decode(self.frames[self.index], fec=False)
+        self.index += 1
+        return pcm
+
+
+class SoundEffectLibrary():
+    """
+    Sound effects stored locally as trimmed, normalized Opus frames, looked up
+    by tags, so a known sound plays without a YouTube search, yt-dlp or
+    ffmpeg.
+
+    Queries are matched on their words (minus filler like "sound effect"),
+    weighted by how rare each word is in the library. Sound effects that
+    missed the library can be added in the background with `learn`.
+    """
+
+    def __init__(self, directory, max_seconds=5, match_threshold=0.5, learn_misses=True, clips_per_query=3, report_every=20):
+        """
+        :param match_threshold: Share of the query's (weighted) words a clip's
+            tags must cover to be played.
+        :param learn_misses: Add sound effects played from YouTube to the
+            library.
+        :param clips_per_query: Search results learned for a query that
+            missed, so it doesn't play the same clip every time after.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.index_path = os.path.join(directory, "index.json")
+        self.max_seconds = max_seconds
+        self.match_threshold = match_threshold
+        self.learn_misses = learn_misses
+        self.clips_per_query = clips_per_query
+        self.report_every = report_every
+
+        self.lock = threading.Lock()
+        self.learner = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="billy-sfx")
+        self.learning = set()
+
+        self.clips = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                self.clips = json.load(f)
+        self._reindex()
+
+        self.hits = 0
+        self.misses = 0
+        self.learned = 0
+
+    def _clip_path(self, clip_id):
+        return os.path.join(self.directory, clip_id + ".opus-frames")
+
+    def _reindex(self):
+        # with self.lock held, or before anyone else has the library
+        self.clip_tags = {clip_id: set(clip["tags"])
+                          for clip_id, clip in self.clips.items()}
+        self.tag_counts = {}
+        for tags in self.clip_tags.values():
+            for tag in tags:
+                self.tag_counts[tag] = self.tag_counts.get(tag, 0) + 1
+
+    def _save_index(self):
+        # with self.lock held
+        path = self.index_path + ".tmp"
+        with open(path, "w") as f:
+            json.dump(self.clips, f, indent=1)
+        os.replace(path, self.index_path)
+
+    def _weight(self, tag):
+        # rare words say more about the sound than common ones. Words no clip
+        # has count as rare, not rarer, so "crickets chirping" still finds a
+        # clip tagged "cricket".
+        return math.log((len(self.clips) + 1) / (max(self.tag_counts.get(tag, 0), 1) + 0.5))
+
+    def find(self, query):
+        """
+        :return: The ID of a clip matching `query`, or None. Picks randomly
+            between equally good matches.
+        """
+        query_tags = tags_for(query or "")
+
+        with self.lock:
+            best_score = 0.0
+            best = []
+            if query_tags and self.clips:
+                weights = {tag: self._weight(tag) for tag in query_tags}
+                total = sum(weights.values())
+                for clip_id, tags in self.clip_tags.items():
+                    score = sum(weights[tag] for tag in query_tags & tags) / total
+                    if score > best_score + 1e-9:
+                        best_score, best = score, [clip_id]
+                    elif score > 0 and abs(score - best_score) <= 1e-9:
+                        best.append(clip_id)
+
+            if best and best_score >= self.match_threshold:
+                self.hits += 1
+                clip_id = random.choice(best)
+            else:
+                self.misses += 1
+                clip_id = None
+
+            if (self.hits + self.misses) % self.report_every == 0:
+                print("Sound effect library stats:", self.stats())
+
+        return clip_id
+
+    def load(self, clip_id):
+        """
+        :return: An audio source for the clip, or None if it's unreadable.
+        """
+        frames = []
+        try:
+            with open(self._clip_path(clip_id), "rb") as f:
+                data = f.read()
+        except OSError as e:
+            print(f"Error reading sound effect {clip_id}: {e}")
+            self.remove(clip_id)
+            return None
+
+        if not data.startswith(CLIP_MAGIC):
+            print(f"Sound effect {clip_id} isn't a stored clip")
+            self.remove(clip_id)
+            return None
+
+        offset = len(CLIP_MAGIC)
+        while offset + 2 <= len(data):
+            (length,) = struct.unpack_from("<H", data, offset)
+            frames.append(data[offset + 2:offset + 2 + length])
+            offset += 2 + length
+
+        return discord.PCMVolumeTransformer(OpusClipSource(frames), volume=0.5)
+
+    def add_pcm(self, pcm: bytes, tags, title=None, source=None):
+        """
+        Trim, normalize, encode and store 48kHz stereo int16 PCM.
+
+        :param tags: Text describing the sound, e.g. the query that found it.
+        :return: The new clip's ID, or None if the audio was silent.
+        """
+        samples = prepare_pcm(pcm, self.max_seconds)
+        if len(samples) == 0:
+            return None
+
+        encoder = discord.opus.Encoder()
+        chunks = [CLIP_MAGIC]
+        data = samples.tobytes()
+        for start in range(0, len(data), FRAME_BYTES):
+            frame = data[start:start + FRAME_BYTES].ljust(FRAME_BYTES, b"\0")
+            packet = encoder.encode(frame, SAMPLES_PER_FRAME)
+            chunks.append(struct.pack("<H", len(packet)) + packet)
+
+        clip_id = uuid.uuid4().hex[:12]
+        with open(self._clip_path(clip_id), "wb") as f:
+            f.write(b"".join(chunks))
+
+        with self.lock:
+            self.clips[clip_id] = {
+                "tags": sorted(tags_for(tags)),
+                "title": title,
+                "source": source,
+                "seconds": round(len(samples) / 2 / 48000, 2),
+            }
+            self._reindex()
+            self._save_index()
+
+        return clip_id
+
+    def add_from_url(self, url, tags, title=None, source=None, headers=None):
+        """
+        Fetch the start of `url` (a file, or a stream URL from yt-dlp) with
+        ffmpeg and store it. Blocking.
+        """
+        pcm = decode_with_ffmpeg(url, self.max_seconds + 2, headers)
+        return self.add_pcm(pcm, tags, title, source or url)
+
+    def _learn_one(self, url, query, title, source, headers):
+        try:
+            if self.add_from_url(url, query, title, source, headers) is not None:
+                with self.lock:
+                    self.learned += 1
+                print(f"Added \"{query}\" to the sound effect library.")
+        except Exception as e:
+            print(f"Error adding \"{query}\" to the sound effect library: {e}")
+
+    def _stored_sources(self, tags):
+        # with self.lock held
+        return {self.clips[clip_id]["source"]
+                for clip_id, clip_tags in self.clip_tags.items() if clip_tags == tags}
+
+    def _learn(self, key, url, query, title, source, headers, candidates):
+        from src.bot.audio_source import YTDLSource
+
+        tags = tags_for(query)
+        try:
+            self._learn_one(url, query, title, source, headers)
+
+            for video_id in candidates:
+                with self.lock:
+                    stored = self._stored_sources(tags)
+                if len(stored) >= self.clips_per_query:
+                    break
+                elif video_id in stored:
+                    continue
+
+                try:
+                    data = YTDLSource.extract_info(
+                        f"https://www.youtube.com/watch?v={video_id}", stream=True)
+                except Exception as e:
+                    print(f"Error resolving sound effect {video_id}: {e}")
+                    continue
+
+                self._learn_one(data["url"], query, data.get("title"),
+                                video_id, data.get("http_headers"))
+        finally:
+            with self.lock:
+                self.learning.discard(key)
+
+    def learn(self, url, query, title=None, source=None, headers=None, candidates=()):
+        """
+        Add a sound effect that missed the library in the background, once
+        per query.
+
+        :param candidates: Video IDs of other search results for `query`.
+            Up to `clips_per_query` clips are learned in all, so `find` can
+            pick between them.
+        """
+        if not self.learn_misses or not tags_for(query or ""):
+            return
+
+        key = " ".join(sorted(tags_for(query)))
+        with self.lock:
+            if key in self.learning:
+                return
+            self.learning.add(key)
+
+        self.learner.submit(self._learn, key, url,
+                            query, title, source, headers, list(candidates))
+
+    def remove(self, clip_id):
+        with self.lock:
+            if self.clips.pop(clip_id, None) is None:
+                return
+            self._reindex()
+            self._save_index()
+
+        try:
+            os.remove(self._clip_path(clip_id))
+        except OSError:
+            pass
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "clips": len(self.clips),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "learned": self.learned,
+        }
+
+
+def main(args):
+    """
+    python -m src.bot.sfx_library DIR add <file or URL> <tags...>
+    python -m src.bot.sfx_library DIR list
+    python -m src.bot.sfx_library DIR remove <clip id>
+    """
+    if len(args) < 2:
+        print(main.__doc__)
+        return
+
+    library = SoundEffectLibrary(args[0])
+    command = args[1]
+
+    if command == "list":
+        for clip_id, clip in sorted(library.clips.items()):
+            print(f"{clip_id}  {clip['seconds']:>5}s  {' '.join(clip['tags'])}  ({clip['title']})")
+    elif command == "remove" and len(args) == 3:
+        library.remove(args[2])
+    elif command == "add" and len(args) >= 4:
+        # encoding needs libopus, found the same way the bot finds it
+        if not discord.opus.is_loaded():
+            from dotenv import load_dotenv
+            load_dotenv()
+            discord.opus.load_opus(os.getenv("OPUS_LIBRARY") or DEFAULT_OPUS_LIBRARY)
+
+        url, tags = args[2], " ".join(args[3:])
+        title = os.path.basename(url)
+        headers = None
+        if not os.path.exists(url):
+            from src.bot.audio_source import YTDLSource
+            data = YTDLSource.extract_info(url, stream=True)
+            url, title, headers = data["url"], data.get("title"), data.get("http_headers")
+
+        clip_id = library.add_from_url(url, tags, title, args[2], headers)
+        print(f"Added {clip_id}" if clip_id else "The clip is silent, nothing added.")
+    else:
+        print(main.__doc__)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
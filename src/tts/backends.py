@@ -0,0 +1,15 @@
+from src.tts.local import EspeakTTS, PiperTTS
+from src.tts.streamlabs import StreamlabsTTS
+
+TTS_BACKENDS = {
+    "streamlabs": StreamlabsTTS,
+    "piper": PiperTTS,
+    "espeak": EspeakTTS,
+}
+
+
+def create_tts(backend, voice, cache=None, **options):
+    if backend not in TTS_BACKENDS:
+        raise ValueError(f"Unknown TTS backend: {backend}")
+
+    return TTS_BACKENDS[backend](voice, cache, **options)
@@ -0,0 +1,48 @@
+import numpy as np
+
+# Discord voice expects 16-bit 48kHz stereo PCM
+DISCORD_SAMPLE_RATE = 48000
+DISCORD_CHANNELS = 2
+
+
+class SpeechAudio():
+    """
+    Synthesized speech, either as an audio file ffmpeg can read or as raw
+    PCM already in Discord's format.
+    """
+
+    def __init__(self, path=None, pcm=None):
+        self.path = path
+        self.pcm = pcm
+
+
+def to_discord_pcm(samples: np.ndarray, sample_rate: int) -> bytes:
+    """
+    Resample mono int16 samples to 48kHz stereo int16 bytes.
+    """
+    samples = samples.astype(np.float32)
+    if sample_rate != DISCORD_SAMPLE_RATE:
+        duration = len(samples) / sample_rate
+        target = np.linspace(0, len(samples) - 1,
+                             int(duration * DISCORD_SAMPLE_RATE))
+        samples = np.interp(target, np.arange(len(samples)), samples)
+
+    mono = np.clip(samples, -32768, 32767).astype(np.int16)
+    return np.repeat(mono, DISCORD_CHANNELS).tobytes()
+
+
+class TTSBackend():
+    """
+    Base class for speech engines. Engines are constructed per utterance with
+    a `StreamlabsVoice`, like `StreamlabsTTS`.
+    """
+
+    def __init__(self, voice, cache=None):
+        self.voice = voice
+        self.cache = cache
+
+    def synthesize(self, text) -> SpeechAudio:
+        """
+        :return: The synthesized speech, or None if synthesis failed.
+        """
+        raise NotImplementedError
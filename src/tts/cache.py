@@ -0,0 +1,71 @@
+import hashlib
+import os
+import threading
+
+
+class TTSCache():
+    """
+    Content-addressed on-disk cache of synthesized speech, keyed by
+    (voice, text). Least recently used files are evicted once the cache grows
+    past `max_bytes`.
+    """
+
+    def __init__(self, cache_dir, max_bytes=200 * 1024 * 1024, extension="mp3"):
+        self.directory = os.path.join(cache_dir, "tts")
+        self.max_bytes = max_bytes
+        self.extension = extension
+        self.lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+        self.hits = 0
+        self.misses = 0
+
+    def path_for(self, voice_name, text):
+        digest = hashlib.sha256(
+            f"{voice_name}\0{text}".encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{digest}.{self.extension}")
+
+    def get(self, voice_name, text):
+        path = self.path_for(voice_name, text)
+        try:
+            # bump the mtime so eviction is least-recently-used
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return path
+
+    def put(self, voice_name, text, audio: bytes):
+        path = self.path_for(voice_name, text)
+
+        # write then rename so a half-written file is never played
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(audio)
+        os.replace(tmp_path, path)
+
+        self._evict()
+        return path
+
+    def _evict(self):
+        with self.lock:
+            entries = []
+            total = 0
+            for entry in os.scandir(self.directory):
+                if entry.is_file() and entry.name.endswith(self.extension):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+
+                try:
+                    os.remove(path)
+                    total -= size
+                except FileNotFoundError:
+                    pass
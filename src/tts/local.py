@@ -0,0 +1,133 @@
+import io
+import json
+import os
+import subprocess
+import wave
+
+import numpy as np
+
+from src.tts.base import SpeechAudio, TTSBackend, to_discord_pcm
+from src.tts.streamlabs import StreamlabsVoice
+
+# Closest espeak-ng voice (language + variant) for each Streamlabs/Polly voice
+ESPEAK_VOICES = {
+    StreamlabsVoice.Nicole: "en-au+f3",
+    StreamlabsVoice.Mia: "es-419+f3",
+    StreamlabsVoice.Matthew: "en-us+m3",
+    StreamlabsVoice.Brian: "en-gb+m3",
+    StreamlabsVoice.Ivy: "en-us+f5",
+    StreamlabsVoice.Kimberly: "en-us+f2",
+    StreamlabsVoice.Amy: "en-gb+f3",
+    StreamlabsVoice.Marlene: "de+f3",
+    StreamlabsVoice.Zeina: "ar+f3",
+    StreamlabsVoice.Miguel: "es-419+m3",
+    StreamlabsVoice.Mathieu: "fr-fr+m3",
+    StreamlabsVoice.Justin: "en-us+m5",
+    StreamlabsVoice.Lucia: "es+f3",
+    StreamlabsVoice.Salli: "en-us+f4",
+    StreamlabsVoice.Aditi: "hi+f3",
+    StreamlabsVoice.Vitoria: "pt-br+f3",
+    StreamlabsVoice.Emma: "en-gb+f4",
+    StreamlabsVoice.Hans: "de+m3",
+    StreamlabsVoice.Kendra: "en-us+f1",
+}
+
+# Closest Piper voice model for each Streamlabs/Polly voice
+PIPER_VOICES = {
+    StreamlabsVoice.Nicole: "en_GB-jenny_dioco-medium",
+    StreamlabsVoice.Mia: "es_MX-claude-high",
+    StreamlabsVoice.Matthew: "en_US-ryan-medium",
+    StreamlabsVoice.Brian: "en_GB-alan-medium",
+    StreamlabsVoice.Ivy: "en_US-amy-medium",
+    StreamlabsVoice.Kimberly: "en_US-kristin-medium",
+    StreamlabsVoice.Amy: "en_GB-jenny_dioco-medium",
+    StreamlabsVoice.Marlene: "de_DE-eva_k-x_low",
+    StreamlabsVoice.Zeina: "ar_JO-kareem-medium",
+    StreamlabsVoice.Miguel: "es_MX-ald-medium",
+    StreamlabsVoice.Mathieu: "fr_FR-tom-medium",
+    StreamlabsVoice.Justin: "en_US-joe-medium",
+    StreamlabsVoice.Lucia: "es_ES-sharvard-medium",
+    StreamlabsVoice.Salli: "en_US-lessac-medium",
+    StreamlabsVoice.Aditi: "en_US-lessac-medium",
+    StreamlabsVoice.Vitoria: "pt_BR-faber-medium",
+    StreamlabsVoice.Emma: "en_GB-cori-medium",
+    StreamlabsVoice.Hans: "de_DE-thorsten-medium",
+    StreamlabsVoice.Kendra: "en_US-hfc_female-medium",
+}
+
+DEFAULT_PIPER_VOICE = "en_US-lessac-medium"
+
+
+class EspeakTTS(TTSBackend):
+    """
+    Offline speech with espeak-ng. Robotic, but tiny, instant and available
+    from every distro's package manager.
+    """
+
+    def __init__(self, voice=StreamlabsVoice.Justin, cache=None, binary="espeak-ng"):
+        super().__init__(voice, cache)
+        self.binary = binary
+
+    def synthesize(self, text) -> SpeechAudio:
+        if text is None:
+            return None
+
+        print("Speaking: ", text)
+
+        try:
+            # the text goes in on stdin, as an argument a reply like
+            # "-5 degrees" would be read as an option
+            res = subprocess.run(
+                [self.binary, "-v", ESPEAK_VOICES.get(self.voice, "en-us"),
+                 "--stdout", "--stdin"],
+                input=text.encode("utf-8"), capture_output=True, check=True, timeout=10)
+
+            with wave.open(io.BytesIO(res.stdout), "rb") as wf:
+                samples = np.frombuffer(
+                    wf.readframes(wf.getnframes()), dtype=np.int16)
+                return SpeechAudio(pcm=to_discord_pcm(samples, wf.getframerate()))
+        except Exception as e:
+            print("Error running espeak-ng: ", e)
+            return None
+
+
+class PiperTTS(TTSBackend):
+    """
+    Offline neural speech with Piper. Expects `<voice>.onnx` and
+    `<voice>.onnx.json` model files in `voices_dir`.
+    """
+
+    def __init__(self, voice=StreamlabsVoice.Justin, cache=None, voices_dir="voices", binary="piper"):
+        super().__init__(voice, cache)
+        self.voices_dir = voices_dir
+        self.binary = binary
+
+    def _model_path(self):
+        for name in (PIPER_VOICES.get(self.voice), DEFAULT_PIPER_VOICE):
+            path = os.path.join(self.voices_dir, f"{name}.onnx")
+            if name and os.path.exists(path):
+                return path
+
+        raise FileNotFoundError(
+            f"No Piper model for {self.voice.name} in {self.voices_dir}")
+
+    def synthesize(self, text) -> SpeechAudio:
+        if text is None:
+            return None
+
+        print("Speaking: ", text)
+
+        try:
+            model_path = self._model_path()
+            with open(f"{model_path}.json") as f:
+                sample_rate = json.load(f)["audio"]["sample_rate"]
+
+            res = subprocess.run(
+                [self.binary, "--model", model_path, "--output-raw"],
+                input=text.encode("utf-8"), capture_output=True, check=True, timeout=30)
+
+            samples = np.frombuffer(res.stdout, dtype=np.int16)
+            return SpeechAudio(pcm=to_discord_pcm(samples, sample_rate))
+        except Exception as e:
+            print("Error running Piper: ", e)
+            return None
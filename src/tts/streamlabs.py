@@ -1,6 +1,8 @@
-import requests
 from enum import Enum
 
+from src.tts.base import SpeechAudio, TTSBackend
+from src.utils.http import shared_transport
+
 
 class StreamlabsVoice(Enum):
     Nicole = 0
@@ -24,9 +26,10 @@ class StreamlabsVoice(Enum):
     Kendra = 57
 
 
-class StreamlabsTTS():
-    def __init__(self, voice=StreamlabsVoice.Justin):
-        self.voice = voice
+class StreamlabsTTS(TTSBackend):
+    def __init__(self, voice=StreamlabsVoice.Justin, cache=None, http=None):
+        super().__init__(voice, cache)
+        self.http = http or shared_transport()
 
     def get_url(self, text):
         if text is None:
@@ -41,9 +44,41 @@ class StreamlabsTTS():
 
             print("Speaking: ", text)
 
-            res = requests.post(url, data=payload)
+            res = self.http.post(url, data=payload)
             return res.json()['speak_url']
 
         except Exception as e:
             print("Error getting Streamlabs TTS URL: ", e)
             return None
+
+    def get_file(self, text):
+        """
+        Get a local MP3 file of `text`, synthesizing and caching it if needed.
+
+        :return: The path to the MP3 file, or None if synthesis failed.
+        """
+        if text is None:
+            return None
+
+        path = self.cache.get(self.voice.name, text)
+        if path is not None:
+            return path
+
+        mp3_url = self.get_url(text)
+        if mp3_url is None:
+            return None
+
+        try:
+            res = self.http.get(mp3_url)
+            res.raise_for_status()
+            return self.cache.put(self.voice.name, text, res.content)
+        except Exception as e:
+            print("Error downloading Streamlabs TTS audio: ", e)
+            return None
+
+    def synthesize(self, text) -> SpeechAudio:
+        path = self.get_file(text)
+        if path is None:
+            return None
+
+        return SpeechAudio(path=path)
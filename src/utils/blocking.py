@@ -0,0 +1,65 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from src.utils.tracing import tracer
+
+# Seconds to wait on each external client before giving up
+DEFAULT_TIMEOUTS = {
+    "tool_picker": 10,
+    "response_author": 15,
+    "wolfram": 10,
+    "youtube": 8,
+    "giphy": 5,
+    "tts": 10,
+}
+
+
+class BlockingCallRunner():
+    """
+    Runs blocking network clients on a bounded thread pool so they never
+    stall the event loop (Discord heartbeat, audio queue, action processor).
+
+    Every call gets a timeout. On timeout or cancellation the awaiting task
+    moves on right away. The worker thread finishes in the background and
+    its result is discarded.
+    """
+
+    def __init__(self, max_workers=8, timeouts=None):
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="billy-io")
+        self.timeouts = dict(DEFAULT_TIMEOUTS, **(timeouts or {}))
+
+    async def run(self, name, fn, *args, **kwargs):
+        """
+        Run `fn(*args, **kwargs)` in the pool.
+
+        :param name: The kind of call, used to pick the timeout and to name
+            its tracing span.
+        :raises asyncio.TimeoutError: If the call takes longer than its timeout.
+        """
+        with tracer.span(name):
+            return await self._run(name, fn, *args, **kwargs)
+
+    async def _run(self, name, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(
+            self.executor, lambda: fn(*args, **kwargs))
+
+        return await asyncio.wait_for(future, timeout=self.timeouts.get(name))
+
+    async def iterate(self, name, fn, *args, **kwargs):
+        """
+        Consume the blocking iterator returned by `fn(*args, **kwargs)` as an
+        async generator. Each step gets the timeout for `name`.
+        """
+        iterator = iter(fn(*args, **kwargs))
+        done = object()
+        with tracer.span(name):
+            while True:
+                item = await self._run(name, next, iterator, done)
+                if item is done:
+                    return
+                yield item
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
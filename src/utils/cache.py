@@ -0,0 +1,105 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+
+class TTLCache():
+    """
+    A size-bounded LRU cache whose entries expire after a TTL.
+
+    `get_or_compute` also coalesces concurrent requests for the same key, so
+    only one upstream call is made while it is in flight.
+    """
+
+    def __init__(self, max_size=512, ttl=3600, name="cache"):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.name = name
+        # key -> (value, expires_at, seconds it took to compute)
+        self.entries = OrderedDict()
+        self.in_flight = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.saved_seconds = 0.0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+
+        value, expires_at, compute_seconds = entry
+        if expires_at < time.monotonic():
+            del self.entries[key]
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        self.saved_seconds += compute_seconds
+        return value
+
+    def set(self, key, value, ttl=None, compute_seconds=0.0):
+        ttl = self.ttl if ttl is None else ttl
+        self.entries[key] = (value, time.monotonic() + ttl, compute_seconds)
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, key):
+        self.entries.pop(key, None)
+
+    async def get_or_compute(self, key, compute, should_cache=None, ttl=None):
+        """
+        :param compute: A zero-argument callable returning an awaitable.
+        :param should_cache: Optional predicate on the result, falsy results
+            are returned but not stored.
+        :param ttl: Either a number of seconds or a callable taking the result.
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        if key in self.in_flight:
+            self.coalesced += 1
+            return await asyncio.shield(self.in_flight[key])
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self.in_flight[key] = future
+
+        started_at = time.monotonic()
+        try:
+            value = await compute()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # nobody may be waiting on it, don't warn about that
+            future.exception()
+            raise
+        finally:
+            self.in_flight.pop(key, None)
+
+        future.set_result(value)
+
+        if value is not None and (should_cache is None or should_cache(value)):
+            if callable(ttl):
+                ttl = ttl(value)
+            self.set(key, value, ttl, time.monotonic() - started_at)
+
+        return value
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "name": self.name,
+            "size": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "saved_seconds": round(self.saved_seconds, 2),
+        }
@@ -0,0 +1,67 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class DiskStore():
+    """
+    A tiny persistent key/value store with per-entry expiry, backed by SQLite.
+    Values are stored as JSON. Safe to use from the executor threads.
+    """
+
+    def __init__(self, path, table="entries"):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        if not table.isidentifier():
+            raise ValueError(f"Invalid table name: {table}")
+
+        self.table = table
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)")
+            self.conn.commit()
+
+    def get(self, key):
+        with self.lock:
+            row = self.conn.execute(
+                f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)).fetchone()
+
+        if row is None:
+            return None
+
+        value, expires_at = row
+        if expires_at < time.time():
+            self.delete(key)
+            return None
+
+        return json.loads(value)
+
+    def set(self, key, value, ttl=None, expires_at=None):
+        if expires_at is None:
+            expires_at = time.time() + ttl
+
+        with self.lock:
+            self.conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), expires_at))
+            self.conn.commit()
+
+    def delete(self, key):
+        with self.lock:
+            self.conn.execute(
+                f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            self.conn.commit()
+
+    def purge_expired(self):
+        with self.lock:
+            self.conn.execute(
+                f"DELETE FROM {self.table} WHERE expires_at < ?", (time.time(),))
+            self.conn.commit()
@@ -0,0 +1,183 @@
+import random
+import threading
+import time
+
+import httpx
+
+# Responses worth retrying, the server is overloaded or asked us to back off.
+# Only idempotent requests are retried on these, a POST that timed out at a
+# gateway may still have been processed, unless the server said to retry
+# (429, or a Retry-After header).
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Failures where the request never reached the server, safe to retry for any
+# method. Other transport errors are only retried for idempotent methods.
+UNSENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+# Longest Retry-After we'll honor, anything longer isn't worth the wait
+MAX_RETRY_AFTER = 2.0
+
+
+def http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+
+    return True
+
+
+class HttpTransport():
+    """
+    One pooled HTTP client shared by every external service (Streamlabs,
+    Giphy, Wolfram, YouTube, OpenAI), so connections and TLS sessions are
+    reused across voice commands instead of being set up on every call.
+
+    The clients run on the BlockingCallRunner's threads, so this wraps
+    httpx's thread-safe blocking client. Each host gets at most
+    `max_per_host` requests in flight, and failed requests are retried with
+    jittered exponential backoff.
+    """
+
+    def __init__(self, max_connections=32, max_per_host=8, timeout=10.0, connect_timeout=3.0,
+                 retries=2, backoff=0.2, http2=True, transport=None):
+        """
+        :param http2: Use HTTP/2 with servers that support it. Needs the h2
+            package (httpx[http2]).
+        :param retries: Retries after the first attempt.
+        :param backoff: Base delay in seconds, doubled on every retry.
+        :param transport: An httpx transport to send requests through
+            instead of the network, e.g. httpx.MockTransport.
+        """
+        if http2 and not http2_available():
+            print("h2 is not installed, using HTTP/1.1. Install httpx[http2] for HTTP/2.")
+            http2 = False
+
+        self.client = httpx.Client(
+            http2=http2,
+            timeout=httpx.Timeout(timeout, connect=connect_timeout),
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                keepalive_expiry=60),
+            follow_redirects=True,
+            transport=transport)
+        self.max_per_host = max_per_host
+        self.retries = retries
+        self.backoff = backoff
+
+        self.host_slots = {}
+        self.lock = threading.Lock()
+
+        self.requests = 0
+        self.retried = 0
+        self.failures = 0
+
+    def _slots(self, host) -> threading.BoundedSemaphore:
+        with self.lock:
+            slots = self.host_slots.get(host)
+            if slots is None:
+                slots = threading.BoundedSemaphore(self.max_per_host)
+                self.host_slots[host] = slots
+
+            return slots
+
+    def _delay(self, attempt, response=None) -> float:
+        if response is not None:
+            try:
+                retry_after = float(response.headers.get("Retry-After", ""))
+                return min(retry_after, MAX_RETRY_AFTER)
+            except ValueError:
+                pass
+
+        # full jitter, so clients that failed together don't retry together
+        return random.uniform(0, self.backoff * 2 ** attempt)
+
+    def _retry_status(self, method, response) -> bool:
+        if response.status_code not in RETRY_STATUSES:
+            return False
+
+        return method in IDEMPOTENT_METHODS or response.status_code == 429 \
+            or "Retry-After" in response.headers
+
+    def request(self, method, url, retries=None, **kwargs) -> httpx.Response:
+        """
+        Send a request through the shared pool. Responses with retryable
+        statuses are returned once retries run out, other errors are raised.
+        Non-idempotent requests are only retried when they can't have been
+        processed, or the server asked for a retry.
+
+        :param retries: Override the transport's retry count, 0 to disable.
+        :raises httpx.HTTPError: If the request can't be completed.
+        """
+        method = method.upper()
+        retries = self.retries if retries is None else retries
+        slots = self._slots(httpx.URL(url).host)
+
+        for attempt in range(retries + 1):
+            with self.lock:
+                self.requests += 1
+
+            response = None
+            try:
+                with slots:
+                    response = self.client.request(method, url, **kwargs)
+                if not self._retry_status(method, response) or attempt == retries:
+                    return response
+            except httpx.TransportError as e:
+                retryable = isinstance(e, UNSENT_ERRORS) or method in IDEMPOTENT_METHODS
+                if not retryable or attempt == retries:
+                    with self.lock:
+                        self.failures += 1
+                    raise
+
+            with self.lock:
+                self.retried += 1
+            time.sleep(self._delay(attempt, response))
+
+    def get(self, url, **kwargs) -> httpx.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs) -> httpx.Response:
+        return self.request("POST", url, **kwargs)
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "retried": self.retried,
+            "failures": self.failures,
+        }
+
+    def close(self):
+        self.client.close()
+
+
+_shared_transport = None
+_shared_lock = threading.Lock()
+
+
+def configure_shared_transport(**options) -> HttpTransport:
+    """
+    Set up the transport returned by `shared_transport`, with
+    `HttpTransport` options. Call before any client uses it.
+    """
+    global _shared_transport
+    with _shared_lock:
+        if _shared_transport is not None:
+            _shared_transport.close()
+        _shared_transport = HttpTransport(**options)
+
+        return _shared_transport
+
+
+def shared_transport() -> HttpTransport:
+    """
+    :return: The process wide transport, created with defaults on first use.
+    """
+    global _shared_transport
+    with _shared_lock:
+        if _shared_transport is None:
+            _shared_transport = HttpTransport()
+
+        return _shared_transport
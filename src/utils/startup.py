@@ -0,0 +1,42 @@
+import contextlib
+import time
+
+from src.utils.tracing import tracer
+
+
+class StartupTimer():
+    """
+    Logs how long each startup phase takes, and when milestones like the
+    Discord login are reached, so restarts can be held to a time budget.
+    Phases are also recorded as `startup.<name>` spans.
+    """
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.phases = {}
+        self.milestones = {}
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started_at
+            self.phases[name] = elapsed
+            tracer.record(f"startup.{name}", elapsed)
+            print(f"Startup: {name} took {elapsed:.2f}s")
+
+    def mark(self, name):
+        """
+        Record that startup reached `name`, once.
+        """
+        if name in self.milestones:
+            return
+
+        elapsed = time.perf_counter() - self.started_at
+        self.milestones[name] = elapsed
+        print(f"Startup: {name} after {elapsed:.2f}s")
+
+
+startup = StartupTimer()
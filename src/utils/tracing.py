@@ -0,0 +1,225 @@
+import asyncio
+import collections
+import contextlib
+import contextvars
+import json
+import threading
+import time
+import uuid
+
+# Upper bounds (seconds) of the histogram buckets, Prometheus style
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# How many unfinished traces to remember, most never reach the speaker
+MAX_OPEN_TRACES = 1000
+
+# The trace of the utterance being handled by the current task. Tasks copy it
+# when they're created, so spans deep in the pipeline pick it up on their own.
+current_trace_id = contextvars.ContextVar("current_trace_id", default=None)
+
+
+class TracedAudio(bytes):
+    """
+    Raw audio that remembers the trace it started. Still plain bytes to
+    everything that reads it.
+    """
+    trace_id = None
+
+
+class Histogram():
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                return
+
+        self.counts[-1] += 1
+
+    def quantile(self, q):
+        """
+        Estimate a quantile by interpolating inside its bucket, the same way
+        Prometheus' histogram_quantile does.
+        """
+        if self.count == 0:
+            return None
+
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for count, upper in zip(self.counts, BUCKETS + (float("inf"),)):
+            if seen + count >= rank and count > 0:
+                if upper == float("inf"):
+                    return lower
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+            lower = upper
+
+        return lower
+
+
+class Tracer():
+    """
+    Records how long each stage of the voice-to-action pipeline takes.
+
+    Spans are grouped by trace, one per utterance, starting when audio is
+    received. Every span goes into a per-stage histogram, served in
+    Prometheus' text format by `serve`, and optionally into a JSON lines log.
+    Safe to use from worker and audio threads.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = collections.defaultdict(Histogram)
+        self.trace_starts = collections.OrderedDict()
+        self.log_file = None
+        self.log_stdout = False
+        # callables(name, duration, trace_id) that want every span, e.g. the
+        # replay benchmark
+        self.listeners = []
+
+    def configure(self, log_path=None):
+        """
+        :param log_path: File to append JSON span logs to, "-" for stdout,
+            None to skip logging.
+        """
+        if log_path == "-":
+            self.log_stdout = True
+        elif log_path:
+            self.log_file = open(log_path, "a", buffering=1)
+
+    def start_trace(self) -> str:
+        trace_id = uuid.uuid4().hex[:16]
+        with self.lock:
+            self.trace_starts[trace_id] = time.perf_counter()
+            while len(self.trace_starts) > MAX_OPEN_TRACES:
+                self.trace_starts.popitem(last=False)
+
+        return trace_id
+
+    def finish_trace(self, trace_id, name="voice_to_audio"):
+        """
+        Record the time from the trace's first audio to now, once.
+        """
+        with self.lock:
+            started_at = self.trace_starts.pop(trace_id, None)
+
+        if started_at is not None:
+            self.record(name, time.perf_counter() - started_at, trace_id)
+
+    def record(self, name, duration, trace_id=None, **attrs):
+        if trace_id is None:
+            trace_id = current_trace_id.get()
+
+        with self.lock:
+            self.histograms[name].observe(duration)
+
+        for listener in self.listeners:
+            listener(name, duration, trace_id)
+
+        if self.log_file is None and not self.log_stdout:
+            return
+
+        line = json.dumps({
+            "ts": round(time.time(), 3),
+            "trace_id": trace_id,
+            "span": name,
+            "duration_ms": round(duration * 1000, 2),
+            **attrs,
+        })
+        if self.log_file is not None:
+            with self.lock:
+                self.log_file.write(line + "\n")
+        else:
+            print(line)
+
+    @contextlib.contextmanager
+    def span(self, name, trace_id=None, **attrs):
+        started_at = time.perf_counter()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            if error is not None:
+                attrs["error"] = error
+            self.record(name, time.perf_counter() - started_at, trace_id, **attrs)
+
+    def summary(self) -> dict:
+        """
+        :return: p50 and p99 in milliseconds for every stage seen so far.
+        """
+        with self.lock:
+            return {
+                name: {
+                    "count": histogram.count,
+                    "p50_ms": round(histogram.quantile(0.5) * 1000, 1),
+                    "p99_ms": round(histogram.quantile(0.99) * 1000, 1),
+                }
+                for name, histogram in self.histograms.items()
+            }
+
+    def render_prometheus(self) -> str:
+        lines = [
+            "# HELP billy_span_seconds Time spent in each pipeline stage.",
+            "# TYPE billy_span_seconds histogram",
+        ]
+        with self.lock:
+            for name, histogram in sorted(self.histograms.items()):
+                cumulative = 0
+                for count, bound in zip(histogram.counts, BUCKETS + (float("inf"),)):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(
+                        f'billy_span_seconds_bucket{{span="{name}",le="{le}"}} {cumulative}')
+                lines.append(
+                    f'billy_span_seconds_sum{{span="{name}"}} {histogram.sum}')
+                lines.append(
+                    f'billy_span_seconds_count{{span="{name}"}} {histogram.count}')
+
+        return "\n".join(lines) + "\n"
+
+    async def _handle_request(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            # drain the headers, we only care about the path
+            while (await reader.readline()).strip():
+                pass
+
+            parts = request_line.decode("latin-1").split()
+            if len(parts) >= 2 and parts[1] == "/metrics":
+                status, body = "200 OK", self.render_prometheus()
+            else:
+                status, body = "404 Not Found", "Not found\n"
+
+            payload = body.encode("utf-8")
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                "Content-Type: text/plain; version=0.0.4\r\n"
+                f"Content-Length: {len(payload)}\r\n"
+                "Connection: close\r\n\r\n".encode("latin-1") + payload)
+            await writer.drain()
+        except Exception as e:
+            print("Error serving metrics: ", e)
+        finally:
+            writer.close()
+
+    async def serve(self, port, host="127.0.0.1"):
+        """
+        Serve the histograms on http://host:port/metrics.
+        """
+        server = await asyncio.start_server(self._handle_request, host, port)
+        print(f"Serving metrics on http://{host}:{port}/metrics")
+        async with server:
+            await server.serve_forever()
+
+
+tracer = Tracer()
@@ -0,0 +1,290 @@
+import os
+
+import numpy as np
+
+# Whisper works on 30 second windows, anything shorter is padded
+WINDOW_SAMPLES = 30 * 16000
+
+# Opt-in prompt that biases the decoder towards the tool vocabulary. It
+# leaves out the wake phrases on purpose: Whisper tends to repeat its prompt
+# when fed silence or noise, which would read as a wake word.
+VOCABULARY_PROMPT = (
+    "YouTube, Wolfram Alpha, Discord, GIF, sound effect, volume up, "
+    "volume down, pause, resume, stop, shuffle."
+)
+
+
+class ASRBackend():
+    """
+    Base class for speech recognition engines.
+
+    `transcribe` takes mono float32 audio at 16kHz and returns a Whisper-style
+    dict: {"text": str, "segments": [{"text": str, "start": float, "end": float}]}
+    """
+
+    def __init__(self, model="medium", language="en", beam_size=None,
+                 quantization=None, threads=0, initial_prompt=None,
+                 model_dir=None):
+        """
+        :param initial_prompt: Text every decode is conditioned on, e.g.
+            `VOCABULARY_PROMPT`. None decodes without a prompt.
+        :param model_dir: Where downloaded weights are cached, None for the
+            engine's default.
+        """
+        self.model_name = model
+        self.language = language
+        self.beam_size = beam_size
+        self.quantization = quantization
+        self.threads = threads
+        self.initial_prompt = initial_prompt
+        self.model_dir = model_dir
+        self.model = None
+
+    def _resolve_model_name(self):
+        # English-only models are faster and more accurate for English, but
+        # there is no large.en
+        if self.language == "en" and not self.model_name.startswith("large") \
+                and not self.model_name.endswith(".en"):
+            return self.model_name + ".en"
+
+        return self.model_name
+
+    def _prompt(self, initial_prompt=None):
+        prompts = [p for p in (self.initial_prompt, initial_prompt) if p]
+        return " ".join(prompts) or None
+
+    def load(self):
+        raise NotImplementedError
+
+    def transcribe(self, audio_np, initial_prompt=None) -> dict:
+        raise NotImplementedError
+
+    def warm_up(self):
+        """
+        Decode a second of silence, so lazy initialization (kernels, memory
+        pools, the tokenizer) happens before the first command.
+        """
+        self.transcribe(np.zeros(16000, dtype=np.float32))
+
+    def transcribe_batch(self, audios, initial_prompt=None) -> list:
+        """
+        Transcribe several utterances, in one forward pass where the engine
+        supports it.
+
+        :return: One `transcribe` style dict per utterance, in order.
+        """
+        return [self.transcribe(audio_np, initial_prompt) for audio_np in audios]
+
+    def _single_segment_result(self, text, audio_np) -> dict:
+        # batched decodes run without timestamps, so there's one segment
+        return {
+            "text": text,
+            "segments": [
+                {"text": text, "start": 0.0, "end": len(audio_np) / 16000},
+            ],
+        }
+
+
+class WhisperBackend(ASRBackend):
+    """
+    The reference openai-whisper implementation (PyTorch).
+    """
+
+    def load(self):
+        import torch
+        import whisper
+
+        if self.threads:
+            torch.set_num_threads(self.threads)
+
+        self.fp16 = torch.cuda.is_available()
+        self.model = whisper.load_model(
+            self._cached_checkpoint(whisper), download_root=self.model_dir)
+
+        if self.quantization == "int8":
+            if self.fp16:
+                print("ASR_QUANTIZATION=int8 only applies on CPU, using fp16 on the GPU.")
+            else:
+                self._quantize(torch, whisper)
+
+    def _quantize(self, torch, whisper):
+        """
+        Dynamic int8 quantization of the linear layers, a cheap CPU win.
+        """
+        # Whisper builds its layers from its own nn.Linear subclass, which
+        # quantize_dynamic neither matches nor knows how to convert. The
+        # subclass only casts weights for fp16, so plain nn.Linear is the
+        # same layer on CPU.
+        for module in self.model.modules():
+            if isinstance(module, whisper.model.Linear):
+                module.__class__ = torch.nn.Linear
+
+        self.model = torch.quantization.quantize_dynamic(
+            self.model, {torch.nn.Linear}, dtype=torch.qint8)
+
+        quantized = sum(
+            1 for module in self.model.modules()
+            if isinstance(module, torch.ao.nn.quantized.dynamic.Linear))
+        if quantized == 0:
+            print("int8 quantization left no quantized layers, running in fp32.")
+        else:
+            print(f"Quantized {quantized} linear layers to int8.")
+
+    def _cached_checkpoint(self, whisper):
+        """
+        :return: The path of the already downloaded checkpoint, or the model
+            name to download it. `load_model` re-hashes a cached checkpoint
+            on every start, loading it by path skips that.
+        """
+        name = self._resolve_model_name()
+        url = whisper._MODELS.get(name)
+        if url is None:
+            return name
+
+        default_root = os.path.join(os.getenv("XDG_CACHE_HOME", os.path.join(
+            os.path.expanduser("~"), ".cache")), "whisper")
+        path = os.path.join(self.model_dir or default_root,
+                            os.path.basename(url))
+        return path if os.path.isfile(path) else name
+
+    def transcribe(self, audio_np, initial_prompt=None) -> dict:
+        options = {
+            "fp16": self.fp16,
+            "language": self.language,
+            "initial_prompt": self._prompt(initial_prompt),
+        }
+        if self.beam_size:
+            options["beam_size"] = self.beam_size
+
+        result = self.model.transcribe(audio_np, **options)
+        return {
+            "text": result["text"],
+            "segments": [
+                {"text": s["text"], "start": s["start"], "end": s["end"]}
+                for s in result["segments"]
+            ],
+        }
+
+    def transcribe_batch(self, audios, initial_prompt=None) -> list:
+        import torch
+        import whisper
+
+        if len(audios) == 1 or any(len(a) > WINDOW_SAMPLES for a in audios):
+            return super().transcribe_batch(audios, initial_prompt)
+
+        # every input is padded to 30s anyway, so stacking commands is free
+        mels = torch.stack([
+            whisper.log_mel_spectrogram(
+                whisper.pad_or_trim(torch.from_numpy(audio_np)),
+                self.model.dims.n_mels)
+            for audio_np in audios
+        ]).to(self.model.device)
+
+        options = whisper.DecodingOptions(
+            language=self.language,
+            fp16=self.fp16,
+            prompt=self._prompt(initial_prompt),
+            beam_size=self.beam_size,
+            without_timestamps=True,
+        )
+        results = whisper.decode(self.model, mels, options)
+
+        return [
+            self._single_segment_result(result.text.strip(), audio_np)
+            for result, audio_np in zip(results, audios)
+        ]
+
+
+class FasterWhisperBackend(ASRBackend):
+    """
+    CTranslate2 based faster-whisper, several times faster than openai-whisper
+    on CPU, especially with int8 weights.
+    """
+
+    def load(self):
+        from faster_whisper import WhisperModel
+        from huggingface_hub.utils import LocalEntryNotFoundError
+
+        options = {
+            "device": "auto",
+            "compute_type": self.quantization or "default",
+            "cpu_threads": self.threads,
+            "download_root": self.model_dir,
+        }
+        name = self._resolve_model_name()
+        try:
+            # skip asking the Hugging Face hub for updates when the weights
+            # are already cached
+            self.model = WhisperModel(name, local_files_only=True, **options)
+        except LocalEntryNotFoundError as e:
+            # anything else (compute type, CUDA, memory) would fail the same
+            # way after a download, so only a missing model falls through
+            print(f"Whisper model {name} isn't cached, downloading it: {e}")
+            self.model = WhisperModel(name, **options)
+
+    def transcribe(self, audio_np, initial_prompt=None) -> dict:
+        segments, _ = self.model.transcribe(
+            audio_np,
+            language=self.language,
+            beam_size=self.beam_size or 5,
+            initial_prompt=self._prompt(initial_prompt),
+            # the recorder already cuts on silence, don't let context leak
+            # between unrelated commands
+            condition_on_previous_text=False,
+        )
+
+        # segments is a lazy generator, decoding happens here
+        segments = [
+            {"text": s.text, "start": s.start, "end": s.end} for s in segments
+        ]
+        return {
+            "text": "".join(s["text"] for s in segments),
+            "segments": segments,
+        }
+
+    def transcribe_batch(self, audios, initial_prompt=None) -> list:
+        from faster_whisper.audio import pad_or_trim
+        from faster_whisper.tokenizer import Tokenizer
+
+        if len(audios) == 1 or any(len(a) > WINDOW_SAMPLES for a in audios):
+            return super().transcribe_batch(audios, initial_prompt)
+
+        tokenizer = Tokenizer(
+            self.model.hf_tokenizer, self.model.model.is_multilingual,
+            task="transcribe", language=self.language)
+
+        previous_tokens = []
+        prompt = self._prompt(initial_prompt)
+        if prompt:
+            previous_tokens = tokenizer.encode(" " + prompt.strip())
+
+        prompt_tokens = self.model.get_prompt(
+            tokenizer, previous_tokens, without_timestamps=True)
+
+        features = np.stack([
+            pad_or_trim(self.model.feature_extractor(audio_np))
+            for audio_np in audios
+        ])
+        encoder_output = self.model.encode(features)
+        results = self.model.model.generate(
+            encoder_output, [prompt_tokens] * len(audios),
+            beam_size=self.beam_size or 5)
+
+        return [
+            self._single_segment_result(
+                tokenizer.decode(result.sequences_ids[0]).strip(), audio_np)
+            for result, audio_np in zip(results, audios)
+        ]
+
+
+ASR_BACKENDS = {
+    "whisper": WhisperBackend,
+    "faster_whisper": FasterWhisperBackend,
+}
+
+
+def create_asr_backend(engine="whisper", **kwargs) -> ASRBackend:
+    if engine not in ASR_BACKENDS:
+        raise ValueError(f"Unknown ASR engine: {engine}")
+
+    return ASR_BACKENDS[engine](**kwargs)
@@ -0,0 +1,128 @@
+import asyncio
+import time
+
+
+class PendingUtterance():
+    def __init__(self, audio_np, initial_prompt, future):
+        self.audio_np = audio_np
+        self.initial_prompt = initial_prompt
+        self.future = future
+        self.queued_at = time.monotonic()
+
+
+class ASRBatcher():
+    """
+    Collects utterances from every speaker's pipeline and decodes them
+    together with the backend's `transcribe_batch`, so several people talking
+    at once cost about one forward pass instead of one each.
+
+    A batch is sent once it has `max_batch` utterances or its oldest
+    utterance has waited `max_wait` seconds, so a lone speaker is only
+    delayed by `max_wait`.
+    """
+
+    def __init__(self, asr_backend, max_batch=4, max_wait=0.05, report_every=20):
+        self.asr_backend = asr_backend
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.report_every = report_every
+        self.pending = asyncio.Queue()
+        self.worker = None
+
+        self.batches = 0
+        self.utterances = 0
+        self.total_wait = 0.0
+        self.max_queue_wait = 0.0
+        self.decode_seconds = 0.0
+        self.audio_seconds = 0.0
+        # decode seconds per second of audio, smoothed
+        self.realtime_factor = None
+
+    async def transcribe(self, audio_np, initial_prompt=None) -> dict:
+        if self.worker is None:
+            self.worker = asyncio.create_task(self._run())
+
+        future = asyncio.get_running_loop().create_future()
+        self.pending.put_nowait(
+            PendingUtterance(audio_np, initial_prompt, future))
+        return await future
+
+    async def _collect(self):
+        batch = [await self.pending.get()]
+        deadline = batch[0].queued_at + self.max_wait
+
+        while len(batch) < self.max_batch:
+            if not self.pending.empty():
+                batch.append(self.pending.get_nowait())
+                continue
+
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+
+            try:
+                batch.append(await asyncio.wait_for(self.pending.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        # callers that gave up (e.g. a stopped listener) don't need a decode
+        return [pending for pending in batch if not pending.future.done()]
+
+    async def _decode(self, batch, initial_prompt):
+        now = time.monotonic()
+        self.utterances += len(batch)
+        for pending in batch:
+            wait = now - pending.queued_at
+            self.total_wait += wait
+            self.max_queue_wait = max(self.max_queue_wait, wait)
+
+        audios = [pending.audio_np for pending in batch]
+        started_at = time.perf_counter()
+        try:
+            results = await asyncio.to_thread(
+                self.asr_backend.transcribe_batch, audios, initial_prompt)
+        except Exception as e:
+            for pending in batch:
+                if not pending.future.done():
+                    pending.future.set_exception(e)
+            return
+
+        elapsed = time.perf_counter() - started_at
+        audio_seconds = sum(len(audio_np) for audio_np in audios) / 16000
+        self.batches += 1
+        self.decode_seconds += elapsed
+        self.audio_seconds += audio_seconds
+        if audio_seconds > 0:
+            rtf = elapsed / audio_seconds
+            if self.realtime_factor is None:
+                self.realtime_factor = rtf
+            else:
+                self.realtime_factor = 0.9 * self.realtime_factor + 0.1 * rtf
+
+        for pending, result in zip(batch, results):
+            if not pending.future.done():
+                pending.future.set_result(result)
+
+        if self.batches % self.report_every == 0:
+            print("ASR batcher stats:", self.stats())
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+
+            # the prompt is shared by the whole forward pass
+            by_prompt = {}
+            for pending in batch:
+                by_prompt.setdefault(pending.initial_prompt, []).append(pending)
+
+            for initial_prompt, group in by_prompt.items():
+                await self._decode(group, initial_prompt)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "avg_batch_size": round(self.utterances / self.batches, 2) if self.batches else 0.0,
+            "avg_queue_wait": round(self.total_wait / self.utterances, 3) if self.utterances else 0.0,
+            "max_queue_wait": round(self.max_queue_wait, 3),
+            "realtime_factor": round(self.decode_seconds / self.audio_seconds, 3) if self.audio_seconds else None,
+        }
@@ -0,0 +1,236 @@
+import asyncio
+import collections
+import threading
+import time
+
+import numpy as np
+from discord.sinks import Filters, Sink
+
+from src.utils.tracing import TracedAudio, tracer
+from src.voice.wake_spotter import SAMPLE_RATE
+
+# Discord hands sinks decoded 16-bit 48kHz stereo PCM
+DISCORD_SAMPLE_RATE = 48000
+DISCORD_CHANNELS = 2
+DECIMATION = DISCORD_SAMPLE_RATE // SAMPLE_RATE
+
+
+def downsample_to_16k(pcm: bytes) -> np.ndarray:
+    """
+    Mix 48kHz stereo int16 PCM down to 16kHz mono int16 samples. Averaging
+    each group of three samples doubles as a (crude) anti-aliasing filter.
+    """
+    samples = np.frombuffer(pcm, dtype=np.int16)
+    usable = len(samples) - len(samples) % (DISCORD_CHANNELS * DECIMATION)
+    frames = samples[:usable].reshape(-1, DISCORD_CHANNELS * DECIMATION)
+    return frames.mean(axis=1).astype(np.int16)
+
+
+class SpeakerStream():
+    """
+    Energy based endpointing for one speaker. Audio is buffered from shortly
+    before the first voiced packet until `silence_timeout` passes without
+    voice (or Discord stops sending packets), then handed over as one
+    utterance. The buffer is fixed size, long monologues are cut at
+    `max_seconds`.
+    """
+
+    def __init__(self, silence_timeout=0.8, max_seconds=15, min_speech=0.3, pre_roll=0.3, energy_threshold_db=-45):
+        self.silence_timeout = silence_timeout
+        self.min_speech = min_speech
+        self.energy_threshold_db = energy_threshold_db
+
+        self.buffer = np.zeros(int(max_seconds * SAMPLE_RATE), dtype=np.int16)
+        self.length = 0
+        self.voiced_seconds = 0.0
+        self.last_voice_at = None
+        # packets from just before the speaker starts, so the first syllable
+        # of the wake word isn't clipped
+        self.pre_roll = collections.deque(maxlen=max(1, int(pre_roll / 0.02)))
+
+    def _is_voiced(self, samples: np.ndarray) -> bool:
+        if len(samples) == 0:
+            return False
+
+        rms = np.sqrt(np.mean((samples.astype(np.float32) / 32768.0) ** 2))
+        return 20 * np.log10(rms + 1e-10) > self.energy_threshold_db
+
+    def _append(self, samples: np.ndarray) -> bool:
+        """
+        :return: False if the buffer is full.
+        """
+        room = len(self.buffer) - self.length
+        count = min(room, len(samples))
+        self.buffer[self.length:self.length + count] = samples[:count]
+        self.length += count
+        return count == len(samples)
+
+    def feed(self, samples: np.ndarray, now: float):
+        """
+        :return: A finished utterance as 16kHz mono int16 bytes, or None.
+        """
+        voiced = self._is_voiced(samples)
+
+        if self.last_voice_at is None:
+            if not voiced:
+                self.pre_roll.append(samples)
+                return None
+
+            for packet in self.pre_roll:
+                self._append(packet)
+            self.pre_roll.clear()
+
+        if voiced:
+            self.last_voice_at = now
+            self.voiced_seconds += len(samples) / SAMPLE_RATE
+
+        if not self._append(samples):
+            return self.flush()
+
+        return self.flush_if_silent(now)
+
+    def flush_if_silent(self, now: float):
+        if self.last_voice_at is None or now - self.last_voice_at < self.silence_timeout:
+            return None
+
+        return self.flush()
+
+    def flush(self):
+        utterance = None
+        if self.voiced_seconds >= self.min_speech:
+            utterance = self.buffer[:self.length].tobytes()
+
+        self.length = 0
+        self.voiced_seconds = 0.0
+        self.last_voice_at = None
+        return utterance
+
+
+class VoiceReceiveSink(Sink):
+    """
+    A py-cord sink that splits the channel's audio into per-speaker
+    utterances instead of recording it to a file. `write` runs on py-cord's
+    reader thread, finished utterances are handed to `on_utterance` on the
+    event loop.
+    """
+
+    def __init__(self, loop, on_utterance, **stream_options):
+        super().__init__()
+        self.loop = loop
+        self.on_utterance = on_utterance
+        self.stream_options = stream_options
+        self.streams = {}
+        self.lock = threading.Lock()
+
+    def _emit(self, speaker_id, utterance):
+        if utterance is not None:
+            utterance = TracedAudio(utterance)
+            utterance.trace_id = tracer.start_trace()
+            self.loop.call_soon_threadsafe(
+                self.on_utterance, speaker_id, utterance)
+
+    @Filters.container
+    def write(self, data, user):
+        speaker_id = getattr(user, "id", user)
+        samples = downsample_to_16k(data)
+
+        with self.lock:
+            stream = self.streams.get(speaker_id)
+            if stream is None:
+                stream = SpeakerStream(**self.stream_options)
+                self.streams[speaker_id] = stream
+
+            utterance = stream.feed(samples, time.monotonic())
+
+        self._emit(speaker_id, utterance)
+
+    def flush_silent(self):
+        """
+        End utterances of speakers who stopped talking. Discord stops sending
+        packets on silence, so this can't wait for the next `write`.
+        """
+        now = time.monotonic()
+        with self.lock:
+            finished = [(speaker_id, stream.flush_if_silent(now))
+                        for speaker_id, stream in self.streams.items()]
+
+        for speaker_id, utterance in finished:
+            self._emit(speaker_id, utterance)
+
+    def cleanup(self):
+        # nothing was written to disk, so there's nothing to format
+        self.finished = True
+
+
+class DiscordVoiceReceiver():
+    """
+    Listens to everyone in the bot's voice channel for a guild. Each speaker
+    gets a bounded queue of utterances (16kHz mono int16 bytes), and
+    `on_new_speaker(speaker_id, queue)` is called the first time someone
+    speaks so they can get their own wake word and ASR pipeline.
+    """
+
+    def __init__(self, bot, guild_id=None, max_queued=4, poll_interval=0.1, **stream_options):
+        """
+        :param guild_id: The guild to listen in, None for the bot's home guild.
+        :param max_queued: Utterances kept per speaker, the oldest is dropped
+            when a speaker's pipeline falls behind.
+        """
+        self.bot = bot
+        self.guild_id = guild_id
+        self.max_queued = max_queued
+        self.poll_interval = poll_interval
+        self.stream_options = stream_options
+        self.speaker_queues = {}
+        self.dropped = 0
+        self.on_new_speaker = None
+
+    def _on_utterance(self, speaker_id, utterance):
+        queue = self.speaker_queues.get(speaker_id)
+        if queue is None:
+            queue = asyncio.Queue(maxsize=self.max_queued)
+            self.speaker_queues[speaker_id] = queue
+            self.on_new_speaker(speaker_id, queue)
+
+        if queue.full():
+            queue.get_nowait()
+            self.dropped += 1
+
+        queue.put_nowait(utterance)
+
+    def _voice_client(self):
+        guild_id = self.guild_id or self.bot.home_guild_id
+        player = self.bot.players.get(guild_id)
+        if player is None or player.vc is None or not player.vc.is_connected():
+            return None
+
+        return player.vc
+
+    async def run(self, on_new_speaker):
+        self.on_new_speaker = on_new_speaker
+        await self.bot.ready_event.wait()
+        loop = asyncio.get_running_loop()
+
+        recording = None
+        sink = None
+        while True:
+            vc = self._voice_client()
+            if vc is not recording:
+                if vc is not None:
+                    sink = VoiceReceiveSink(
+                        loop, self._on_utterance, **self.stream_options)
+                    vc.start_recording(sink)
+                    print("Listening to the voice channel.")
+                recording = vc
+
+            if recording is not None:
+                sink.flush_silent()
+
+            await asyncio.sleep(self.poll_interval)
+
+    def stats(self) -> dict:
+        return {
+            "speakers": len(self.speaker_queues),
+            "queued": sum(queue.qsize() for queue in self.speaker_queues.values()),
+            "dropped": self.dropped,
+        }
@@ -0,0 +1,59 @@
+import asyncio
+
+
+class GuildListeners():
+    """
+    Hears every guild the bot is in a voice channel of. The first time the
+    bot connects in a guild, that guild gets its own `DiscordVoiceReceiver`
+    and listener, with the guild's wake phrases. All of them share the ASR
+    model, clients and caches of `listener`.
+    """
+
+    def __init__(self, bot, listener, create_receiver, wake_matcher_for=None, poll_interval=1.0):
+        """
+        :param listener: The `Listen` every guild's listener is made from.
+        :param create_receiver: Called with a guild id, returns the receiver
+            for that guild.
+        :param wake_matcher_for: Called with a guild id, returns the guild's
+            `WakeMatcher`. None uses the listener's.
+        """
+        self.bot = bot
+        self.listener = listener
+        self.create_receiver = create_receiver
+        self.wake_matcher_for = wake_matcher_for
+        self.poll_interval = poll_interval
+        self.listeners = {}
+        self.tasks = {}
+
+    def _connected_guilds(self):
+        return [guild_id for guild_id, player in list(self.bot.players.items())
+                if player.vc is not None and player.vc.is_connected()]
+
+    def _start_guild(self, guild_id, action_queue):
+        wake_matcher = None
+        if self.wake_matcher_for is not None:
+            wake_matcher = self.wake_matcher_for(guild_id)
+
+        listener = self.listener.for_guild(
+            guild_id, self.create_receiver(guild_id), wake_matcher)
+        self.listeners[guild_id] = listener
+        self.tasks[guild_id] = asyncio.create_task(listener.start(action_queue))
+        print(f"Listening in guild {guild_id}.")
+
+    async def start(self, action_queue: asyncio.Queue):
+        await self.bot.ready_event.wait()
+
+        while True:
+            for guild_id in self._connected_guilds():
+                # a listener outlives a disconnect, its receiver picks the
+                # voice channel back up on reconnect
+                if guild_id not in self.listeners:
+                    self._start_guild(guild_id, action_queue)
+
+            await asyncio.sleep(self.poll_interval)
+
+    def stop(self):
+        for listener in self.listeners.values():
+            listener.stop()
+        for task in self.tasks.values():
+            task.cancel()
@@ -1,35 +1,154 @@
 import asyncio
-import re
+import contextvars
+import copy
+import threading
+import time
 from datetime import datetime, timedelta
 
 import numpy as np
 import speech_recognition as sr
-import torch
-import whisper
 
+from src.ai.response_author import SENTENCE_END
 from src.ai.tool_picker import Tool
+from src.utils.startup import startup
+from src.utils.tracing import TracedAudio, current_trace_id, tracer
+from src.voice.streaming import StreamingTranscriber
+from src.voice.wake_words import DEFAULT_WAKE_MATCHER
 
 # Heavily based on davabase/whisper_real_time for real time transcription
 # https://github.com/davabase/whisper_real_time/tree/master
 
-WAKE_WORDS = ["ok billy", "yo billy", "okay billy", "hey billy"]
+# How often (in audio chunks) to print wake spotter stats
+STATS_REPORT_EVERY = 25
+
+# Seconds of audio the recorder hands over at a time in streaming mode
+STREAMING_CHUNK_SECONDS = 1
+
+# In streaming mode, act on a partial hypothesis early only once two decodes
+# agree on all of it, it ends a sentence and it has at least this many words
+# after the wake word. Anything less waits for the final hypothesis.
+MIN_PARTIAL_COMMAND_WORDS = 3
+
+# Words a finished command doesn't end on, "play the" or "what is" are still
+# being spoken
+DANGLING_WORDS = {
+    "a", "an", "the", "to", "of", "for", "in", "on", "at", "by", "with", "and",
+    "or", "is", "are", "was", "what", "what's", "who", "how", "me", "my", "some",
+    "play", "show", "search", "find", "about", "from", "like",
+}
+
+# Set in each command's task to the future of the command heard before it.
+# Its actions are queued only once that command is done, so commands resolved
+# out of order still act in the order they were spoken.
+previous_command = contextvars.ContextVar("previous_command", default=None)
 
 
 class Listen():
-    def __init__(self, tool_picker, response_author, wolfram_client, youtube_client, giphy_client) -> None:
+    def __init__(self, tool_picker, response_author, wolfram_client, youtube_client, giphy_client,
+                 asr_backend, runner, *,
+                 wake_spotter=None,
+                 streaming=False,
+                 intent_router=None,
+                 utterance_cache=None,
+                 prefetcher=None,
+                 stream_responses=False,
+                 responder=None,
+                 guild_id=None,
+                 receiver=None,
+                 asr_batcher=None,
+                 wake_matcher=None,
+                 microphone=None,
+                 mic_calibration=1.0,
+                 sfx_library=None) -> None:
         self.should_stop = False
         self.tool_picker = tool_picker
         self.response_author = response_author
         self.wolfram_client = wolfram_client
         self.youtube_client = youtube_client
         self.giphy_client = giphy_client
+        self.asr_backend = asr_backend
+        self.runner = runner
+        self.intent_router = intent_router
+        self.utterance_cache = utterance_cache
+        self.prefetcher = prefetcher
+        self.stream_responses = stream_responses
+        self.responder = responder
+        self.commands_seen = 0
+        self.wake_spotter = wake_spotter
+        self.streaming = streaming
+        # the guild this listener's actions go to, None for the bot's home guild
+        self.guild_id = guild_id
+        # hear the Discord voice channel instead of a local microphone
+        self.receiver = receiver
+        self.speaker_tasks = {}
+        # decodes concurrent speakers together, None decodes one at a time
+        self.asr_batcher = asr_batcher
+        self.wake_matcher = wake_matcher or DEFAULT_WAKE_MATCHER
+        # device index, part of the device name, "default", or None to ask
+        self.microphone = microphone
+        # seconds of ambient noise to measure, 0 keeps the fixed threshold
+        self.mic_calibration = mic_calibration
+        # set once the ASR model is loaded and warmed up
+        self.asr_ready = asyncio.Event()
+        self.load_task = None
+        # local sound effects, played without a YouTube search when they match
+        self.sfx_library = sfx_library
+        # one decode at a time, the model is shared by every speaker
+        self.asr_lock = threading.Lock()
+
+        # Seconds spent in ASR per second of audio, used to estimate how much
+        # time the wake spotter saves us.
+        self.asr_realtime_factor = None
+        self.chunks_seen = 0
 
         self.data_queue = asyncio.Queue()
+        # Commands being resolved in the background while we keep listening
+        self.command_tasks = set()
+        # done when the last command heard has queued all its actions
+        self.last_command_done = None
+
+    def for_guild(self, guild_id, receiver, wake_matcher=None):
+        """
+        A listener for another guild's voice channel. It shares this one's
+        ASR model, clients and caches, but has its own speakers, wake phrases
+        and command order.
+        """
+        # the copy shares the load task, so the model only loads once
+        self.start_loading()
+
+        listener = copy.copy(self)
+        listener.guild_id = guild_id
+        listener.receiver = receiver
+        listener.wake_matcher = wake_matcher or self.wake_matcher
+        listener.speaker_tasks = {}
+        listener.data_queue = asyncio.Queue()
+        listener.command_tasks = set()
+        listener.last_command_done = None
+        listener.commands_seen = 0
+        listener.chunks_seen = 0
+        return listener
+
+    async def queue_action(self, item):
+        previous = previous_command.get()
+        if previous is not None:
+            # asyncio.wait, unlike awaiting the future, doesn't cancel it
+            # when this command is cancelled
+            await asyncio.wait((previous,))
+            previous_command.set(None)
+
+        item.setdefault("guild_id", self.guild_id)
+        item.setdefault("trace_id", current_trace_id.get())
+        await self.action_queue.put(item)
 
     def stop(self):
         self.should_stop = True
+        for task in self.command_tasks:
+            task.cancel()
+        for task in self.speaker_tasks.values():
+            task.cancel()
 
-    async def process_audio_queue(self, phrase_timeout: float):
+    async def process_audio_queue(self, phrase_timeout: float, data_queue: asyncio.Queue = None):
+        data_queue = data_queue or self.data_queue
         now = datetime.utcnow()
         transcription = ['']
         # The last time a recording was retrieved from the queue.
@@ -43,7 +162,22 @@ class Listen():
             # This is the last time we received new audio data from the queue.
             phrase_time = now
 
-            audio_data = await self.data_queue.get()  # Get data asynchronously
+            audio_data = await data_queue.get()  # Get data asynchronously
+            self.chunks_seen += 1
+            # commands started from this audio inherit its trace
+            current_trace_id.set(getattr(audio_data, "trace_id", None))
+
+            if self.wake_spotter is not None:
+                with tracer.span("wake"):
+                    # MFCCs and DTW over a whole chunk take long enough to
+                    # stall heartbeats and playback if run on the loop
+                    audio_data = await asyncio.to_thread(
+                        self.wake_spotter.gate, audio_data, self.asr_realtime_factor)
+                if self.chunks_seen % STATS_REPORT_EVERY == 0:
+                    print("Wake spotter stats:", self.wake_spotter.stats())
+
+                if audio_data is None:
+                    continue
 
             # Convert in-ram buffer to something the model can use directly without needing a temp file.
             # Convert data from 16 bit wide integers to floating point with a width of 32 bits.
@@ -52,11 +186,12 @@ class Listen():
                 audio_data, dtype=np.int16).astype(np.float32) / 32768.0
 
             # Read the transcription.
-            result = await asyncio.to_thread(
-                self.audio_model.transcribe,
-                audio_np,
-                fp16=torch.cuda.is_available()
-            )
+            if self.asr_batcher is not None:
+                with tracer.span("asr"):
+                    result = await self.asr_batcher.transcribe(audio_np)
+                self.asr_realtime_factor = self.asr_batcher.realtime_factor
+            else:
+                result = await asyncio.to_thread(self._transcribe, audio_np)
 
             text = result['text'].strip()
             if phrase_complete:
@@ -69,10 +204,151 @@ class Listen():
 
             await asyncio.sleep(0.25)  # Non-blocking sleep
 
+    def _transcribe(self, audio_np, initial_prompt=None):
+        with self.asr_lock, tracer.span("asr"):
+            started_at = time.perf_counter()
+            result = self.asr_backend.transcribe(audio_np, initial_prompt)
+            self._update_realtime_factor(
+                time.perf_counter() - started_at, len(audio_np) / 16000)
+
+        return result
+
+    async def process_audio_stream(self, chunk_seconds=STREAMING_CHUNK_SECONDS):
+        """
+        Streaming alternative to `process_audio_queue`. Partial hypotheses are
+        acted on as soon as they contain a stable wake word and a complete
+        command, the final hypothesis is used otherwise.
+
+        :param chunk_seconds: Longest chunk of audio in `data_queue`.
+        """
+        transcriber = StreamingTranscriber(
+            self._transcribe, chunk_seconds=chunk_seconds)
+        handled_utterance = None
+        wake_utterance = None
+        wake_stream = None
+
+        async for hypothesis in transcriber.hypotheses(self.data_queue):
+            if self.should_stop:
+                break
+
+            if hypothesis.utterance_id == handled_utterance:
+                continue
+
+            if hypothesis.utterance_id != wake_utterance:
+                wake_utterance = hypothesis.utterance_id
+                wake_stream = self.wake_matcher.stream()
+
+            # only the words that changed since the last partial are matched
+            match = wake_stream.feed(hypothesis.text)
+
+            if hypothesis.is_final:
+                await self.process_transcript(hypothesis.text, match)
+            elif hypothesis.stable == hypothesis.text and self._has_command(hypothesis.stable, match):
+                handled_utterance = hypothesis.utterance_id
+                await self.process_transcript(hypothesis.stable, match)
+
+    def _has_command(self, line, match):
+        """
+        Whether a partial hypothesis holds a finished command, so acting on it
+        won't cut off the rest of the sentence.
+        """
+        if match is None:
+            return False
+
+        command = line[match.end:].strip()
+        if not command.endswith((".", "!", "?")):
+            return False
+
+        words = command.lower().strip(".!?").replace(",", " ").split()
+        return len(words) >= MIN_PARTIAL_COMMAND_WORDS and words[-1] not in DANGLING_WORDS
+
+    def _update_realtime_factor(self, elapsed, audio_seconds):
+        if audio_seconds <= 0:
+            return
+
+        rtf = elapsed / audio_seconds
+        if self.asr_realtime_factor is None:
+            self.asr_realtime_factor = rtf
+        else:
+            self.asr_realtime_factor = 0.9 * self.asr_realtime_factor + 0.1 * rtf
+
+    def start_loading(self):
+        """
+        Load and warm up the ASR model in the background, e.g. while the
+        bot logs in. `asr_ready` is set when it's done.
+        """
+        if self.load_task is None:
+            self.load_task = asyncio.create_task(self._load_asr())
+
+        return self.load_task
+
+    async def _load_asr(self):
+        with startup.phase("asr_load"):
+            await asyncio.to_thread(self.asr_backend.load)
+        with startup.phase("asr_warm_up"):
+            await asyncio.to_thread(self.asr_backend.warm_up)
+
+        self.asr_ready.set()
+
+    async def _wait_until_ready(self):
+        # surfaces a failed load instead of waiting forever
+        await self.start_loading()
+        startup.mark("listening")
+
+    def _microphone_index(self):
+        names = sr.Microphone.list_microphone_names()
+
+        if self.microphone is None:
+            # print device index and name
+            for index, name in enumerate(names):
+                print(f"{index}. \"{name}\"")
+
+            return int(input("Enter Microphone device index: "))
+
+        if self.microphone == "default":
+            return None
+
+        if self.microphone.isdigit():
+            return int(self.microphone)
+
+        for index, name in enumerate(names):
+            if self.microphone.lower() in name.lower():
+                return index
+
+        raise ValueError(
+            f"No microphone matching \"{self.microphone}\", found: {names}")
+
+    def _open_microphone(self, recorder):
+        source = sr.Microphone(self._microphone_index(), sample_rate=16000)
+
+        if self.mic_calibration > 0:
+            with source:
+                recorder.adjust_for_ambient_noise(
+                    source, duration=self.mic_calibration)
+
+        return source
+
+    def _start_speaker_pipeline(self, speaker_id, data_queue):
+        print(f"Hearing a new speaker: {speaker_id}")
+        self.speaker_tasks[speaker_id] = asyncio.create_task(
+            self.process_audio_queue(phrase_timeout=3, data_queue=data_queue))
+
+    async def start_receiving(self):
+        """
+        Listen to everyone in the Discord voice channel. Each speaker's
+        utterances get their own wake word and ASR pipeline.
+        """
+        await self._wait_until_ready()
+
+        print("Billy is listening to the voice channel...\n")
+        await self.receiver.run(self._start_speaker_pipeline)
+
     async def start(self, action_queue: asyncio.Queue):
         self.action_queue = action_queue
         self.audio_queue = asyncio.Queue()
-        non_english = False
+
+        if self.receiver is not None:
+            return await self.start_receiving()
 
         # We use SpeechRecognizer to record our audio because it has a nice feature where it can detect when speech ends.
         recorder = sr.Recognizer()
@@ -80,25 +356,20 @@ class Listen():
         # Definitely do this, dynamic energy compensation lowers the energy threshold dramatically to a point where the SpeechRecognizer never stops recording.
         recorder.dynamic_energy_threshold = False
 
-        # print device index and name
-        for index, name in enumerate(sr.Microphone.list_microphone_names()):
-            print(f"{index}. \"{name}\"")
-
-        device_index = int(input("Enter Microphone device index: "))
-        source = sr.Microphone(device_index, sample_rate=16000)
-
-        # Load / Download model
-        model = "medium"
-        if model != "large" and not non_english:
-            model = model + ".en"
-        self.audio_model = whisper.load_model(model)
+        # the model loads while the microphone is opened and calibrated
+        self.start_loading()
+        with startup.phase("microphone"):
+            source = await asyncio.to_thread(self._open_microphone, recorder)
 
         # These could be fine-tuned. I'm not sure what the best values are.
         record_timeout = 6
         phrase_timeout = 3
+        if self.streaming:
+            # Hand over short chunks so the streaming transcriber can decode
+            # while the user is still talking.
+            record_timeout = STREAMING_CHUNK_SECONDS
 
-        with source:
-            recorder.adjust_for_ambient_noise(source)
+        await self._wait_until_ready()
 
         loop = asyncio.get_running_loop()
 
@@ -108,7 +379,8 @@ class Listen():
             audio: An AudioData containing the recorded bytes.
             """
             # This function will be called from a background thread
-            data = audio.get_raw_data()
+            data = TracedAudio(audio.get_raw_data())
+            data.trace_id = tracer.start_trace()
 
             # Schedule the data to be put into the queue in the thread-safe manner
             loop.call_soon_threadsafe(self.data_queue.put_nowait, data)
@@ -122,36 +394,168 @@ class Listen():
         # Cue the user that we're ready to go.
         print("Billy is listening...\n")
 
-        await self.process_audio_queue(phrase_timeout)
+        if self.streaming:
+            await self.process_audio_stream(record_timeout)
+        else:
+            await self.process_audio_queue(phrase_timeout)
 
     def find_wake_word_start(self, line):
-        normalized_line = line.lower()
-        normalized_line = re.sub(r'[^a-zA-Z ]', '', normalized_line)
-
-        wake_word_positions = [normalized_line.find(
-            wake_word) for wake_word in WAKE_WORDS if wake_word in normalized_line]
-        if not wake_word_positions:
-            return -1
-
-        return min(pos for pos in wake_word_positions if pos >= 0)
+        match = self.wake_matcher.find(line)
+        return -1 if match is None else match.start
 
-    async def process_transcript(self, line):
-        wake_word_start = self.find_wake_word_start(line)
-        if wake_word_start == -1:
+    async def process_transcript(self, line, match=None):
+        if match is None:
+            match = self.wake_matcher.find(line)
+        if match is None:
             return  # No wake word found
 
         # Slice the line from the first wake word
-        # it isn't perfect, but it's good enough
-        processed_line = line[wake_word_start:]
+        processed_line = line[match.start:]
 
         print("*" * 80)
         print("* ", processed_line)
         print("*" * 80)
 
-        await self.run_tool_tree(processed_line)
+        # Resolve the command in the background so transcription keeps
+        # flowing, but queue its actions after the previous command's
+        previous = self.last_command_done
+        done = asyncio.get_running_loop().create_future()
+        self.last_command_done = done
+
+        task = asyncio.create_task(self._run_command(processed_line, previous))
+        self.command_tasks.add(task)
+        task.add_done_callback(self.command_tasks.discard)
+        task.add_done_callback(lambda _: done.done() or done.set_result(None))
+        return task
+
+    async def _run_command(self, line, previous=None):
+        previous_command.set(previous)
+        self.commands_seen += 1
+        if self.commands_seen % 10 == 0:
+            if self.utterance_cache is not None:
+                print("Utterance cache stats:", self.utterance_cache.stats())
+            if self.prefetcher is not None:
+                print("Speculative prefetch stats:", self.prefetcher.stats())
+            if self.responder is not None:
+                print("Response speculation stats:", self.responder.stats())
+            if self.receiver is not None:
+                print("Voice receive stats:", self.receiver.stats())
+            print("Latency by stage:", tracer.summary())
+
+        try:
+            await self.run_tool_tree(line)
+        except asyncio.TimeoutError:
+            print("Timed out running tool tree: ", line)
+        except asyncio.CancelledError:
+            print("Cancelled tool tree: ", line)
+            raise
+        except Exception as e:
+            print("Error running tool tree: ", e)
+
+    def route_locally(self, line):
+        if self.intent_router is None:
+            return None
+
+        data = self.intent_router.route(line, self.wake_matcher)
+        if data is not None:
+            print("Routed locally: ", data)
+
+        return data
+
+    async def pick_tool(self, line) -> dict:
+        def compute():
+            if self.responder is not None and self.responder.mode == "combined":
+                return self.responder.pick_tool_and_reply(line)
+
+            return self.runner.run(
+                "tool_picker", self.tool_picker.determine_tools_and_query, line)
+
+        if self.utterance_cache is not None:
+            return await self.utterance_cache.pick_tool(
+                line, compute, self.wake_matcher)
+
+        return await compute()
+
+    async def write_response(self, line, tool, added_info=None):
+        def compute():
+            return self.runner.run(
+                "response_author", self.response_author.write_response,
+                line, added_info)
+
+        if self.utterance_cache is not None:
+            return await self.utterance_cache.write_response(
+                line, tool, compute, added_info, self.wake_matcher)
+
+        return await compute()
+
+    async def speak(self, text):
+        sentences = [text]
+        if self.stream_responses:
+            # still worth pipelining TTS when the whole reply is known
+            sentences = [s for s in SENTENCE_END.split(text) if s.strip()]
+
+        for sentence in sentences:
+            await self.queue_action({
+                "type": "tts",
+                "text": sentence
+            })
+
+    async def respond(self, line, tool, added_info=None):
+        """
+        Write a reply and queue it for TTS. When streaming, each sentence is
+        queued as soon as it is complete so Billy starts talking while the
+        rest is still being generated.
+        """
+        cached = self.utterance_cache is not None and self.utterance_cache.caches_response(
+            tool)
+        if not self.stream_responses or cached:
+            text_response = await self.write_response(line, tool, added_info)
+            if text_response is not None:
+                await self.speak(text_response)
+            return
+
+        async for sentence in self.runner.iterate(
+                "response_author", self.response_author.stream_response, line, added_info):
+            await self.queue_action({
+                "type": "tts",
+                "text": sentence
+            })
+
+    async def search_youtube(self, query, shuffle, speculation=None):
+        if self.prefetcher is not None:
+            video_id = await self.prefetcher.claim(speculation, query, shuffle)
+            if video_id is not None:
+                return video_id
+
+        return await self.runner.run(
+            "youtube", self.youtube_client.search, query, shuffle)
 
     async def run_tool_tree(self, line):
-        data = self.tool_picker.determine_tools_and_query(line)
+        data = self.route_locally(line)
+
+        # Start resolving "play ..." media while the tool picker decides
+        speculation = None
+        if self.prefetcher is not None:
+            speculation = self.prefetcher.start(line)
+
+        # Same for the reply in case this turns out to be no_tool
+        reply_speculation = None
+        if data is None and self.responder is not None:
+            reply_speculation = self.responder.start(line)
+
+        try:
+            if data is None:
+                with tracer.span("tool_pick"):
+                    data = await self.pick_tool(line)
+
+            await self.run_tool(line, data, speculation, reply_speculation)
+        finally:
+            if self.prefetcher is not None:
+                self.prefetcher.discard(speculation)
+            if self.responder is not None:
+                self.responder.discard(reply_speculation)
+
+    async def run_tool(self, line, data, speculation=None, reply_speculation=None):
         tool = data.get('tool', Tool.NoTool)
         query = data.get('query', None)
         text = data.get('text', None)
@@ -166,15 +570,27 @@ class Listen():
 
         text_response = None
         if tool == Tool.NoTool:
-            text_response = self.response_author.write_response(line)
+            reply = data.get('reply')
+            if reply is None and self.responder is not None:
+                reply = await self.responder.claim(reply_speculation)
+
+            if reply is not None:
+                await self.speak(reply)
+            else:
+                await self.respond(line, tool)
         elif tool == Tool.WolframAlpha:
-            added_info = self.wolfram_client.process(query)
-            text_response = self.response_author.write_response(
-                line, added_info)
+            try:
+                added_info = await self.runner.run(
+                    "wolfram", self.wolfram_client.process, query)
+            except asyncio.TimeoutError:
+                # answer without the extra info rather than not at all
+                print("Timed out waiting for WolframAlpha: ", query)
+                added_info = None
+            await self.respond(line, tool, added_info)
         elif tool == Tool.YouTube:
             # youtube controls
             if stop or play or pause:
-                await self.action_queue.put({
+                await self.queue_action({
                     "type": "youtube",
                     "stop": stop,
                     "play": play,
@@ -186,43 +602,69 @@ class Listen():
                     text_response = "I didn't hear your YouTube search"
                 else:
                     # search for specific song or shuffle
-                    video_res = self.youtube_client.search(query, shuffle)
-                    video_id = video_res.id.videoId
+                    video_id = await self.search_youtube(
+                        query, shuffle, speculation)
 
-                    await self.action_queue.put({
+                    await self.queue_action({
                         "type": "youtube",
                         "video_id": video_id
                     })
         elif tool == Tool.SoundEffect:
-            # shuffle for a sfx
-            video_res = self.youtube_client.search(query, True)
-            random_video_id = video_res.id.videoId
-
-            await self.action_queue.put({
-                "type": "sound_effect",
-                "video_id": random_video_id
-            })
+            clip_id = None
+            if self.sfx_library is not None:
+                clip_id = self.sfx_library.find(query)
+
+            if clip_id is not None:
+                await self.queue_action({
+                    "type": "sound_effect",
+                    "clip_id": clip_id,
+                    # searched for instead if the clip can't be loaded
+                    "query": query
+                })
+            else:
+                # shuffle for a sfx
+                random_video_id = await self.runner.run(
+                    "youtube", self.youtube_client.search, query, True)
+
+                item = {
+                    "type": "sound_effect",
+                    "video_id": random_video_id,
+                    "query": query
+                }
+                if self.sfx_library is not None and self.sfx_library.learn_misses:
+                    # the other results are learned too, so the sound still
+                    # varies once it plays from the library (the search is
+                    # cached, this doesn't hit the API again)
+                    video_ids = await self.runner.run(
+                        "youtube", self.youtube_client.search_video_ids, query)
+                    item["candidates"] = [
+                        video_id for video_id in video_ids if video_id != random_video_id]
+
+                await self.queue_action(item)
         elif tool == Tool.DiscordPost:
             # if a search query is provided, find a gif
             image_url = None
             if query is not None:
-                image_url = self.giphy_client.search(query)
+                try:
+                    image_url = await self.runner.run(
+                        "giphy", self.giphy_client.search, query)
+                except asyncio.TimeoutError:
+                    print("Timed out waiting for Giphy: ", query)
 
-            await self.action_queue.put({
+            await self.queue_action({
                 "type": "discord_post",
                 "image": image_url,
                 "text": text
             })
         elif tool == Tool.DiscordPostYouTube:
-            video_res = self.youtube_client.search(query, shuffle)
-            video_id = video_res.id.videoId
+            video_id = await self.search_youtube(query, shuffle, speculation)
 
-            await self.action_queue.put({
+            await self.queue_action({
                 "type": "discord_post.youtube",
                 "text": "https://www.youtube.com/watch?v=" + video_id
             })
         elif tool == Tool.Volume:
-            await self.action_queue.put({
+            await self.queue_action({
                 "type": "volume",
                 "value": value
             })
@@ -230,7 +672,7 @@ class Listen():
             print("Unknown tool", tool)
 
         if text_response is not None:
-            return await self.action_queue.put({
+            return await self.queue_action({
                 "type": "tts",
                 "text": text_response
             })
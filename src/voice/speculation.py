@@ -0,0 +1,167 @@
+import asyncio
+import random
+import re
+import time
+from collections import deque
+
+from src.ai.intent_router import normalize_command
+
+PLAY_PATTERN = re.compile(
+    r"(?:can you )?(?:play|stream|shuffle|put on) (?:some |me some )?(.+)")
+
+
+def _query_key(query):
+    return normalize_command(query).replace("lo-fi", "lofi")
+
+
+def guess_youtube_query(line):
+    """
+    Guess the search query the tool picker will come up with for a "play
+    <song> by <artist>" command, or None if the line doesn't look like one.
+
+    Only specific songs are guessed. The tool picker shuffles anything else
+    ("<artist> music", "jazz music"), so prefetching the top result would be
+    thrown away.
+    """
+    match = PLAY_PATTERN.fullmatch(normalize_command(line))
+    if not match:
+        return None
+
+    query = _query_key(match.group(1))
+    if re.search(r"\bsound\b|\bsfx\b", query) or " by " not in query:
+        return None
+
+    return query
+
+
+class Speculation():
+    def __init__(self, query, task):
+        self.query = query
+        self.task = task
+        self.started_at = time.monotonic()
+        self.finished_at = None
+        self.resolved = False
+
+
+class SpeculativePrefetcher():
+    """
+    Starts the YouTube search and yt-dlp extraction for lines that look like
+    "play ..." while the tool picker is still deciding. The result is used if
+    the tool picker agrees and thrown away otherwise.
+
+    At most `max_wasted` discarded speculations are allowed per `window`
+    seconds, after which speculation pauses until the oldest one ages out.
+    """
+
+    def __init__(self, runner, youtube_client, extract_info, max_wasted=5, window=600):
+        """
+        :param extract_info: Blocking callable taking a watch URL, expected to
+            warm the stream info cache used by the player.
+        """
+        self.runner = runner
+        self.youtube_client = youtube_client
+        self.extract_info = extract_info
+        self.max_wasted = max_wasted
+        self.window = window
+        self.wasted_at = deque()
+
+        self.started = 0
+        self.used = 0
+        self.discarded = 0
+        # matched the tool picker's query, but the prefetch found nothing
+        self.failed = 0
+        self.skipped_budget = 0
+        self.saved_seconds = 0.0
+
+    def _within_budget(self):
+        now = time.monotonic()
+        while self.wasted_at and now - self.wasted_at[0] > self.window:
+            self.wasted_at.popleft()
+
+        return len(self.wasted_at) < self.max_wasted
+
+    async def _prefetch(self, speculation):
+        try:
+            video_ids = await self.runner.run(
+                "youtube", self.youtube_client.search_video_ids, speculation.query)
+            if video_ids:
+                # resolving the top result covers non-shuffled plays
+                await self.runner.run(
+                    "youtube", self.extract_info,
+                    f"https://www.youtube.com/watch?v={video_ids[0]}")
+            return video_ids
+        finally:
+            speculation.finished_at = time.monotonic()
+
+    def start(self, line):
+        query = guess_youtube_query(line)
+        if query is None:
+            return None
+
+        if not self._within_budget():
+            self.skipped_budget += 1
+            return None
+
+        self.started += 1
+        speculation = Speculation(query, None)
+        speculation.task = asyncio.create_task(self._prefetch(speculation))
+        return speculation
+
+    async def claim(self, speculation, query, shuffle=False):
+        """
+        Use the speculated search if it matches `query`.
+
+        :return: A video ID, or None if the caller should search itself.
+        """
+        if speculation is None or speculation.resolved:
+            return None
+
+        if _query_key(query) != speculation.query:
+            return None
+
+        claimed_at = time.monotonic()
+        speculation.resolved = True
+        try:
+            video_ids = await speculation.task
+        except Exception as e:
+            print("Speculative prefetch failed: ", e)
+            video_ids = None
+
+        if not video_ids:
+            self.failed += 1
+            return None
+
+        self.used += 1
+        # the part of the prefetch that overlapped the tool picker
+        self.saved_seconds += min(claimed_at,
+                                  speculation.finished_at) - speculation.started_at
+
+        if shuffle:
+            return random.choice(video_ids)
+
+        return video_ids[0]
+
+    def discard(self, speculation):
+        if speculation is None or speculation.resolved:
+            return
+
+        speculation.resolved = True
+        if speculation.task.done():
+            if not speculation.task.cancelled():
+                # don't leave a failed prefetch unretrieved
+                speculation.task.exception()
+        else:
+            speculation.task.cancel()
+        self.discarded += 1
+        self.wasted_at.append(time.monotonic())
+
+    def stats(self) -> dict:
+        return {
+            "started": self.started,
+            "used": self.used,
+            "discarded": self.discarded,
+            "failed": self.failed,
+            "skipped_budget": self.skipped_budget,
+            "use_rate": self.used / self.started if self.started else 0.0,
+            "saved_seconds": round(self.saved_seconds, 2),
+        }
@@ -0,0 +1,185 @@
+import asyncio
+import itertools
+import time
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from src.utils.tracing import current_trace_id
+
+SAMPLE_RATE = 16000
+
+
+@dataclass
+class Hypothesis:
+    utterance_id: int
+    text: str
+    # The prefix of `text` that two consecutive decodes agreed on.
+    stable: str = ""
+    is_final: bool = False
+    audio_seconds: float = 0.0
+    segments: list = field(default_factory=list)
+
+
+def _common_word_prefix(a: str, b: str) -> str:
+    prefix = []
+    for word_a, word_b in zip(a.split(), b.split()):
+        if word_a.lower().strip(".,!?") != word_b.lower().strip(".,!?"):
+            break
+        prefix.append(word_b)
+
+    return " ".join(prefix)
+
+
+class StreamingTranscriber():
+    """
+    Sliding-window transcription over a rolling audio buffer.
+
+    Small chunks of int16 audio are appended to a buffer and the uncommitted
+    tail is re-decoded every `step` seconds of new audio, yielding partial
+    hypotheses. Whisper segments that two consecutive decodes agree on are
+    committed and their audio is dropped from the buffer, so each decode only
+    covers the new tail. A final hypothesis is emitted once no audio arrives
+    for `silence_timeout` seconds or the window grows past `max_window`.
+    """
+
+    def __init__(self, transcribe, chunk_seconds=1.0, step=None, max_window=10.0, silence_timeout=None, silence_margin=0.75):
+        """
+        :param transcribe: Blocking callable (audio_np, initial_prompt) that
+            returns a Whisper-style result dict with "text" and "segments".
+        :param chunk_seconds: Longest chunk the recorder hands over.
+        :param step: Seconds of new audio between decodes, at least one
+            chunk since audio can't arrive any faster.
+        :param silence_timeout: Seconds without a new chunk that end the
+            utterance. Defaults to `chunk_seconds + silence_margin`, anything
+            shorter would split an utterance between two of its own chunks.
+        """
+        self.transcribe = transcribe
+        self.step = chunk_seconds if step is None else step
+        self.max_window = max_window
+        self.silence_timeout = chunk_seconds + silence_margin \
+            if silence_timeout is None else silence_timeout
+
+        self._utterance_ids = itertools.count(1)
+        self._reset()
+
+    def _reset(self):
+        self.utterance_id = next(self._utterance_ids)
+        self.buffer = np.zeros(0, dtype=np.float32)
+        self.committed_text = ""
+        self.previous_segments = []
+        self.previous_text = ""
+        self.new_samples = 0
+        self.last_chunk_at = None
+
+    def _window_seconds(self):
+        return len(self.buffer) / SAMPLE_RATE
+
+    async def _decode(self):
+        result = await asyncio.to_thread(
+            self.transcribe, self.buffer, self.committed_text or None)
+        self.new_samples = 0
+
+        return result['text'].strip(), result.get('segments', [])
+
+    def _commit_agreed_segments(self, segments):
+        """
+        Commit leading segments whose text matches the previous decode and
+        drop their audio from the buffer.
+        """
+        # Always keep the last segment uncommitted, it may still be growing.
+        agreed = 0
+        for old, new in zip(self.previous_segments, segments[:-1]):
+            if old['text'].strip() != new['text'].strip():
+                break
+            agreed += 1
+
+        if agreed == 0:
+            return segments
+
+        cut = int(segments[agreed - 1]['end'] * SAMPLE_RATE)
+        committed = " ".join(s['text'].strip() for s in segments[:agreed])
+        self.committed_text = (self.committed_text + " " + committed).strip()
+        self.buffer = self.buffer[cut:]
+
+        return segments[agreed:]
+
+    def _hypothesis(self, text, is_final=False, segments=None):
+        full_text = (self.committed_text + " " + text).strip()
+        stable = (self.committed_text + " " +
+                  _common_word_prefix(self.previous_text, text)).strip()
+
+        return Hypothesis(
+            utterance_id=self.utterance_id,
+            text=full_text,
+            stable=full_text if is_final else stable,
+            is_final=is_final,
+            audio_seconds=self._window_seconds(),
+            segments=segments or [],
+        )
+
+    async def _finalize(self):
+        text = self.previous_text
+        if self.new_samples > 0:
+            text, _ = await self._decode()
+
+        hypothesis = self._hypothesis(text, is_final=True)
+        self._reset()
+        return hypothesis
+
+    async def hypotheses(self, audio_queue: asyncio.Queue):
+        """
+        Consume raw int16 audio chunks from `audio_queue` and yield partial
+        and final `Hypothesis` objects as an async stream.
+        """
+        while True:
+            # the silence is counted from the last chunk's arrival, not from
+            # the end of the decode that followed it
+            timeout = self.silence_timeout
+            if self.last_chunk_at is not None:
+                timeout = max(0.0, self.last_chunk_at +
+                              self.silence_timeout - time.monotonic())
+
+            try:
+                if not audio_queue.empty():
+                    # the decode took longer than a chunk, don't time out on
+                    # audio that's already here
+                    audio_data = audio_queue.get_nowait()
+                else:
+                    audio_data = await asyncio.wait_for(
+                        audio_queue.get(), timeout=timeout)
+                if len(self.buffer) == 0:
+                    # the utterance is traced from its first chunk
+                    current_trace_id.set(getattr(audio_data, "trace_id", None))
+            except asyncio.TimeoutError:
+                if len(self.buffer) > 0:
+                    yield await self._finalize()
+                continue
+
+            if audio_data is None:
+                if len(self.buffer) > 0:
+                    yield await self._finalize()
+                return
+
+            self.last_chunk_at = time.monotonic()
+            samples = np.frombuffer(
+                audio_data, dtype=np.int16).astype(np.float32) / 32768.0
+            self.buffer = np.concatenate((self.buffer, samples))
+            self.new_samples += len(samples)
+
+            if self.new_samples < self.step * SAMPLE_RATE:
+                continue
+
+            text, segments = await self._decode()
+            remaining = self._commit_agreed_segments(segments)
+            if remaining is not segments:
+                text = " ".join(s['text'].strip() for s in remaining)
+
+            hypothesis = self._hypothesis(text, segments=remaining)
+            self.previous_text = text
+            self.previous_segments = remaining
+
+            if self._window_seconds() >= self.max_window:
+                yield await self._finalize()
+            else:
+                yield hypothesis
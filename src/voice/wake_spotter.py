@@ -0,0 +1,312 @@
+import glob
+import os
+import threading
+import wave
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+
+# 25ms windows with a 10ms hop, the usual speech front-end settings
+FRAME_LENGTH = 400
+HOP_LENGTH = 160
+N_FFT = 512
+N_MELS = 26
+N_MFCC = 13
+
+
+def _mel_filterbank(sample_rate=SAMPLE_RATE, n_fft=N_FFT, n_mels=N_MELS):
+    def hz_to_mel(hz):
+        return 2595 * np.log10(1 + hz / 700)
+
+    def mel_to_hz(mel):
+        return 700 * (10 ** (mel / 2595) - 1)
+
+    mel_points = np.linspace(
+        hz_to_mel(0), hz_to_mel(sample_rate / 2), n_mels + 2)
+    bins = np.floor((n_fft + 1) * mel_to_hz(mel_points) /
+                    sample_rate).astype(int)
+
+    fbank = np.zeros((n_mels, n_fft // 2 + 1), dtype=np.float32)
+    for m in range(1, n_mels + 1):
+        left, center, right = bins[m - 1], bins[m], bins[m + 1]
+        for k in range(left, center):
+            fbank[m - 1, k] = (k - left) / max(center - left, 1)
+        for k in range(center, right):
+            fbank[m - 1, k] = (right - k) / max(right - center, 1)
+
+    return fbank
+
+
+def _dct_matrix(n_mels=N_MELS, n_mfcc=N_MFCC):
+    n = np.arange(n_mels)
+    k = np.arange(n_mfcc)[:, None]
+    return np.cos(np.pi / n_mels * (n + 0.5) * k).astype(np.float32)
+
+
+MEL_FILTERBANK = _mel_filterbank()
+DCT_MATRIX = _dct_matrix()
+WINDOW = np.hanning(FRAME_LENGTH).astype(np.float32)
+
+
+def _frames(samples: np.ndarray) -> np.ndarray:
+    if len(samples) < FRAME_LENGTH:
+        samples = np.pad(samples, (0, FRAME_LENGTH - len(samples)))
+
+    n_frames = 1 + (len(samples) - FRAME_LENGTH) // HOP_LENGTH
+    return np.lib.stride_tricks.sliding_window_view(
+        samples, FRAME_LENGTH)[::HOP_LENGTH][:n_frames]
+
+
+def mfcc(samples: np.ndarray) -> np.ndarray:
+    """
+    Compute mean-normalized MFCCs (without c0) for float32 audio.
+
+    :param samples: Mono float32 audio at 16kHz in the range [-1, 1].
+    :return: An array of shape (frames, N_MFCC - 1).
+    """
+    frames = _frames(samples) * WINDOW
+    power = np.abs(np.fft.rfft(frames, N_FFT)) ** 2
+    mel = np.log(power @ MEL_FILTERBANK.T + 1e-10)
+    ceps = mel @ DCT_MATRIX.T
+    ceps = ceps[:, 1:]
+
+    return ceps - ceps.mean(axis=0)
+
+
+def frame_energy_db(samples: np.ndarray) -> np.ndarray:
+    frames = _frames(samples)
+    rms = np.sqrt(np.mean(frames ** 2, axis=1) + 1e-12)
+    return 20 * np.log10(rms)
+
+
+def _cosine_distance(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    a = a / (np.linalg.norm(a, axis=1, keepdims=True) + 1e-8)
+    b = b / (np.linalg.norm(b, axis=1, keepdims=True) + 1e-8)
+    return 1 - a @ b.T
+
+
+def subsequence_dtw(template: np.ndarray, query: np.ndarray):
+    """
+    Find the best match of `template` anywhere inside `query`.
+
+    Uses the (i-1, j), (i-1, j-1), (i-1, j-2) step pattern so every row can
+    be computed with a single vectorized pass.
+
+    :return: (normalized distance, start frame, end frame) of the best match.
+    """
+    cost = _cosine_distance(template, query)
+    m, n = cost.shape
+
+    acc = cost[0].copy()
+    start = np.arange(n)
+    for i in range(1, m):
+        stay = acc
+        diag = np.concatenate(([np.inf], acc[:-1]))
+        skip = np.concatenate(([np.inf, np.inf], acc[:-2]))
+        steps = np.stack((stay, diag, skip))
+        best = np.argmin(steps, axis=0)
+
+        acc = cost[i] + steps[best, np.arange(n)]
+        start = np.choose(best, (
+            start,
+            np.concatenate(([0], start[:-1])),
+            np.concatenate(([0, 0], start[:-2])),
+        ))
+
+    end = int(np.argmin(acc))
+    return float(acc[end] / m), int(start[end]), end
+
+
+def _load_wav(path):
+    with wave.open(path, "rb") as wf:
+        if wf.getsampwidth() != 2:
+            raise ValueError(f"{path} must be 16-bit PCM")
+
+        data = np.frombuffer(wf.readframes(wf.getnframes()), dtype=np.int16)
+        if wf.getnchannels() > 1:
+            data = data.reshape(-1, wf.getnchannels()).mean(axis=1)
+
+        samples = data.astype(np.float32) / 32768.0
+        if wf.getframerate() != SAMPLE_RATE:
+            duration = len(samples) / wf.getframerate()
+            target = np.linspace(0, len(samples) - 1,
+                                 int(duration * SAMPLE_RATE))
+            samples = np.interp(
+                target, np.arange(len(samples)), samples).astype(np.float32)
+
+        return samples
+
+
+class WakeWordSpotter():
+    """
+    A cheap keyword-spotting gate that runs on the raw int16 audio before the
+    heavy ASR model. Only chunks that likely contain the wake word (plus a bit
+    of audio before it) are handed to Whisper.
+
+    Subclasses implement `_detect`, which returns the sample index where the
+    wake word likely starts, or None.
+    """
+
+    def __init__(self, pre_roll=0.5, min_speech=0.3, energy_threshold_db=-45):
+        self.pre_roll = pre_roll
+        self.min_speech = min_speech
+        self.energy_threshold_db = energy_threshold_db
+
+        # gate runs on worker threads, one speaker's chunk at a time
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.audio_seconds_skipped = 0.0
+        self.asr_seconds_saved = 0.0
+
+    def _has_speech(self, samples: np.ndarray) -> bool:
+        # Reject silence and short bursts (coughs, clicks) before doing
+        # anything more expensive.
+        voiced = frame_energy_db(samples) > self.energy_threshold_db
+        min_frames = int(self.min_speech * SAMPLE_RATE / HOP_LENGTH)
+
+        run = 0
+        for is_voiced in voiced:
+            run = run + 1 if is_voiced else 0
+            if run >= min_frames:
+                return True
+
+        return False
+
+    def _detect(self, samples: np.ndarray):
+        raise NotImplementedError
+
+    def gate(self, audio_data: bytes, asr_realtime_factor=None):
+        """
+        Decide whether a chunk should be transcribed. Blocking, call it off
+        the event loop.
+
+        :param audio_data: Raw 16-bit mono PCM at 16kHz.
+        :param asr_realtime_factor: Seconds of ASR time per second of audio,
+            used to estimate how much transcription time a rejection saved.
+        :return: The (possibly trimmed) audio to transcribe, or None.
+        """
+        samples = np.frombuffer(
+            audio_data, dtype=np.int16).astype(np.float32) / 32768.0
+
+        with self.lock:
+            return self._gate(audio_data, samples, asr_realtime_factor)
+
+    def _gate(self, audio_data, samples, asr_realtime_factor):
+        start = None
+        if self._has_speech(samples):
+            start = self._detect(samples)
+
+        if start is None:
+            duration = len(samples) / SAMPLE_RATE
+            self.misses += 1
+            self.audio_seconds_skipped += duration
+            if asr_realtime_factor is not None:
+                self.asr_seconds_saved += duration * asr_realtime_factor
+            return None
+
+        self.hits += 1
+        start = max(0, start - int(self.pre_roll * SAMPLE_RATE))
+
+        # int16 is 2 bytes per sample
+        return audio_data[start * 2:]
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "audio_seconds_skipped": round(self.audio_seconds_skipped, 2),
+            "asr_seconds_saved": round(self.asr_seconds_saved, 2),
+        }
+
+
+class TemplateWakeWordSpotter(WakeWordSpotter):
+    """
+    Matches MFCCs of the incoming audio against a handful of recorded wake
+    word samples (e.g. people saying "hey billy") using subsequence DTW.
+
+    Without any templates this degrades to a plain speech gate.
+    """
+
+    def __init__(self, samples_dir=None, threshold=0.3, **kwargs):
+        super().__init__(**kwargs)
+        self.threshold = threshold
+        self.templates = []
+
+        if samples_dir:
+            for path in sorted(glob.glob(os.path.join(samples_dir, "*.wav"))):
+                template = self._trim_silence(_load_wav(path))
+                self.templates.append(mfcc(template))
+
+        if not self.templates:
+            print("No wake word samples found, wake spotter will only gate on speech.")
+
+    def _trim_silence(self, samples: np.ndarray) -> np.ndarray:
+        voiced = np.flatnonzero(
+            frame_energy_db(samples) > self.energy_threshold_db)
+        if len(voiced) == 0:
+            return samples
+
+        return samples[voiced[0] * HOP_LENGTH:(voiced[-1] + 1) * HOP_LENGTH + FRAME_LENGTH]
+
+    def _detect(self, samples: np.ndarray):
+        if not self.templates:
+            voiced = np.flatnonzero(
+                frame_energy_db(samples) > self.energy_threshold_db)
+            return int(voiced[0]) * HOP_LENGTH
+
+        features = mfcc(samples)
+        best_distance, best_start = None, None
+        for template in self.templates:
+            distance, start, _ = subsequence_dtw(template, features)
+            if best_distance is None or distance < best_distance:
+                best_distance, best_start = distance, start
+
+        if best_distance > self.threshold:
+            return None
+
+        return best_start * HOP_LENGTH
+
+
+class OpenWakeWordSpotter(WakeWordSpotter):
+    """
+    Uses an openWakeWord ONNX/TFLite model trained for the wake phrase.
+    """
+
+    # openWakeWord expects 80ms frames
+    FRAME_SAMPLES = 1280
+
+    def __init__(self, model_path, threshold=0.5, **kwargs):
+        super().__init__(**kwargs)
+        from openwakeword.model import Model
+
+        self.threshold = threshold
+        self.model = Model(wakeword_models=[model_path])
+
+    def _detect(self, samples: np.ndarray):
+        self.model.reset()
+        pcm = (samples * 32768.0).astype(np.int16)
+
+        for offset in range(0, len(pcm) - self.FRAME_SAMPLES + 1, self.FRAME_SAMPLES):
+            scores = self.model.predict(pcm[offset:offset + self.FRAME_SAMPLES])
+            if max(scores.values()) >= self.threshold:
+                # the model fires at the end of the phrase, back up roughly
+                # the length of "hey billy"
+                return max(0, offset - SAMPLE_RATE)
+
+        return None
+
+
+def create_wake_spotter(kind, samples_dir=None, model_path=None, threshold=None):
+    if kind is None or kind == "off":
+        return None
+    elif kind == "template":
+        return TemplateWakeWordSpotter(samples_dir, threshold=0.3 if threshold is None else threshold)
+    elif kind == "openwakeword":
+        return OpenWakeWordSpotter(model_path, threshold=0.5 if threshold is None else threshold)
+    else:
+        raise ValueError(f"Unknown wake spotter: {kind}")
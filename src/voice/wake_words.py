@@ -0,0 +1,295 @@
+import re
+
+WAKE_WORDS = ["ok billy", "yo billy", "okay billy", "hey billy"]
+
+# How Whisper tends to spell the first word of a wake phrase when it's said
+# quickly. Only trusted at the start of a sentence, "play a billy joel song"
+# shouldn't wake Billy.
+WAKE_WORD_ALIASES = {
+    "hey": ["a", "eh", "hay", "hei"],
+    "yo": ["yoe", "yeo"],
+}
+
+# Spelling differences that don't change how a word sounds, applied in order
+PHONETIC_RULES = [
+    (re.compile(r"ph"), "f"),
+    (re.compile(r"ck"), "k"),
+    (re.compile(r"c(?=[eiy])"), "s"),
+    (re.compile(r"[cq]"), "k"),
+    (re.compile(r"(ie|ee|ey|ea|ay|i)$"), "y"),
+    (re.compile(r"(.)\1+"), r"\1"),
+]
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9']+")
+SENTENCE_END = re.compile(r"[.!?]")
+
+
+def normalize_line(line, keep_digits=False):
+    normalized_line = line.lower()
+    if keep_digits:
+        return re.sub(r'[^a-z0-9 ]', '', normalized_line)
+
+    return re.sub(r'[^a-zA-Z ]', '', normalized_line)
+
+
+def phonetic_key(word):
+    """
+    A rough sound-alike key, so "billie", "bily" and "billy" compare equal.
+    """
+    key = word.lower().replace("'", "")
+    for pattern, replacement in PHONETIC_RULES:
+        key = pattern.sub(replacement, key)
+
+    return key
+
+
+def edit_distance(a, b, limit):
+    """
+    Levenshtein distance between `a` and `b`, or `limit + 1` once it's
+    known to be over `limit`.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1,
+                               previous[j - 1] + (char_a != char_b)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+
+    return previous[-1]
+
+
+class WakeMatch():
+    def __init__(self, phrase, start, end):
+        """
+        :param start: Offset of the wake phrase in the transcript.
+        :param end: Offset just past the wake phrase.
+        """
+        self.phrase = phrase
+        self.start = start
+        self.end = end
+
+    def __repr__(self):
+        return f"WakeMatch({self.phrase!r}, {self.start}, {self.end})"
+
+
+class Token():
+    def __init__(self, text, start, end, sentence_start):
+        self.text = text
+        self.key = phonetic_key(text)
+        self.start = start
+        self.end = end
+        self.sentence_start = sentence_start
+
+
+def tokenize(line) -> list:
+    tokens = []
+    previous_end = 0
+    for found in TOKEN_PATTERN.finditer(line.lower()):
+        sentence_start = not tokens or bool(
+            SENTENCE_END.search(line, previous_end, found.start()))
+        tokens.append(Token(found.group(), found.start(),
+                      found.end(), sentence_start))
+        previous_end = found.end()
+
+    return tokens
+
+
+class WakeWord():
+    """
+    One word of a wake phrase and the transcript words it accepts.
+    """
+
+    def __init__(self, word, aliases=(), tolerance=1):
+        self.word = word
+        self.key = phonetic_key(word)
+        self.aliases = set(aliases)
+        # short words are too easy to confuse, "yo" is one edit from "you"
+        self.tolerance = tolerance if len(word) >= 5 else 0
+
+    def accepts(self, token: Token) -> bool:
+        if token.text == self.word or token.key == self.key:
+            return True
+
+        if token.text in self.aliases:
+            return token.sentence_start
+
+        return (self.tolerance > 0 and token.text[:1] == self.word[:1]
+                and edit_distance(token.text, self.word, self.tolerance) <= self.tolerance)
+
+
+class WakeNode():
+    def __init__(self):
+        self.edges = []
+        self.phrase = None
+
+    def child(self, wake_word: WakeWord):
+        for edge, node in self.edges:
+            if edge.word == wake_word.word:
+                return node
+
+        node = WakeNode()
+        self.edges.append((wake_word, node))
+        return node
+
+
+class WakeMatcher():
+    """
+    Finds wake phrases in transcripts, tolerating the ways Whisper spells
+    them ("Hey, Billie!", "a billy", "hey bily").
+
+    The phrases are compiled once into a word trie. Matching walks the
+    transcript a word at a time, keeping every partial match alive, so all
+    phrases are checked in a single pass. `stream` resumes that walk where
+    the previous partial hypothesis left off.
+    """
+
+    def __init__(self, phrases=WAKE_WORDS, aliases=WAKE_WORD_ALIASES, tolerance=1):
+        """
+        :param tolerance: Edits allowed in words of five letters or more.
+        """
+        self.phrases = list(phrases)
+        self.root = WakeNode()
+        for phrase in self.phrases:
+            node = self.root
+            for word in normalize_line(phrase, keep_digits=True).split():
+                node = node.child(WakeWord(
+                    word, aliases.get(word, ()), tolerance))
+            node.phrase = phrase
+
+    def step(self, active: list, tokens: list, index: int):
+        """
+        Advance the partial matches in `active` by `tokens[index]`.
+
+        :param active: [(node, index of the phrase's first token)]
+        :return: The new partial matches, and a completed WakeMatch or None.
+        """
+        token = tokens[index]
+        if token.sentence_start:
+            # a phrase doesn't run across sentences, "Hey. Billy play" isn't
+            # a wake phrase
+            active = []
+
+        advanced = []
+        for node, start in active + [(self.root, index)]:
+            for wake_word, child in node.edges:
+                if not wake_word.accepts(token):
+                    continue
+
+                if child.phrase is not None:
+                    return advanced, WakeMatch(child.phrase, tokens[start].start, token.end)
+                advanced.append((child, start))
+
+        return advanced, None
+
+    def find(self, line):
+        """
+        :return: The first WakeMatch in `line`, or None.
+        """
+        return self.stream().feed(line)
+
+    def stream(self):
+        return WakeStream(self)
+
+    def strip(self, line):
+        """
+        Drop a wake phrase from the start of `line`.
+        """
+        match = self.find(line)
+        if match is None or line[:match.start].strip(" ,.!?"):
+            return line
+
+        return line[match.end:]
+
+
+class WakeStream():
+    """
+    Incremental matching over the partial hypotheses of one utterance. Each
+    hypothesis usually repeats the previous one with a few words appended or
+    revised, so only the words after the last agreed one are matched again.
+    """
+
+    def __init__(self, matcher: WakeMatcher):
+        self.matcher = matcher
+        # (text, sentence_start) of each word matched so far, both decide
+        # whether a word is accepted
+        self.words = []
+        # partial matches after each word
+        self.states = []
+        self.matched_at = None
+
+    def feed(self, text):
+        """
+        :return: The first WakeMatch in `text`, or None.
+        """
+        tokens = tokenize(text)
+
+        agreed = 0
+        for word, token in zip(self.words, tokens):
+            if word != (token.text, token.sentence_start):
+                break
+            agreed += 1
+
+        del self.words[agreed:]
+        del self.states[agreed:]
+        if self.matched_at is not None and self.matched_at >= agreed:
+            self.matched_at = None
+
+        if self.matched_at is not None:
+            return self._match_at(tokens, self.matched_at)
+
+        for index in range(agreed, len(tokens)):
+            active = self.states[-1] if self.states else []
+            active, match = self.matcher.step(active, tokens, index)
+            self.words.append((tokens[index].text, tokens[index].sentence_start))
+            self.states.append(active)
+            if match is not None:
+                self.matched_at = index
+                return match
+
+        return None
+
+    def _match_at(self, tokens, index):
+        # offsets move as punctuation changes, so re-walk the matched words
+        active = self.states[index - 1] if index > 0 else []
+        return self.matcher.step(active, tokens, index)[1]
+
+
+DEFAULT_WAKE_MATCHER = WakeMatcher()
+
+
+def parse_guild_wake_words(value) -> dict:
+    """
+    Parse "guild_id=phrase|phrase;guild_id=phrase" into
+    {guild_id: [phrase, ...]}.
+    """
+    wake_words = {}
+    for entry in (value or "").split(";"):
+        if "=" not in entry:
+            continue
+        guild_id, phrases = entry.split("=", 1)
+        wake_words[int(guild_id)] = [phrase.strip()
+                                     for phrase in phrases.split("|") if phrase.strip()]
+
+    return wake_words
+
+
+def normalize_utterance(line, matcher=DEFAULT_WAKE_MATCHER):
+    """
+    Lowercase a transcript and drop everything up to and including the wake
+    word, so "Hey Billy, play lo-fi." and "ok billy play lofi" share a key.
+    Digits are kept so "volume 4" and "volume 7" stay different.
+
+    :param matcher: The `WakeMatcher` the transcript was heard with.
+    """
+    match = matcher.find(line)
+    if match is not None:
+        line = line[match.end:]
+
+    normalized_line = normalize_line(line.replace("-", ""), keep_digits=True)
+    return " ".join(normalized_line.split())
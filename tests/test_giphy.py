@@ -0,0 +1,143 @@
+import threading
+import time
+
+from src.actions.images.giphy import Giphy
+
+
+class FakeResponse():
+    def __init__(self, body):
+        self.body = body
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.body
+
+
+class FakeGiphyApi():
+    """
+    Serves `total` numbered GIFs per query. Each call waits for `release`
+    and fails while `failing` is set.
+    """
+
+    def __init__(self, total=30):
+        self.total = total
+        self.calls = []
+        self.release = threading.Event()
+        self.release.set()
+        self.failing = False
+
+    def get(self, url, params):
+        self.calls.append((params["q"], params["offset"]))
+        self.release.wait(5)
+        if self.failing:
+            raise ConnectionError("giphy is down")
+
+        offset, limit = params["offset"], params["limit"]
+        count = max(0, min(limit, self.total - offset))
+        return FakeResponse({
+            "data": [{"images": {"original": {"url": f"{params['q']}/{i}"}}}
+                     for i in range(offset, offset + count)],
+            "pagination": {"offset": offset, "count": count, "total_count": self.total},
+        })
+
+
+def search_in_threads(giphy, query, count):
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(giphy.search(query)))
+               for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def test_pool_serves_every_gif_before_repeating():
+    api = FakeGiphyApi(total=10)
+    giphy = Giphy("key", http=api, page_size=10, refill_below=0)
+
+    urls = [giphy.search("Cats") for _ in range(10)]
+    assert sorted(urls) == sorted(f"cats/{i}" for i in range(10))
+    assert giphy.search("cats") != urls[-1]
+    assert api.calls == [("cats", 0)]
+
+
+def test_concurrent_cold_searches_share_one_fetch():
+    api = FakeGiphyApi()
+    api.release.clear()
+    giphy = Giphy("key", http=api, page_size=10, refill_below=0)
+
+    threads, results = search_in_threads(giphy, "dogs", 4)
+    time.sleep(0.1)
+    api.release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert api.calls == [("dogs", 0)]
+    assert len(results) == 4 and all(url.startswith("dogs/") for url in results)
+    assert giphy.stats()["coalesced"] == 3
+
+
+def test_search_waits_for_warm_up_instead_of_refetching():
+    api = FakeGiphyApi()
+    api.release.clear()
+    giphy = Giphy("key", http=api, page_size=10, refill_below=0)
+
+    giphy.warm(["party"])
+    time.sleep(0.05)
+    threads, results = search_in_threads(giphy, "Party", 1)
+    time.sleep(0.05)
+    api.release.set()
+    threads[0].join(5)
+
+    assert api.calls == [("party", 0)]
+    assert results[0].startswith("party/")
+    # the warm pool is the one that was kept
+    assert len(giphy.pools["party"].urls) == 10
+
+
+def test_waiting_search_gives_up_after_wait_timeout():
+    api = FakeGiphyApi()
+    api.release.clear()
+    giphy = Giphy("key", http=api, wait_timeout=0.1)
+
+    giphy.warm(["slow"])
+    time.sleep(0.05)
+    assert giphy.search("slow") is None
+    api.release.set()
+
+
+def test_failed_fill_is_retried_by_the_next_search():
+    api = FakeGiphyApi()
+    api.failing = True
+    giphy = Giphy("key", http=api, page_size=10, refill_below=0)
+
+    assert giphy.search("frogs") is None
+    assert "frogs" not in giphy.pools
+
+    api.failing = False
+    assert giphy.search("frogs").startswith("frogs/")
+    assert len(api.calls) == 2
+
+
+def test_low_pools_are_topped_up_in_the_background():
+    api = FakeGiphyApi(total=30)
+    giphy = Giphy("key", http=api, page_size=10, refill_below=5)
+
+    for _ in range(6):
+        giphy.search("owls")
+    giphy.refresher.shutdown(wait=True)
+
+    assert api.calls == [("owls", 0), ("owls", 10)]
+    assert len(giphy.pools["owls"].urls) == 20
+
+
+def test_least_recently_used_pools_are_evicted():
+    api = FakeGiphyApi(total=10)
+    giphy = Giphy("key", http=api, page_size=10, refill_below=0, max_urls=20)
+
+    for query in ("a", "b", "a", "c"):
+        giphy.search(query)
+
+    assert list(giphy.pools) == ["a", "c"]
+    assert giphy.stats()["evictions"] == 1
@@ -0,0 +1,92 @@
+import asyncio
+
+from src.voice.guild_listeners import GuildListeners
+from src.voice.listen import Listen
+from src.voice.wake_words import WakeMatcher
+
+
+class FakeBackend():
+    def __init__(self):
+        self.loads = 0
+
+    def load(self):
+        self.loads += 1
+
+    def warm_up(self):
+        pass
+
+
+class FakeVoiceClient():
+    def __init__(self, connected=True):
+        self.connected = connected
+
+    def is_connected(self):
+        return self.connected
+
+
+class FakePlayer():
+    def __init__(self, vc=None):
+        self.vc = vc
+
+
+class FakeBot():
+    def __init__(self, players):
+        self.players = players
+        self.ready_event = asyncio.Event()
+        self.ready_event.set()
+
+
+class FakeReceiver():
+    def __init__(self, guild_id):
+        self.guild_id = guild_id
+        self.running = False
+
+    async def run(self, on_new_speaker):
+        self.running = True
+        await asyncio.Event().wait()
+
+
+def create_listener(backend):
+    return Listen(None, None, None, None, None, backend, None,
+                  wake_matcher=WakeMatcher(["hey billy"]))
+
+
+def test_each_connected_guild_gets_its_own_listener():
+    async def scenario():
+        backend = FakeBackend()
+        bot = FakeBot({
+            1: FakePlayer(FakeVoiceClient()),
+            2: FakePlayer(),
+        })
+        guild_listeners = GuildListeners(
+            bot, create_listener(backend), FakeReceiver,
+            wake_matcher_for=lambda guild_id: WakeMatcher([f"hey dj {guild_id}"]),
+            poll_interval=0.01)
+        task = asyncio.create_task(guild_listeners.start(asyncio.Queue()))
+        await asyncio.sleep(0.05)
+        first = sorted(guild_listeners.listeners)
+
+        # Billy joins a voice channel in the second guild
+        bot.players[2].vc = FakeVoiceClient()
+        await asyncio.sleep(0.05)
+
+        task.cancel()
+        guild_listeners.stop()
+        return backend, guild_listeners, first
+
+    backend, guild_listeners, first = asyncio.run(scenario())
+    assert first == [1]
+
+    listeners = guild_listeners.listeners
+    assert sorted(listeners) == [1, 2]
+    for guild_id, listener in listeners.items():
+        assert listener.guild_id == guild_id
+        assert listener.receiver.guild_id == guild_id
+        assert listener.receiver.running
+        assert listener.wake_matcher.find(f"hey dj {guild_id} play jazz") is not None
+        assert listener.wake_matcher.find("hey billy play jazz") is None
+
+    assert listeners[1].data_queue is not listeners[2].data_queue
+    # one model for every guild
+    assert listeners[1].asr_lock is listeners[2].asr_lock
+    assert backend.loads == 1
@@ -0,0 +1,120 @@
+import httpx
+import pytest
+
+from src.utils.http import HttpTransport
+
+URL = "https://api.example.com/v1/thing"
+
+
+class Server():
+    """
+    Answers requests with the next entry of `replies`: a status code, a
+    (status code, headers) pair, or an exception class to raise.
+    """
+
+    def __init__(self, *replies):
+        self.replies = list(replies)
+        self.requests = []
+
+    def __call__(self, request):
+        self.requests.append(request)
+        reply = self.replies.pop(0)
+        if isinstance(reply, type) and issubclass(reply, Exception):
+            raise reply("mock failure", request=request)
+
+        status, headers = reply if isinstance(reply, tuple) else (reply, {})
+        return httpx.Response(status, headers=headers, json={"status": status})
+
+
+def transport_for(server, retries=2):
+    return HttpTransport(retries=retries, backoff=0, http2=False,
+                         transport=httpx.MockTransport(server))
+
+
+def test_get_is_retried_on_overload_statuses():
+    server = Server(503, 502, 200)
+    http = transport_for(server)
+
+    assert http.get(URL).status_code == 200
+    assert len(server.requests) == 3
+    assert http.stats() == {"requests": 3, "retried": 2, "failures": 0}
+
+
+def test_last_response_is_returned_when_retries_run_out():
+    server = Server(503, 503, 503)
+    http = transport_for(server)
+
+    assert http.get(URL).status_code == 503
+    assert len(server.requests) == 3
+
+
+def test_retries_can_be_disabled_per_request():
+    server = Server(503)
+    assert transport_for(server).get(URL, retries=0).status_code == 503
+    assert len(server.requests) == 1
+
+
+def test_client_errors_are_not_retried():
+    server = Server(404)
+    assert transport_for(server).get(URL).status_code == 404
+    assert len(server.requests) == 1
+
+
+@pytest.mark.parametrize("status", [500, 502, 503, 504])
+def test_post_is_not_retried_on_gateway_errors(status):
+    # the server may have processed it before the gateway gave up
+    server = Server(status, 200)
+    assert transport_for(server).post(URL, json={}).status_code == status
+    assert len(server.requests) == 1
+
+
+def test_post_is_retried_on_429():
+    server = Server(429, 200)
+    assert transport_for(server).post(URL, json={}).status_code == 200
+    assert len(server.requests) == 2
+
+
+def test_post_is_retried_when_the_server_sends_retry_after():
+    server = Server((503, {"Retry-After": "0"}), 200)
+    assert transport_for(server).post(URL, json={}).status_code == 200
+    assert len(server.requests) == 2
+
+
+def test_retry_after_sets_the_delay(monkeypatch):
+    slept = []
+    monkeypatch.setattr("src.utils.http.time.sleep", slept.append)
+
+    server = Server((429, {"Retry-After": "1.5"}), (429, {"Retry-After": "120"}), 200)
+    assert transport_for(server).get(URL).status_code == 200
+    # long waits are capped, a command shouldn't hang on one client
+    assert slept == [1.5, 2.0]
+
+
+def test_unsent_requests_are_retried_for_any_method():
+    server = Server(httpx.ConnectError, 200)
+    assert transport_for(server).post(URL, json={}).status_code == 200
+    assert len(server.requests) == 2
+
+
+def test_post_is_not_retried_after_it_may_have_been_sent():
+    server = Server(httpx.ReadTimeout, 200)
+    http = transport_for(server)
+
+    with pytest.raises(httpx.ReadTimeout):
+        http.post(URL, json={})
+    assert len(server.requests) == 1
+    assert http.stats()["failures"] == 1
+
+
+def test_get_is_retried_after_a_read_timeout():
+    server = Server(httpx.ReadTimeout, httpx.ReadTimeout, 200)
+    assert transport_for(server).get(URL).status_code == 200
+
+
+def test_transport_errors_are_raised_when_retries_run_out():
+    server = Server(httpx.ConnectError, httpx.ConnectError)
+    http = transport_for(server, retries=1)
+
+    with pytest.raises(httpx.ConnectError):
+        http.get(URL)
+    assert http.stats() == {"requests": 2, "retried": 1, "failures": 1}
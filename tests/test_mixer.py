@@ -0,0 +1,215 @@
+import discord
+import numpy as np
+import pytest
+
+from src.bot.mixer import FRAME_SAMPLES, MixerSource
+
+
+class ConstantSource(discord.AudioSource):
+    """
+    `frames` full frames where every sample is `value`, then a `tail` of
+    shorter frame.
+    """
+
+    def __init__(self, value, frames=1000, tail=0):
+        self.value = value
+        self.frames = frames
+        self.tail = tail
+        self.reads = 0
+        self.cleaned_up = False
+
+    def read(self) -> bytes:
+        self.reads += 1
+        if self.reads <= self.frames:
+            return np.full(FRAME_SAMPLES, self.value, dtype=np.int16).tobytes()
+        elif self.reads == self.frames + 1 and self.tail:
+            return np.full(self.tail, self.value, dtype=np.int16).tobytes()
+
+        return b""
+
+    def cleanup(self):
+        self.cleaned_up = True
+
+
+def read_samples(mixer) -> np.ndarray:
+    return np.frombuffer(bytes(mixer.read()), dtype=np.int16)
+
+
+class Recorder():
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, error=None):
+        self.calls.append(error)
+
+
+def test_layers_are_summed_with_their_volume():
+    mixer = MixerSource()
+    mixer.play_music(ConstantSource(1000))
+    mixer.play_effect(discord.PCMVolumeTransformer(
+        ConstantSource(1000), volume=0.5))
+
+    samples = read_samples(mixer)
+    assert np.all(samples == 1500)
+
+
+def test_mix_is_clipped_instead_of_wrapping():
+    mixer = MixerSource()
+    mixer.play_effect(ConstantSource(30000))
+    mixer.play_effect(ConstantSource(30000))
+
+    assert np.all(read_samples(mixer) == 32767)
+
+
+def test_music_volume_scales_music_only():
+    mixer = MixerSource()
+    mixer.music_volume = 0.5
+    mixer.play_music(ConstantSource(1000))
+    mixer.play_effect(ConstantSource(1000))
+
+    assert np.all(read_samples(mixer) == 1500)
+
+
+def test_speech_ducks_music_with_a_ramp_and_releases_it():
+    mixer = MixerSource(duck_volume=0.25, duck_attack=0.1, duck_release=0.2)
+    mixer.play_music(ConstantSource(10000))
+    read_samples(mixer)
+    assert mixer.music_gain == 1.0
+
+    mixer.play_speech(ConstantSource(0, frames=10))
+    samples = read_samples(mixer)
+    # the gain slides across the frame instead of jumping
+    assert samples[0] == 10000
+    assert samples[-1] == pytest.approx(10000 * mixer.music_gain, abs=1)
+    assert np.all(np.diff(samples.astype(np.int32)) <= 0)
+
+    for _ in range(9):
+        read_samples(mixer)
+    assert mixer.music_gain == pytest.approx(0.25)
+    assert np.all(read_samples(mixer) == 2500)
+
+    # the speech has finished, the music comes back up over duck_release
+    for _ in range(10):
+        read_samples(mixer)
+    assert mixer.speech is None
+    assert mixer.music_gain == pytest.approx(1.0)
+    assert np.all(read_samples(mixer) == 10000)
+
+
+def test_keep_ducked_holds_the_duck_between_sentences():
+    mixer = MixerSource(duck_volume=0.25, duck_attack=0.02)
+    mixer.play_music(ConstantSource(10000))
+    mixer.keep_ducked = True
+    mixer.play_speech(ConstantSource(0, frames=1))
+
+    for _ in range(5):
+        read_samples(mixer)
+    assert mixer.speech is None
+    assert mixer.music_gain == pytest.approx(0.25)
+
+
+def test_stop_resets_keep_ducked():
+    mixer = MixerSource(duck_volume=0.25)
+    mixer.play_music(ConstantSource(10000))
+    mixer.keep_ducked = True
+    mixer.play_speech(ConstantSource(0))
+    for _ in range(10):
+        read_samples(mixer)
+
+    # "stop" in the middle of a multi-sentence reply
+    mixer.stop()
+    assert not mixer.keep_ducked
+
+    mixer.play_music(ConstantSource(10000))
+    for _ in range(100):
+        read_samples(mixer)
+    assert mixer.music_gain == pytest.approx(1.0)
+
+
+def test_effect_is_cut_at_max_duration():
+    mixer = MixerSource()
+    source = ConstantSource(1000)
+    after = Recorder()
+    mixer.play_effect(source, after=after, max_duration=0.1)
+
+    for _ in range(5):
+        assert np.all(read_samples(mixer) == 1000)
+    assert after.calls == []
+
+    assert np.all(read_samples(mixer) == 0)
+    assert mixer.effects == []
+    assert after.calls == [None]
+    assert source.cleaned_up
+    assert source.reads == 5
+
+
+def test_short_frame_finishes_the_layer():
+    mixer = MixerSource()
+    after = Recorder()
+    mixer.play_speech(ConstantSource(1000, frames=1, tail=100), after=after)
+
+    read_samples(mixer)
+    samples = read_samples(mixer)
+    assert np.all(samples[:100] == 1000)
+    assert np.all(samples[100:] == 0)
+    assert mixer.speech is None
+    assert after.calls == [None]
+
+
+def test_idle_and_active_transitions():
+    idle = Recorder()
+    active = Recorder()
+    mixer = MixerSource(on_idle=idle, on_active=active)
+    assert mixer.idle
+
+    mixer.play_speech(ConstantSource(1000, frames=2))
+    mixer.play_effect(ConstantSource(1000, frames=1))
+    assert len(active.calls) == 1
+    assert not mixer.idle
+
+    read_samples(mixer)
+    read_samples(mixer)
+    assert idle.calls == []
+
+    read_samples(mixer)
+    assert mixer.idle
+    assert len(idle.calls) == 1
+
+    # pausing the only layer leaves nothing to play, resuming wakes it up
+    mixer.play_music(ConstantSource(1000))
+    mixer.pause_music()
+    read_samples(mixer)
+    assert len(idle.calls) == 2
+    mixer.resume_music()
+    assert len(active.calls) == 3
+
+
+def test_stop_drops_every_layer_and_runs_after():
+    idle = Recorder()
+    mixer = MixerSource(on_idle=idle)
+    music_after, speech_after, effect_after = Recorder(), Recorder(), Recorder()
+    music = ConstantSource(1000)
+    mixer.play_music(music, after=music_after)
+    mixer.play_speech(ConstantSource(1000), after=speech_after)
+    mixer.play_effect(ConstantSource(1000), after=effect_after)
+    mixer.pause_music()
+
+    mixer.stop()
+    assert mixer.music is None and mixer.speech is None and mixer.effects == []
+    assert not mixer.music_paused
+    assert music_after.calls == speech_after.calls == effect_after.calls == [None]
+    assert music.cleaned_up
+    assert mixer.idle and len(idle.calls) == 1
+    assert np.all(read_samples(mixer) == 0)
+
+
+def test_replacing_music_finishes_the_old_song():
+    mixer = MixerSource()
+    old_after = Recorder()
+    old = ConstantSource(1000)
+    mixer.play_music(old, after=old_after)
+    mixer.play_music(ConstantSource(2000))
+
+    assert old_after.calls == [None]
+    assert old.cleaned_up
+    assert np.all(read_samples(mixer) == 2000)
@@ -0,0 +1,182 @@
+import asyncio
+
+from src.bot.scheduler import ActionScheduler
+
+
+class FakePrepared():
+    def __init__(self, item):
+        self.item = item
+        self.cleaned_up = False
+
+    def cleanup(self):
+        self.cleaned_up = True
+
+
+class FakePlayer():
+    """
+    Records what the scheduler asks for. Preparing an item takes
+    `item["prepare"]` seconds, playing one waits for `release_playback`.
+    """
+
+    def __init__(self, block_playback=False):
+        self.controls = []
+        self.posts = []
+        self.played = []
+        self.started = []
+        self.prepared = []
+        self.preparing = 0
+        self.max_preparing = 0
+        # prepared but not yet playing
+        self.max_waiting = 0
+        self.playback_started = asyncio.Event()
+        self.release_playback = asyncio.Event()
+        if not block_playback:
+            self.release_playback.set()
+
+    def handle_control(self, item):
+        self.controls.append(item)
+
+    async def handle_post(self, item):
+        self.posts.append(item)
+
+    async def prepare_audible(self, item):
+        self.preparing += 1
+        self.max_preparing = max(self.max_preparing, self.preparing)
+        try:
+            await asyncio.sleep(item.get("prepare", 0))
+        finally:
+            self.preparing -= 1
+
+        prepared = FakePrepared(item)
+        self.prepared.append(prepared)
+        self.max_waiting = max(self.max_waiting, len(self.prepared) - len(self.started))
+        return prepared
+
+    async def play_audible(self, item, prepared, more_speech_queued):
+        self.started.append(item["name"])
+        self.playback_started.set()
+        await self.release_playback.wait()
+        self.played.append(item["name"])
+
+
+def song(name, prepare=0.0):
+    return {"type": "youtube", "video_id": name, "name": name, "prepare": prepare}
+
+
+async def run_scheduler(player, items, settle=0.3, max_prepare=3):
+    queue = asyncio.Queue()
+    scheduler = ActionScheduler(queue, player, max_prepare=max_prepare)
+    task = asyncio.create_task(scheduler.run())
+    for item in items:
+        queue.put_nowait(item)
+    await asyncio.sleep(settle)
+    return scheduler, queue, task
+
+
+def test_playback_keeps_queue_order_while_preparing_concurrently():
+    async def scenario():
+        player = FakePlayer()
+        # the first item takes longest to prepare
+        items = [song("a", 0.2), song("b", 0.1), song("c", 0.0)]
+        _, _, task = await run_scheduler(player, items, settle=0.5)
+        task.cancel()
+        return player
+
+    player = asyncio.run(scenario())
+    assert player.played == ["a", "b", "c"]
+    assert player.max_preparing == 3
+
+
+def test_max_prepare_bounds_concurrent_preparation():
+    async def scenario():
+        player = FakePlayer()
+        items = [song(name, 0.05) for name in "abcde"]
+        _, _, task = await run_scheduler(player, items, settle=0.5, max_prepare=2)
+        task.cancel()
+        return player
+
+    player = asyncio.run(scenario())
+    assert player.played == list("abcde")
+    assert player.max_preparing == 2
+
+
+def test_max_prepare_bounds_prepared_items_waiting_to_play():
+    async def scenario():
+        player = FakePlayer(block_playback=True)
+        items = [song(name) for name in "abcdef"]
+        _, _, task = await run_scheduler(player, items, settle=0.1, max_prepare=2)
+
+        # "a" is playing, "b" and "c" are prepared, the rest wait for a slot
+        assert player.started == ["a"]
+        assert [p.item["name"] for p in player.prepared] == ["a", "b", "c"]
+
+        player.release_playback.set()
+        await asyncio.sleep(0.1)
+        task.cancel()
+        return player
+
+    player = asyncio.run(scenario())
+    assert player.played == list("abcdef")
+    assert player.max_waiting <= 2
+
+
+def test_control_items_jump_ahead_of_queued_audio():
+    async def scenario():
+        player = FakePlayer(block_playback=True)
+        items = [song("a"), song("b"), {"type": "volume", "value": "up"}]
+        _, _, task = await run_scheduler(player, items, settle=0.1)
+
+        # "a" is still playing and "b" waits behind it, the volume change
+        # doesn't wait for either
+        assert player.playback_started.is_set()
+        assert player.controls == [{"type": "volume", "value": "up"}]
+        assert player.played == []
+
+        player.release_playback.set()
+        await asyncio.sleep(0.1)
+        task.cancel()
+        return player
+
+    player = asyncio.run(scenario())
+    assert player.played == ["a", "b"]
+
+
+def test_stop_flushes_queued_audible_items():
+    async def scenario():
+        player = FakePlayer(block_playback=True)
+        items = [song("a"), song("b"), song("c", 0.2)]
+        _, queue, task = await run_scheduler(player, items, settle=0.1)
+
+        # "a" is playing, "b" is prepared and "c" is still being prepared
+        queue.put_nowait({"type": "youtube", "stop": 1})
+        await asyncio.sleep(0.05)
+        player.release_playback.set()
+        await asyncio.sleep(0.3)
+
+        # audio queued after the stop plays as usual
+        queue.put_nowait(song("d"))
+        await asyncio.sleep(0.1)
+        task.cancel()
+        return player
+
+    player = asyncio.run(scenario())
+    assert player.controls == [{"type": "youtube", "stop": 1}]
+    # "a" had already started, stopping it is up to handle_control
+    assert player.played == ["a", "d"]
+
+    prepared = {p.item["name"]: p for p in player.prepared}
+    assert "c" not in prepared
+    assert prepared["b"].cleaned_up
+    assert not prepared["a"].cleaned_up
+
+
+def test_posts_run_independently_of_audio():
+    async def scenario():
+        player = FakePlayer(block_playback=True)
+        items = [song("a"), {"type": "discord_post", "text": "hi"}]
+        _, _, task = await run_scheduler(player, items, settle=0.1)
+        posts = list(player.posts)
+        task.cancel()
+        return posts
+
+    assert asyncio.run(scenario()) == [{"type": "discord_post", "text": "hi"}]
@@ -0,0 +1,178 @@
+import asyncio
+import json
+import random
+
+import pytest
+
+from src.bot.guild_player import GuildPlayer
+from src.bot.sfx_library import SoundEffectLibrary, stem, tags_for
+
+CLIPS = {
+    "horse": ["horse", "neigh"],
+    "cricket": ["cricket", "night"],
+    "dog-bark": ["dog", "bark"],
+    "dog-growl": ["dog", "growl"],
+    "airhorn": ["air", "horn"],
+    "applause": ["applause", "crowd", "clap"],
+}
+
+
+def make_library(directory, clips=CLIPS, **options):
+    index = {
+        clip_id: {"tags": sorted(stem(tag) for tag in tags), "title": clip_id,
+                  "source": None, "seconds": 1.0}
+        for clip_id, tags in clips.items()
+    }
+    with open(directory / "index.json", "w") as f:
+        json.dump(index, f)
+
+    return SoundEffectLibrary(str(directory), **options)
+
+
+def test_tags_drop_filler_and_stem():
+    assert tags_for("Play the horses sound effect, please") == {"hors"}
+    assert tags_for("crickets chirping") == {"cricket", "chirp"}
+    assert stem("horse") == stem("horses") == "hors"
+    # short words aren't stemmed down to nothing
+    assert stem("bus") == "bus"
+
+
+@pytest.mark.parametrize("query, clip_id", [
+    ("horse", "horse"),
+    ("horses neighing", "horse"),
+    ("crickets chirping", "cricket"),
+    ("dog growling", "dog-growl"),
+    ("air horn sound effect", "airhorn"),
+    ("crowd applause", "applause"),
+])
+def test_find_matches(tmp_path, query, clip_id):
+    assert make_library(tmp_path).find(query) == clip_id
+
+
+@pytest.mark.parametrize("query", [
+    "explosion",
+    "sound effect",
+    "",
+    None,
+    # one rare word out of three isn't enough
+    "car engine horn",
+])
+def test_find_misses(tmp_path, query):
+    assert make_library(tmp_path).find(query) is None
+
+
+def test_common_words_count_for_less(tmp_path):
+    library = make_library(tmp_path)
+    # "dog" is on two clips, "growl" on one
+    assert library._weight("dog") < library._weight("growl")
+    # words no clip has weigh like words one clip has
+    assert library._weight("chirp") == library._weight("growl")
+
+
+def test_ties_pick_randomly_between_equal_matches(tmp_path):
+    library = make_library(tmp_path)
+    random.seed(1)
+    found = {library.find("dog") for _ in range(50)}
+    assert found == {"dog-bark", "dog-growl"}
+
+
+def test_threshold(tmp_path):
+    # "dog growling" covers about 63% of the weighted query
+    assert make_library(tmp_path).find("dog growling night") == "dog-growl"
+
+    strict = make_library(tmp_path, match_threshold=0.9)
+    assert strict.find("dog growling night") is None
+    assert strict.find("dog growling") == "dog-growl"
+
+
+def test_single_clip_library(tmp_path):
+    library = make_library(tmp_path, clips={"horse": ["horse"]})
+    assert library.find("horse") == "horse"
+    assert library.find("horse galloping") == "horse"
+    assert library.find("galloping zebra stampede") is None
+
+
+def test_stats_count_hits_and_misses(tmp_path):
+    library = make_library(tmp_path)
+    library.find("horse")
+    library.find("explosion")
+    assert library.stats()["hits"] == 1
+    assert library.stats()["misses"] == 1
+
+
+def test_unreadable_clips_are_removed(tmp_path):
+    library = make_library(tmp_path)
+    (tmp_path / "horse.opus-frames").write_bytes(b"not a clip")
+
+    assert library.load("horse") is None
+    assert library.load("cricket") is None
+    assert "horse" not in library.clips and "cricket" not in library.clips
+    assert library.find("horse") is None
+
+    reloaded = SoundEffectLibrary(str(tmp_path))
+    assert "horse" not in reloaded.clips
+
+
+def test_learn_stores_several_search_results(tmp_path, monkeypatch):
+    library = make_library(tmp_path, clips_per_query=3)
+    resolved = []
+
+    def add_from_url(url, tags, title=None, source=None, headers=None):
+        clip_id = f"learned-{source}"
+        with library.lock:
+            library.clips[clip_id] = {"tags": sorted(tags_for(tags)), "title": title,
+                                      "source": source, "seconds": 1.0}
+            library._reindex()
+        return clip_id
+
+    def extract_info(url, stream=False, cache=None):
+        resolved.append(url)
+        return {"url": url + "&stream", "title": url}
+
+    library.add_from_url = add_from_url
+    monkeypatch.setattr("src.bot.audio_source.YTDLSource.extract_info", extract_info)
+
+    library.learn("stream", "explosion", source="v1", candidates=["v2", "v3", "v4"])
+    library.learner.shutdown(wait=True)
+
+    assert {library.clips[clip_id]["source"] for clip_id in library.clips
+            if clip_id.startswith("learned-")} == {"v1", "v2", "v3"}
+    # the last candidate isn't resolved once there are enough clips
+    assert len(resolved) == 2
+
+    random.seed(1)
+    assert len({library.find("explosion") for _ in range(50)}) == 3
+
+
+class FakeSource():
+    def __init__(self, url):
+        self.url = url
+        self.title = url
+        self.data = {"id": "abc123"}
+
+
+class FakeBot():
+    def __init__(self, library):
+        self.sfx_library = library
+        self.loop = None
+
+
+def test_unloadable_library_hit_falls_back_to_youtube(tmp_path):
+    library = make_library(tmp_path, learn_misses=False)
+    requested = []
+
+    async def scenario():
+        player = GuildPlayer(FakeBot(library), guild_id=1)
+        player.vc = object()
+
+        async def create_yt_audio_source(url):
+            requested.append(url)
+            return FakeSource(url)
+        player.create_yt_audio_source = create_yt_audio_source
+
+        return await player.prepare_audible(
+            {"type": "sound_effect", "clip_id": "horse", "query": "horse neigh"})
+
+    source = asyncio.run(scenario())
+    assert requested == ["ytsearch1:horse neigh"]
+    assert source.url == "ytsearch1:horse neigh"
@@ -0,0 +1,114 @@
+import pytest
+
+from src.voice.wake_words import (WakeMatcher, edit_distance,
+                                  normalize_utterance, parse_guild_wake_words,
+                                  phonetic_key)
+
+matcher = WakeMatcher()
+
+
+@pytest.mark.parametrize("line", [
+    "Hey Billy, play some jazz.",
+    "Hey, Billie!",
+    "a billy, what's the weather",
+    "ok bily turn it up",
+    "Okay Billy stop.",
+    "Yo billy, skip this one",
+    "I said. Hey Billy, stop.",
+])
+def test_wakes(line):
+    assert matcher.find(line) is not None
+
+
+@pytest.mark.parametrize("line", [
+    "play a billy joel song",
+    "hey. Billy play something",
+    "Hey! Billy, stop.",
+    "billy",
+    "hey",
+    "you billy",
+    "",
+])
+def test_does_not_wake(line):
+    assert matcher.find(line) is None
+
+
+def test_match_offsets_point_into_the_original_line():
+    line = "...so, Hey, Billie! Play lo-fi."
+    match = matcher.find(line)
+    assert line[match.start:match.end] == "Hey, Billie"
+    assert line[match.end:].strip(" ,!") == "Play lo-fi."
+
+
+def test_strip_only_drops_a_leading_wake_phrase():
+    assert matcher.strip("Hey Billy, play jazz").strip(" ,") == "play jazz"
+    assert matcher.strip("play jazz hey billy") == "play jazz hey billy"
+
+
+def test_custom_phrases_and_tolerance():
+    custom = WakeMatcher(["computer"], tolerance=1)
+    assert custom.find("compter play jazz") is not None
+    assert custom.find("commute play jazz") is None
+    assert WakeMatcher(["computer"], tolerance=0).find("compter") is None
+
+
+def test_stream_matches_growing_hypotheses():
+    stream = matcher.stream()
+    assert stream.feed("Hey") is None
+    match = stream.feed("Hey Billy")
+    assert match.phrase == "hey billy"
+
+    match = stream.feed("Hey Billy, play")
+    assert (match.start, match.end) == (0, 9)
+
+
+def test_stream_follows_revised_hypotheses():
+    stream = matcher.stream()
+    assert stream.feed("Hey Billy") is not None
+    # the decoder changed its mind about the first words
+    assert stream.feed("They built a") is None
+    assert stream.feed("They built a. Hey Billy") is not None
+
+
+def test_stream_rechecks_words_whose_sentence_start_changed():
+    stream = matcher.stream()
+    # "a" is an alias for "hey" only at the start of a sentence
+    assert stream.feed("play. A billy") is not None
+    assert stream.feed("play a billy") is None
+
+    stream = matcher.stream()
+    assert stream.feed("Hey Billy") is not None
+    assert stream.feed("Hey. Billy") is None
+
+
+def test_stream_agrees_with_find():
+    hypotheses = ["ok", "ok so", "ok so a", "ok so. A billy", "ok so. A billy play jazz"]
+    stream = matcher.stream()
+    for text in hypotheses:
+        streamed = stream.feed(text)
+        found = matcher.find(text)
+        assert (streamed is None) == (found is None)
+        if found is not None:
+            assert (streamed.start, streamed.end) == (found.start, found.end)
+
+
+def test_normalize_utterance_strips_the_guilds_wake_phrase():
+    dj = WakeMatcher(["hey dj"])
+    assert normalize_utterance("Hey DJ, play lo-fi.", dj) == "play lofi"
+    assert normalize_utterance("Hey Billy, play lo-fi.") == "play lofi"
+    # another guild's phrase is just words
+    assert normalize_utterance("Hey Billy, play lo-fi.", dj) == "hey billy play lofi"
+
+
+def test_phonetic_key_and_edit_distance():
+    assert phonetic_key("billie") == phonetic_key("billy") == phonetic_key("bily")
+    assert edit_distance("billy", "bilyy", 2) == 1
+    assert edit_distance("billy", "jazz", 1) == 2
+
+
+def test_parse_guild_wake_words():
+    assert parse_guild_wake_words("1=hey bot|yo bot; 2=computer") == {
+        1: ["hey bot", "yo bot"],
+        2: ["computer"],
+    }
+    assert parse_guild_wake_words(None) == {}
@@ -0,0 +1,122 @@
+import threading
+import time
+
+import pytest
+
+from src.actions.wolfram.cache import WolframCache, classify_query, parse_ttls
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("what time is it in tokyo", "time"),
+    ("what's the date today", "time"),
+    ("how many days until christmas", "time"),
+    ("how many days till my birthday", "time"),
+    ("how old is barack obama", "time"),
+    ("how long ago was the moon landing", "time"),
+    ("when is easter", "time"),
+    ("days since january 1 2020", "time"),
+    ("what holidays are next week", "time"),
+    ("price of gold", "prices"),
+    ("100 usd to eur", "prices"),
+    ("bitcoin", "prices"),
+    ("who won the super bowl", "sports"),
+    ("nba standings", "sports"),
+    ("weather in paris", "weather"),
+    ("will it rain in london", "weather"),
+    ("10 miles in km", "conversion"),
+    ("convert 5 pounds to kg", "conversion"),
+    ("a cup in tablespoons", "conversion"),
+    ("what is 12 * 7", "math"),
+    ("square root of 144", "math"),
+    ("derivative of x^2", "math"),
+    ("capital of france", "general"),
+    ("how tall is the eiffel tower", "general"),
+    ("who wrote hamlet", "general"),
+])
+def test_classify_query(query, expected):
+    assert classify_query(query) == expected
+
+
+def test_classify_query_ignores_case():
+    assert classify_query("How Many Days Until Christmas?") == "time"
+
+
+def test_parse_ttls():
+    assert parse_ttls("prices=300, weather=600,bogus") == {
+        "prices": 300.0, "weather": 600.0}
+    assert parse_ttls(None) == {}
+
+
+def test_answers_are_cached_by_class(tmp_path):
+    cache = WolframCache(str(tmp_path), ttls={"time": 0})
+    calls = []
+
+    def fetch(query):
+        calls.append(query)
+        return f"answer to {query}"
+
+    assert cache.get_or_fetch("Capital of France?", fetch) == "answer to Capital of France?"
+    assert cache.get_or_fetch("capital of france", fetch) == "answer to Capital of France?"
+    # a ttl of 0 turns caching off for the class
+    cache.get_or_fetch("what time is it", fetch)
+    cache.get_or_fetch("what time is it", fetch)
+
+    assert calls == ["Capital of France?", "what time is it", "what time is it"]
+
+
+def test_missing_answers_are_not_cached(tmp_path):
+    cache = WolframCache(str(tmp_path))
+    calls = []
+
+    def fetch(query):
+        calls.append(query)
+        return None
+
+    assert cache.get_or_fetch("gibberish", fetch) is None
+    assert cache.get_or_fetch("gibberish", fetch) is None
+    assert len(calls) == 2
+
+
+def test_identical_queries_share_one_fetch(tmp_path):
+    cache = WolframCache(str(tmp_path))
+    release = threading.Event()
+    calls = []
+
+    def fetch(query):
+        calls.append(query)
+        release.wait(5)
+        return "42"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(
+        cache.get_or_fetch("meaning of life", fetch))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert results == ["42"] * 4
+    assert len(calls) == 1
+    assert cache.stats()["coalesced"] == 3
+
+
+def test_waiters_give_up_after_wait_timeout(tmp_path):
+    cache = WolframCache(str(tmp_path), wait_timeout=0.1)
+    release = threading.Event()
+
+    def slow_fetch(query):
+        release.wait(5)
+        return "late"
+
+    owner = threading.Thread(target=cache.get_or_fetch, args=("slow", slow_fetch))
+    owner.start()
+    time.sleep(0.05)
+
+    started_at = time.monotonic()
+    assert cache.get_or_fetch("slow", slow_fetch) is None
+    assert time.monotonic() - started_at < 1
+
+    release.set()
+    owner.join(5)